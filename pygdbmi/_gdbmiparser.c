@@ -0,0 +1,405 @@
+/*
+ * Optional C implementation of parsing the payloads of gdb mi records.
+ *
+ * This is the equivalent of _parse_dict(text, start, projection=projection)[1] in gdbmiparser.py,
+ * and must return exactly the same values for all input, including malformed input.
+ * gdbmiparser.py uses it when it can be imported, and falls back to the pure Python
+ * parser when it can't.
+ *
+ * Requires Python 3.3+ (PEP 393 strings).
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+typedef enum {
+    TOKEN_ERROR,        /* an exception was raised */
+    TOKEN_END,          /* no more tokens */
+    TOKEN_KEY,
+    TOKEN_STRING,
+    TOKEN_DICT_START,
+    TOKEN_DICT_END,
+    TOKEN_ARRAY_START,
+    TOKEN_ARRAY_END,
+    TOKEN_OTHER         /* ',' and '=' */
+} TokenType;
+
+typedef struct {
+    PyObject *text;
+    int kind;
+    const void *data;
+    Py_ssize_t length;
+    Py_ssize_t pos;
+    int done;           /* set after a string that is missing its closing quote */
+} Tokenizer;
+
+static int
+is_punctuation(Py_UCS4 c)
+{
+    return c == '{' || c == '}' || c == '[' || c == ']' || c == ',' || c == '=';
+}
+
+/* Remove gdb's escaping from the contents of a c-string, text[start:end].
+ * Like _parse_str, only \" is unescaped. */
+static PyObject *
+parse_str(Tokenizer *t, Py_ssize_t start, Py_ssize_t end)
+{
+    Py_ssize_t i, n = 0;
+    Py_UCS4 *buffer;
+    PyObject *result;
+    int has_backslash = 0;
+
+    for (i = start; i < end; i++) {
+        if (PyUnicode_READ(t->kind, t->data, i) == '\\') {
+            has_backslash = 1;
+            break;
+        }
+    }
+    if (!has_backslash) {
+        return PyUnicode_Substring(t->text, start, end);
+    }
+
+    buffer = PyMem_New(Py_UCS4, end - start);
+    if (buffer == NULL) {
+        return PyErr_NoMemory();
+    }
+    for (i = start; i < end; i++) {
+        Py_UCS4 c = PyUnicode_READ(t->kind, t->data, i);
+        if (c == '\\' && i + 1 < end && PyUnicode_READ(t->kind, t->data, i + 1) == '"') {
+            c = '"';
+            i++;
+        }
+        buffer[n++] = c;
+    }
+    result = PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, buffer, n);
+    PyMem_Free(buffer);
+    return result;
+}
+
+/* Read the next token. Keys and strings are returned as new references in *value. */
+static TokenType
+next_token(Tokenizer *t, PyObject **value)
+{
+    Py_ssize_t i = t->pos, j;
+    Py_UCS4 c;
+
+    *value = NULL;
+    if (t->done) {
+        return TOKEN_END;
+    }
+    while (i < t->length && Py_UNICODE_ISSPACE(PyUnicode_READ(t->kind, t->data, i))) {
+        i++;
+    }
+    if (i >= t->length) {
+        t->pos = t->length;
+        return TOKEN_END;
+    }
+
+    c = PyUnicode_READ(t->kind, t->data, i);
+    if (c == '"') {
+        for (j = i + 1; j < t->length; j++) {
+            Py_UCS4 d = PyUnicode_READ(t->kind, t->data, j);
+            if (d == '"') {
+                break;
+            }
+            else if (d == '\\') {
+                if (j + 1 >= t->length) {
+                    /* a trailing backslash can't escape anything */
+                    j = t->length;
+                    break;
+                }
+                j++;
+            }
+        }
+        if (j >= t->length) {
+            /* String is missing its closing quote. Use everything up to the end. */
+            *value = parse_str(t, i + 1, t->length);
+            t->pos = t->length;
+            t->done = 1;
+        }
+        else {
+            *value = parse_str(t, i + 1, j);
+            t->pos = j + 1;
+        }
+        return *value == NULL ? TOKEN_ERROR : TOKEN_STRING;
+    }
+
+    t->pos = i + 1;
+    switch (c) {
+    case '{':
+        return TOKEN_DICT_START;
+    case '}':
+        return TOKEN_DICT_END;
+    case '[':
+        return TOKEN_ARRAY_START;
+    case ']':
+        return TOKEN_ARRAY_END;
+    case ',':
+    case '=':
+        return TOKEN_OTHER;
+    }
+
+    for (j = i + 1; j < t->length; j++) {
+        Py_UCS4 d = PyUnicode_READ(t->kind, t->data, j);
+        if (Py_UNICODE_ISSPACE(d) || is_punctuation(d) || d == '"') {
+            break;
+        }
+    }
+    t->pos = j;
+    *value = PyUnicode_Substring(t->text, i, j);
+    if (*value == NULL) {
+        return TOKEN_ERROR;
+    }
+    PyUnicode_InternInPlace(value);
+    return TOKEN_KEY;
+}
+
+/* See _skip_value. Returns the index of the ',', '}' or ']' that ends the value at index i,
+ * or the length of the text. */
+static Py_ssize_t
+skip_value(Tokenizer *t, Py_ssize_t i)
+{
+    Py_ssize_t depth = 0;
+
+    while (i < t->length) {
+        Py_UCS4 c = PyUnicode_READ(t->kind, t->data, i);
+        if (c == ',' || c == '}' || c == ']') {
+            if (depth == 0) {
+                break;
+            }
+            else if (c != ',') {
+                depth--;
+            }
+        }
+        else if (c == '{' || c == '[') {
+            depth++;
+        }
+        else if (c == '"') {
+            for (i++; i < t->length; i++) {
+                Py_UCS4 d = PyUnicode_READ(t->kind, t->data, i);
+                if (d == '"') {
+                    break;
+                }
+                else if (d == '\\') {
+                    i++;
+                }
+            }
+            if (i >= t->length) {
+                /* String is missing its closing quote, so it runs to the end */
+                return t->length;
+            }
+        }
+        i++;
+    }
+    return i;
+}
+
+/* See _skip_member. Returns 1 if the dict ends with the skipped value. */
+static int
+skip_member(Tokenizer *t)
+{
+    Py_ssize_t i = skip_value(t, t->pos);
+
+    if (i >= t->length) {
+        t->pos = t->length;
+        return 1;
+    }
+    t->pos = i + 1;
+    return PyUnicode_READ(t->kind, t->data, i) == '}';
+}
+
+static PyObject *parse_dict(Tokenizer *t, PyObject *projection);
+static PyObject *parse_array(Tokenizer *t, PyObject *projection);
+
+/* See _parse_val. projection is a dict of the keys of dicts in the value to parse,
+ * or NULL to parse all of it. */
+static PyObject *
+parse_val(Tokenizer *t, PyObject *projection)
+{
+    PyObject *value;
+
+    for (;;) {
+        switch (next_token(t, &value)) {
+        case TOKEN_ERROR:
+            return NULL;
+        case TOKEN_END:
+            return PyUnicode_New(0, 0);
+        case TOKEN_DICT_START:
+            return parse_dict(t, projection);
+        case TOKEN_ARRAY_START:
+            return parse_array(t, projection);
+        case TOKEN_STRING:
+            return value;
+        default:
+            Py_XDECREF(value);
+        }
+    }
+}
+
+/* See _parse_dict */
+static PyObject *
+parse_dict(Tokenizer *t, PyObject *projection)
+{
+    PyObject *obj, *key, *value, *value_projection;
+    TokenType token_type;
+
+    if (Py_EnterRecursiveCall(" while parsing a gdb mi payload")) {
+        return NULL;
+    }
+    obj = PyDict_New();
+    if (obj == NULL) {
+        goto error;
+    }
+    for (;;) {
+        token_type = next_token(t, &key);
+        if (token_type == TOKEN_ERROR) {
+            goto error;
+        }
+        else if (token_type == TOKEN_END || token_type == TOKEN_DICT_END) {
+            break;
+        }
+        else if (token_type == TOKEN_KEY) {
+            value_projection = NULL;
+            if (projection != NULL) {
+                /* borrowed reference */
+                value_projection = PyDict_GetItemWithError(projection, key);
+                if (value_projection == NULL) {
+                    Py_DECREF(key);
+                    if (PyErr_Occurred()) {
+                        goto error;
+                    }
+                    if (skip_member(t)) {
+                        break;
+                    }
+                    continue;
+                }
+                else if (value_projection == Py_None) {
+                    value_projection = NULL;
+                }
+            }
+            value = parse_val(t, value_projection);
+            if (value == NULL || PyDict_SetItem(obj, key, value) < 0) {
+                Py_DECREF(key);
+                Py_XDECREF(value);
+                goto error;
+            }
+            Py_DECREF(key);
+            Py_DECREF(value);
+        }
+        else {
+            Py_XDECREF(key);
+        }
+    }
+    Py_LeaveRecursiveCall();
+    return obj;
+
+error:
+    Py_XDECREF(obj);
+    Py_LeaveRecursiveCall();
+    return NULL;
+}
+
+/* See _parse_array */
+static PyObject *
+parse_array(Tokenizer *t, PyObject *projection)
+{
+    PyObject *arr, *value;
+    TokenType token_type;
+
+    if (Py_EnterRecursiveCall(" while parsing a gdb mi payload")) {
+        return NULL;
+    }
+    arr = PyList_New(0);
+    if (arr == NULL) {
+        goto error;
+    }
+    for (;;) {
+        token_type = next_token(t, &value);
+        if (token_type == TOKEN_ERROR) {
+            goto error;
+        }
+        else if (token_type == TOKEN_END || token_type == TOKEN_ARRAY_END) {
+            break;
+        }
+        else if (token_type == TOKEN_DICT_START) {
+            value = parse_dict(t, projection);
+        }
+        else if (token_type == TOKEN_ARRAY_START) {
+            value = parse_array(t, projection);
+        }
+        else if (token_type != TOKEN_STRING) {
+            /* Keys of lists of results, ',' '=' and '}' are dropped */
+            Py_XDECREF(value);
+            continue;
+        }
+        if (value == NULL || PyList_Append(arr, value) < 0) {
+            Py_XDECREF(value);
+            goto error;
+        }
+        Py_DECREF(value);
+    }
+    Py_LeaveRecursiveCall();
+    return arr;
+
+error:
+    Py_XDECREF(arr);
+    Py_LeaveRecursiveCall();
+    return NULL;
+}
+
+PyDoc_STRVAR(parse_payload_doc,
+"parse_payload(text, start, projection=None)\n\
+\n\
+Parse the payload of a notify or result record, starting at index start of text.\n\
+projection is a dict of the keys to parse (see _get_projection), or None to parse all keys.\n\
+Returns the same dict as _parse_dict(text, start, projection=projection)[1].");
+
+static PyObject *
+parse_payload(PyObject *self, PyObject *args)
+{
+    Tokenizer t;
+    PyObject *text, *projection = Py_None;
+    Py_ssize_t start;
+
+    if (!PyArg_ParseTuple(args, "Un|O:parse_payload", &text, &start, &projection)) {
+        return NULL;
+    }
+    if (projection == Py_None) {
+        projection = NULL;
+    }
+    else if (!PyDict_Check(projection)) {
+        PyErr_SetString(PyExc_TypeError, "projection must be a dict or None");
+        return NULL;
+    }
+#if PY_VERSION_HEX < 0x030C0000
+    if (PyUnicode_READY(text) < 0) {
+        return NULL;
+    }
+#endif
+    t.text = text;
+    t.kind = PyUnicode_KIND(text);
+    t.data = PyUnicode_DATA(text);
+    t.length = PyUnicode_GET_LENGTH(text);
+    t.pos = start < 0 ? 0 : start;
+    t.done = 0;
+    return parse_dict(&t, projection);
+}
+
+static PyMethodDef gdbmiparser_methods[] = {
+    {"parse_payload", parse_payload, METH_VARARGS, parse_payload_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef gdbmiparser_module = {
+    PyModuleDef_HEAD_INIT,
+    "_gdbmiparser",
+    "C implementation of parsing gdb mi payloads, used by gdbmiparser when available",
+    -1,
+    gdbmiparser_methods
+};
+
+PyMODINIT_FUNC
+PyInit__gdbmiparser(void)
+{
+    return PyModule_Create(&gdbmiparser_module);
+}
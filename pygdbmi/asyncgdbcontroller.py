@@ -0,0 +1,264 @@
+"""AsyncGdbController class to run gdb and get structured output from an asyncio event loop
+
+Requires Python 3.6+
+"""
+
+import asyncio
+import subprocess
+from collections import OrderedDict
+from pprint import pprint
+from pygdbmi import gdbmiparser
+from pygdbmi.gdbcontroller import (DEFAULT_GDB_TIMEOUT_SEC, GdbTimeoutError, NoGdbProcessError,
+                                   _LineFramer, _get_gdb_cmd)
+
+# Maximum number of bytes to read from one of gdb's pipes at once
+READ_SIZE_BYTES = 2 ** 16
+
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:  # python 3.6
+    _get_running_loop = asyncio.get_event_loop
+
+
+class AsyncGdbController():
+    """
+    Run gdb as a subprocess of an asyncio event loop. Send commands and receive structured output.
+    Unlike GdbController, nothing blocks: output is read by tasks running on the event loop,
+    so a single thread can drive many gdb subprocesses at once.
+
+    The gdb subprocess is started with ``await start()``, or by using the object as an
+    async context manager:
+
+        async with AsyncGdbController() as gdbmi:
+            responses = await gdbmi.write('-break-insert main')
+
+    Args:
+        gdb_path (str): Command to run in shell to spawn new gdb subprocess
+        gdb_args (list): Arguments to pass to shell when spawning new gdb subprocess
+        verbose (bool): Print verbose output if True
+    Returns:
+        New AsyncGdbController object
+    """
+
+    def __init__(self, gdb_path='gdb', gdb_args=['--nx', '--quiet', '--interpreter=mi2'], verbose=False):
+        self.verbose = verbose
+        self.gdb_process = None
+        # abs path to gdb executable, and the shell command to run gdb
+        self.abs_gdb_path, self.cmd = _get_gdb_cmd(gdb_path, gdb_args)
+
+        # commands waiting for their result record, by token. Values are
+        # (asyncio.Future, list of responses received for the command). The future of a command
+        # whose write timed out is cancelled, and the command is removed when its result arrives.
+        self._pending_commands = OrderedDict()
+        self._next_token = 1
+
+        # queues of the iterators returned by responses()
+        self._response_queues = []
+
+        self._reader_tasks = []
+
+    async def start(self):
+        """Spawn the gdb subprocess and start reading its output
+        Returns: None"""
+        if self.verbose:
+            print('Launching gdb: "%s"' % ' '.join(self.cmd))
+
+        self.gdb_process = await asyncio.create_subprocess_exec(*self.cmd,
+                                                                stdout=subprocess.PIPE,
+                                                                stdin=subprocess.PIPE,
+                                                                stderr=subprocess.PIPE)
+        self._reader_tasks = [asyncio.ensure_future(self._read_stream(self.gdb_process.stdout, 'stdout')),
+                              asyncio.ensure_future(self._read_stream(self.gdb_process.stderr, 'stderr'))]
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.exit()
+
+    def verify_valid_gdb_subprocess(self):
+        """Verify there is a process object, and that it is still running.
+        Raise NoGdbProcessError if either of the above are not true."""
+        if not self.gdb_process:
+            raise NoGdbProcessError('gdb process is not attached')
+        elif self.gdb_process.returncode is not None:
+            raise NoGdbProcessError('gdb process has already finished with return code: %s' % str(self.gdb_process.returncode))
+
+    async def write(self, mi_cmd_to_write, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, verbose=False, raise_error_on_timeout=True):
+        """Write to gdb process and wait for the result record of each command.
+
+        Each command is prefixed with a token, which gdb includes in the command's result
+        record, so any number of coroutines can write to the same gdb subprocess concurrently.
+
+        Args:
+            mi_cmd_to_write (str or list): Command to write to gdb, without a token. If list, each command is
+            written with its own token.
+            timeout_sec (float): Maximum number of seconds to wait for all result records. Must be >= 0.
+            verbose (bool): Be verbose in what is being written
+            raise_error_on_timeout (bool): Raise error if a result record is not received within timeout_sec
+        Returns:
+            List of parsed gdb responses written while handling the commands, ending with the
+            result record of the last command. Empty if mi_cmd_to_write is an empty list.
+        Raises:
+            NoGdbProcessError if there is no gdb subprocess running
+            GdbTimeoutError if a result record is not received within timeout_sec
+            TypeError if mi_cmd_to_write is not valid
+
+        When the timeout is reached, the commands that have not received their result record are
+        abandoned: the responses gdb writes for them from then on are only given to the iterators
+        of responses(), never to later commands.
+        """
+        self.verify_valid_gdb_subprocess()
+        if timeout_sec < 0:
+            print('warning: timeout_sec was negative, replacing with 0')
+            timeout_sec = 0
+
+        verbose = self.verbose or verbose
+
+        # Ensure proper type of the mi command
+        if type(mi_cmd_to_write) == str:
+            mi_cmds = [mi_cmd_to_write]
+        elif type(mi_cmd_to_write) == list:
+            mi_cmds = mi_cmd_to_write
+        else:
+            raise TypeError('The gdb mi command must a be str or list. Got ' + str(type(mi_cmd_to_write)))
+        if not mi_cmds:
+            # nothing to write, or to wait for
+            return []
+
+        loop = _get_running_loop()
+        tokens = []
+        pending = []
+        lines = []
+        for mi_cmd in mi_cmds:
+            token = self._next_token
+            self._next_token += 1
+            command = (loop.create_future(), [])
+            self._pending_commands[token] = command
+            tokens.append(token)
+            pending.append(command)
+            lines.append('%d%s\n' % (token, mi_cmd.rstrip('\n')))
+
+        if verbose:
+            print('\nwriting: %s' % ''.join(lines))
+
+        try:
+            self.gdb_process.stdin.write(''.join(lines).encode())
+            await self.gdb_process.stdin.drain()
+        except BaseException:
+            # gdb never got the commands (or not all of them), so nothing will complete them
+            for token, (future, _) in zip(tokens, pending):
+                self._pending_commands.pop(token, None)
+                future.cancel()
+            raise
+
+        futures = [future for future, _ in pending]
+        try:
+            _, not_done = await asyncio.wait(futures, timeout=timeout_sec)
+        finally:
+            # abandon the commands that timed out, or all of them if this coroutine was cancelled
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+        if not_done and raise_error_on_timeout:
+            raise GdbTimeoutError('Did not get response from gdb after %s seconds' % timeout_sec)
+
+        responses = []
+        for future, command_responses in pending:
+            if future.done() and not future.cancelled():
+                # raises NoGdbProcessError if gdb exited before the result was received
+                future.result()
+            responses.extend(command_responses)
+        return responses
+
+    async def responses(self, types=('notify',)):
+        """Iterate over gdb's output as it arrives. Yields every async record (such as *stopped or
+        =breakpoint-modified), whether or not it was written while handling a command, and every other
+        response that was not written while handling a command.
+
+        Only responses received while iterating are yielded.
+
+        Args:
+            types (tuple): Types of responses to yield (see gdbmiparser.parse_response),
+            or None to yield responses of all types
+        Yields:
+            Parsed gdb responses, returned from gdbmiparser.parse_response, with the
+            additional key 'stream' which is either 'stdout' or 'stderr'
+        """
+        queue = asyncio.Queue()
+        self._response_queues.append(queue)
+        try:
+            while True:
+                response = await queue.get()
+                if response is None:
+                    # gdb exited
+                    return
+                if types is None or response['type'] in types:
+                    yield response
+        finally:
+            self._response_queues.remove(queue)
+
+    async def _read_stream(self, stream_reader, stream):
+        """Read and parse output from one of gdb's pipes until it is closed"""
+        framer = _LineFramer()
+        while True:
+            raw_output = await stream_reader.read(READ_SIZE_BYTES)
+            if not raw_output:
+                break
+
+            for line in framer.feed(raw_output):
+                if not line or gdbmiparser.response_is_finished(line):
+                    continue
+                response = gdbmiparser.parse_response(line)
+                response['stream'] = stream
+                if self.verbose:
+                    pprint(response)
+                self._handle_response(response)
+
+        if stream == 'stdout':
+            self._handle_gdb_exit()
+
+    def _handle_response(self, response):
+        """Give a response to the command it belongs to, and to the iterators of responses().
+        gdb handles commands in the order they are written, so responses belong to the oldest
+        command that is still waiting for its result record. Responses of abandoned commands
+        are only given to the iterators."""
+        claimed = False
+        if self._pending_commands:
+            token = response.get('token')
+            if response['type'] == 'result' and token in self._pending_commands:
+                future, command_responses = self._pending_commands.pop(token)
+                if not future.done():
+                    future.set_result(response)
+            else:
+                future, command_responses = next(iter(self._pending_commands.values()))
+            if not future.cancelled():
+                command_responses.append(response)
+                claimed = True
+
+        if response['type'] == 'notify' or not claimed:
+            for queue in self._response_queues:
+                queue.put_nowait(response)
+
+    def _handle_gdb_exit(self):
+        """Fail commands that will never get a result, and stop all iterators"""
+        for future, _ in self._pending_commands.values():
+            if not future.done():
+                future.set_exception(NoGdbProcessError('gdb process exited before sending a result'))
+        self._pending_commands.clear()
+        for queue in self._response_queues:
+            queue.put_nowait(None)
+
+    async def exit(self):
+        """Terminate gdb process
+        Returns: None"""
+        if self.gdb_process:
+            if self.gdb_process.returncode is None:
+                self.gdb_process.terminate()
+            await self.gdb_process.wait()
+            # let the readers see the closed pipes
+            await asyncio.gather(*self._reader_tasks, return_exceptions=True)
+        self.gdb_process = None
+        self._reader_tasks = []
+        return None
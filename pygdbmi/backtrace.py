@@ -0,0 +1,298 @@
+"""Backtrace and Frame classes for parsed backtraces, and BacktraceCache to get the backtrace
+after each stop while only fetching the frames that changed
+
+See https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI-Stack-Manipulation.html
+"""
+
+import time
+from pygdbmi.gdbcontroller import DEFAULT_GDB_TIMEOUT_SEC
+from pygdbmi.micommands import check_result
+
+# Fields of -stack-list-frames' frames that are kept, and the Frame attributes they are kept in
+_FRAME_FIELDS = (('addr', 'addr'), ('func', 'func'), ('file', 'file'), ('fullname', 'fullname'),
+                 ('line', 'line'), ('from', 'from_'), ('arch', 'arch'))
+
+# Number of deepest fetched frames that must match the previous backtrace for the frames below
+# them to be taken from it
+_OVERLAP = 2
+
+
+class BacktraceError(ValueError):
+    """Raised when gdb responds to a stack command with an error, such as when there is no stack"""
+    pass
+
+
+class Frame(object):
+    """A frame of a backtrace. Identical frames of different backtraces are shared by
+    BacktraceCache, so frames must not be modified, and a Frame does not know its level:
+    it is the frame's index in the Backtrace.
+
+    Attributes:
+        addr: Program counter of the frame. For frames other than the innermost, this is the
+        address the frame will return to.
+        func (str): Function name, or None if unknown
+        file (str): Source file name, or None if unknown
+        fullname (str): Absolute path of the source file, or None if unknown
+        line: Line number in the source file, or None if unknown
+        from_ (str): Shared library of the frame's function, or None
+        arch (str): Architecture, or None
+        args (tuple): (name, type, value) of each argument, where type and value are None if gdb
+        didn't report them, or None if arguments weren't listed
+    """
+    __slots__ = ('addr', 'func', 'file', 'fullname', 'line', 'from_', 'arch', 'args')
+
+    def __init__(self, addr, func=None, file=None, fullname=None, line=None, from_=None, arch=None, args=None):
+        self.addr = addr
+        self.func = func
+        self.file = file
+        self.fullname = fullname
+        self.line = line
+        self.from_ = from_
+        self.arch = arch
+        self.args = args
+
+    @classmethod
+    def from_fields(cls, fields, args=None):
+        """Make a Frame from a frame of the payload of -stack-list-frames
+        Args:
+            fields (dict): Parsed frame, such as {'level': '0', 'addr': '0x4005a0', 'func': 'main', ...}
+            args (list): args of the same frame in the payload of -stack-list-arguments, or None
+        Returns:
+            Frame
+        """
+        frame = cls(fields.get('addr'), **dict((attribute, fields.get(field)) for field, attribute in _FRAME_FIELDS[1:]))
+        if args is not None:
+            frame.args = tuple((arg.get('name'), arg.get('type'), arg.get('value')) if isinstance(arg, dict)
+                               else (arg, None, None) for arg in args)
+        return frame
+
+    def location(self):
+        """Returns: Tuple of the fields that identify where the frame is, i.e. all except its arguments"""
+        return (self.addr, self.func, self.file, self.fullname, self.line, self.from_, self.arch)
+
+    def _key(self):
+        return self.location() + (self.args,)
+
+    def __eq__(self, other):
+        return isinstance(other, Frame) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return 'Frame(addr=%r, func=%r, file=%r, line=%r)' % (self.addr, self.func, self.file, self.line)
+
+
+class Backtrace(object):
+    """The frames of a thread's stack, innermost first, so frames[level] is the frame at level
+
+    Attributes:
+        frames (tuple): Frame objects
+        thread_id: Thread of the backtrace, or None for the thread that was current
+    """
+    __slots__ = ('frames', 'thread_id')
+
+    def __init__(self, frames, thread_id=None):
+        self.frames = tuple(frames)
+        self.thread_id = thread_id
+
+    @classmethod
+    def from_payloads(cls, frames_payload, arguments_payload=None, thread_id=None):
+        """Make a Backtrace from the payloads of -stack-list-frames and -stack-list-arguments
+        Args:
+            frames_payload (dict): Payload of -stack-list-frames, with key 'stack'
+            arguments_payload (dict): Payload of -stack-list-arguments for the same frames, with
+            key 'stack-args', or None
+            thread_id: Thread of the backtrace
+        Returns:
+            Backtrace
+        """
+        return cls(_make_frames(frames_payload, arguments_payload), thread_id)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, level):
+        return self.frames[level]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __eq__(self, other):
+        return isinstance(other, Backtrace) and self.frames == other.frames and self.thread_id == other.thread_id
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Backtrace(%r)' % (list(self.frames),)
+
+
+class BacktraceCache():
+    """
+    Get the backtrace of a thread after each stop, fetching only the frames that changed since
+    the previous backtrace of the thread.
+
+    gdb is asked for the depth of the stack and the innermost frames, in one batch of commands.
+    When the two deepest frames fetched have the same locations as the frames at the same
+    distance from the bottom of the stack in the previous backtrace, the frames below them are
+    assumed to be unchanged and are taken from the previous backtrace. Otherwise more frames are
+    fetched, twice as many each time, until they match or the whole stack is fetched. Stepping in
+    a deep stack costs a window of frames per stop instead of the whole stack.
+
+    The assumption is not checked: if the program returned below the fetched frames and called
+    back to the same depth through the same two return addresses, the frames below them are
+    stale. Use a window larger than the frames that change between stops, or clear() to fetch
+    the whole stack again.
+
+    Identical frames are shared between backtraces, so keeping the backtraces of many stops
+    costs little more than keeping one.
+
+        backtraces = BacktraceCache(gdbmi)
+        gdbmi.write('-exec-next')
+        backtrace = backtraces.get()
+        print(backtrace[0].func, len(backtrace))
+
+    Frames taken from the previous backtrace keep the arguments they had when they were fetched.
+
+    Args:
+        gdbcontroller (GdbController): Controller of the gdb debugging the inferior
+        window (int): Number of frames to fetch first
+        arguments (bool): Also list the arguments of each frame, with -stack-list-arguments
+        max_frames (int): Maximum number of distinct frames to share. When there are more,
+        sharing starts over, like gdbmiparser.ValueCache.
+        timeout_sec (float): Maximum time to wait for each batch of commands
+    Returns:
+        New BacktraceCache object
+    """
+
+    def __init__(self, gdbcontroller, window=16, arguments=True, max_frames=65536,
+                 timeout_sec=DEFAULT_GDB_TIMEOUT_SEC):
+        if window < 1:
+            raise ValueError('window must be >= 1')
+        self.gdbcontroller = gdbcontroller
+        self.window = window
+        self.arguments = arguments
+        self.max_frames = max_frames
+        self.timeout_sec = timeout_sec
+        # previous backtrace by thread id
+        self._backtraces = {}
+        # shared frames, by themselves
+        self._frames = {}
+
+    def get(self, thread_id=None):
+        """Get the current backtrace of a thread
+        Args:
+            thread_id: Thread to get the backtrace of, or None for the current thread
+        Returns:
+            Backtrace
+        Raises:
+            BacktraceError if gdb can't list the stack, such as when the inferior is not running
+        """
+        thread_option = ' --thread %s' % thread_id if thread_id is not None else ''
+        previous = self._backtraces.get(thread_id)
+
+        depth_payload, frames = self._fetch(0, self.window, thread_option, '-stack-info-depth' + thread_option)
+        depth = int(depth_payload['depth'])
+        window = self.window
+        while len(frames) < depth:
+            reused = self._reusable_frames(previous, frames, depth)
+            if reused is not None:
+                frames.extend(reused)
+                break
+            if previous is None:
+                # nothing to compare with, so fetch the rest at once
+                window = depth - len(frames)
+            else:
+                window *= 2
+            fetched = self._fetch(len(frames), window, thread_option)[1]
+            if not fetched:
+                # the stack got shorter than -stack-info-depth said, or gdb stopped listing frames
+                depth = len(frames)
+                break
+            frames.extend(fetched)
+
+        backtrace = Backtrace(frames[:depth], thread_id)
+        self._backtraces[thread_id] = backtrace
+        return backtrace
+
+    def clear(self):
+        """Forget previous backtraces and shared frames
+        Returns: None"""
+        self._backtraces.clear()
+        self._frames.clear()
+
+    def _reusable_frames(self, previous, frames, depth):
+        """Check that the deepest fetched frames have the same locations as the frames at the
+        same distance from the bottom of the stack in the previous backtrace
+        Returns:
+            List of the frames of the previous backtrace below the fetched frames, or None if they don't match
+        """
+        if previous is None or len(frames) < _OVERLAP:
+            return None
+        # new level + offset is the previous level at the same distance from the bottom
+        offset = len(previous) - depth
+        for level in range(len(frames) - _OVERLAP, len(frames)):
+            previous_level = level + offset
+            if not 0 <= previous_level < len(previous):
+                return None
+            if frames[level].location() != previous[previous_level].location():
+                return None
+        return list(previous.frames[len(frames) + offset:])
+
+    def _fetch(self, low, count, thread_option, first_command=None):
+        """List count frames starting at level low, and their arguments, in a single batch
+        Args:
+            first_command (str): Command to write before the others. Its payload is returned.
+        Returns:
+            (payload of first_command or None, list of shared Frames)
+        """
+        high = low + count - 1
+        commands = ['-stack-list-frames%s %d %d' % (thread_option, low, high)]
+        if self.arguments:
+            commands.append('-stack-list-arguments%s --simple-values %d %d' % (thread_option, low, high))
+        if first_command is not None:
+            commands.insert(0, first_command)
+        futures = self.gdbcontroller.send_batch(commands)
+        timeout_time_sec = time.time() + self.timeout_sec
+        try:
+            results = [future.result(timeout_sec=max(0, timeout_time_sec - time.time())) for future in futures]
+        except BaseException:
+            # the rest of the batch won't be waited for, so its output must not go to later commands
+            self.gdbcontroller.abandon_commands(futures)
+            raise
+        payloads = [check_result(result, command, BacktraceError)['payload'] or {}
+                    for command, result in zip(commands, results)]
+
+        first_payload = payloads.pop(0) if first_command is not None else None
+        frames = _make_frames(payloads[0], payloads[1] if self.arguments else None)
+        return first_payload, [self._share(frame) for frame in frames]
+
+    def _share(self, frame):
+        """Returns: The shared frame identical to frame, or frame after sharing it"""
+        shared = self._frames.get(frame)
+        if shared is None:
+            if len(self._frames) >= self.max_frames:
+                self._frames.clear()
+            self._frames[frame] = shared = frame
+        return shared
+
+
+def _make_frames(frames_payload, arguments_payload=None):
+    """Returns: List of Frames from the payloads of -stack-list-frames and -stack-list-arguments"""
+    args_by_level = {}
+    if arguments_payload is not None:
+        for frame_args in arguments_payload.get('stack-args') or []:
+            args_by_level[str(frame_args.get('level'))] = frame_args.get('args') or []
+    frames = []
+    for fields in frames_payload.get('stack') or []:
+        args = args_by_level.get(str(fields.get('level'))) if arguments_payload is not None else None
+        if arguments_payload is not None and args is None:
+            args = []
+        frames.append(Frame.from_fields(fields, args))
+    return frames
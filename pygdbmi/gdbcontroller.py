@@ -5,14 +5,29 @@ import select
 import subprocess
 import os
 import time
+import threading
+import traceback
+from collections import OrderedDict
 from pprint import pprint
 from pygdbmi import gdbmiparser
+from pygdbmi.sessionrecording import SessionRecorder
 from distutils.spawn import find_executable
-from multiprocessing import Lock
+try:
+    import selectors
+except ImportError:  # python 2
+    selectors = None
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
 
 PYTHON3 = sys.version_info.major == 3
 DEFAULT_GDB_TIMEOUT_SEC = 1
+# Deprecated, and no longer used: reads wait for read_mutex for their own timeout_sec
 MUTEX_AQUIRE_WAIT_TIME_SEC = int(1)
+# Interval between attempts to acquire a lock on python 2, where locks have no timeout
+LOCK_POLL_SEC = 0.005
+WINDOWS_READER_THREAD_POLL_SEC = 0.01
 USING_WINDOWS = os.name == 'nt'
 if USING_WINDOWS:
     import msvcrt
@@ -23,6 +38,11 @@ else:
 
 unicode = str if PYTHON3 else unicode
 
+# Put in the reader thread's queue (and in lists of responses that include prompts) for each
+# (gdb) prompt that is read, and when the thread exits. Compared by identity.
+_GDB_PROMPT = 'gdb prompt'
+_READER_THREAD_EXITED = 'reader thread exited'
+
 
 class NoGdbProcessError(ValueError):
     """Raise when trying to interact with gdb subprocess, but it does not exist.
@@ -35,6 +55,55 @@ class GdbTimeoutError(ValueError):
     pass
 
 
+class GdbCommandFuture():
+    """Response to a command written with GdbController.send, which is filled in
+    as gdb's output is read.
+
+    Attributes:
+        token (int): Token prefixed to the command, which gdb includes in the command's result record
+        command (str): Command that was written, without the token
+        responses (list): Parsed responses gdb wrote while handling the command (stream records, async
+            records and output of the inferior), ending with the result record once it has been received
+    """
+
+    def __init__(self, gdbcontroller, token, command):
+        self.token = token
+        self.command = command
+        self.responses = []
+        self._gdbcontroller = gdbcontroller
+        self._result = None
+        self._done_event = threading.Event()
+        # set when waiting for the result timed out, or by GdbController.abandon_commands
+        self._abandoned = False
+
+    def done(self):
+        """Returns: True if the command's result record has been received"""
+        return self._result is not None
+
+    def result(self, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, verbose=False):
+        """Read gdb's output until the command's result record is received, and return it.
+        Responses to other commands that are read in the meantime are stored in their futures.
+
+        If the result record is not received in time, the command is abandoned (see
+        GdbController.abandon_commands), and calling result again raises GdbTimeoutError.
+
+        Args:
+            timeout_sec (float): Maximum time to wait for the result record. Must be >= 0.
+            verbose (bool): If true, more output it printed
+        Returns:
+            Parsed result record, i.e. a dict with 'type' of 'result' and 'token' of self.token
+        Raises:
+            GdbTimeoutError if the result record is not received within timeout_sec
+            NoGdbProcessError if there is no gdb subprocess running, or gdb exits before sending the result
+            RuntimeError if it has to wait in the reader thread (see GdbController.subscribe)
+        """
+        if self._abandoned:
+            raise GdbTimeoutError('"%s" was abandoned before its result was received' % self.command)
+        if not self.done():
+            self._gdbcontroller._wait_for_commands([self], timeout_sec, verbose)
+        return self._result
+
+
 class GdbController():
     """
     Run gdb as a subprocess. Send commands and receive structured output.
@@ -44,26 +113,98 @@ class GdbController():
         gdb_path (str): Command to run in shell to spawn new gdb subprocess
         gdb_args (list): Arguments to pass to shell when spawning new gdb subprocess
         verbose (bool): Print verbose output if True
+        use_reader_thread (bool): Read gdb's output continuously from a background thread. Responses
+        are queued until they are returned by get_gdb_response, and subscribers are called
+        as soon as their responses are read.
+        lazy_payload (bool): Parse the payload of notify and result records only when it is used.
+        Responses that are only checked for their type or message are faster to read.
+        See gdbmiparser.LazyPayloadResponse.
+        as_records (bool): Return responses as gdbmiparser.MiRecord objects, which use much less
+        memory than dicts
+        dedup_values (bool): Share equal string values of payloads between responses through a
+        bounded gdbmiparser.ValueCache, so values repeated in many responses are stored once
+        field_types (dict): Convert the values of these keys of payloads while parsing them,
+        such as gdbmiparser.DEFAULT_FIELD_TYPES to get numbers as ints. See gdbmiparser.parse_response.
+        record_path (str): Record everything written to and read from gdb in this file, with the
+        time and size of each read, so the session can be replayed with ReplayGdbController.
+        See sessionrecording.SessionRecorder.
+        incremental_parsing (bool): Parse gdb's output as it is read with gdbmiparser.IncrementalParser,
+        instead of once each line is complete, so parsing very large records overlaps with gdb writing
+        them. Payloads are always parsed right away, so lazy_payload has no effect.
     Returns:
         New GdbController object
+
+    A GdbController can be used by many threads at once:
+
+    * Writes to gdb are serialized by write_mutex, so commands written by different threads are never
+      interleaved, and the commands of send and send_batch are registered in the order they are written.
+    * Reads of gdb's output are serialized by read_mutex. The two are separate, so a thread can write
+      while another thread is waiting for output.
+    * Each response is returned to exactly one caller, in the order gdb wrote it. Responses to commands
+      written with send go to their GdbCommandFuture, whichever thread reads them. Other responses go to
+      the write, get_gdb_response or iter_responses call that reads them.
+    * A read that can't acquire read_mutex within its timeout reads nothing, as if gdb had not responded.
+
+    The mutex attribute is a deprecated alias of write_mutex.
     """
 
-    def __init__(self, gdb_path='gdb', gdb_args=['--nx', '--quiet', '--interpreter=mi2'], verbose=False):
+    def __init__(self, gdb_path='gdb', gdb_args=['--nx', '--quiet', '--interpreter=mi2'], verbose=False,
+                 use_reader_thread=False, lazy_payload=False, as_records=False, dedup_values=False,
+                 field_types=None, record_path=None, incremental_parsing=False):
         self.verbose = verbose
-        self.mutex = Lock()
+        self.lazy_payload = lazy_payload
+        self.as_records = as_records
+        self.value_cache = gdbmiparser.ValueCache() if dedup_values else None
+        self.field_types = field_types
+        self.incremental_parsing = incremental_parsing
+        self.write_mutex = threading.Lock()
+        # reentrant so subscriber callbacks, which run in the thread that is reading output unless the
+        # reader thread is running, can read too
+        self.read_mutex = threading.RLock()
+        # deprecated name of write_mutex, from when a single lock serialized writes and reads
+        self.mutex = self.write_mutex
         self.abs_gdb_path = None  # abs path to gdb executable
         self.cmd = []  # the shell command to run gdb
+        self._selector = None
 
-        if not gdb_path:
-            raise ValueError('a valid path to gdb must be specified')
-        else:
-            abs_gdb_path = find_executable(gdb_path)
-            if abs_gdb_path is None:
-                raise ValueError('gdb executable could not be resolved from "%s"' % gdb_path)
-            else:
-                self.abs_gdb_path = abs_gdb_path
+        self._start_gdb(gdb_path, gdb_args, verbose)
+
+        self._recorder = None
+        if record_path is not None:
+            self._recorder = SessionRecorder(record_path, self.cmd)
+
+        # buffers for unifinished gdb output
+        self._incomplete_output = {'stdout': _LineFramer(), 'stderr': _LineFramer()}
+        # parsers of partially read output, by stream, when incremental_parsing is used
+        self._incremental_parsers = {}
+
+        # commands written with send() that are waiting for their result record, by token
+        self._pending_commands = OrderedDict()
+        self._next_token = 1
+
+        self._pending_commands_lock = threading.Lock()
+
+        # responses read while waiting for a command's result record that don't belong to
+        # any command. They are returned by the next call to get_gdb_response.
+        self._unclaimed_responses = []
+
+        # functions to call with responses as soon as they are read, by subscription id
+        self._subscribers = {}
+        self._next_subscription_id = 1
+
+        self._reader_thread = None
+        self._response_queue = None
+        # set by the reader thread when gdb's output ends, before waking the commands waiting for their result
+        self._reader_thread_exited = False
+        if use_reader_thread:
+            self._response_queue = queue.Queue()
+            self._reader_thread = threading.Thread(target=self._read_in_background, name='pygdbmi reader')
+            self._reader_thread.daemon = True
+            self._reader_thread.start()
 
-        self.cmd = [self.abs_gdb_path] + gdb_args
+    def _start_gdb(self, gdb_path, gdb_args, verbose):
+        """Spawn the gdb subprocess, and set up its pipes"""
+        self.abs_gdb_path, self.cmd = _get_gdb_cmd(gdb_path, gdb_args)
 
         if verbose:
             print('Launching gdb: "%s"' % ' '.join(self.cmd))
@@ -84,8 +225,12 @@ class GdbController():
         self.read_list = [self.stdout_fileno, self.stderr_fileno]
         self.write_list = [self.stdin_fileno]
 
-        # string buffers for unifinished gdb output
-        self._incomplete_output = {'stdout': None, 'stderr': None}
+        # Used to sleep until gdb writes output on unix. Falls back to
+        # select.select when the selectors module is not available.
+        if selectors and not USING_WINDOWS:
+            self._selector = selectors.DefaultSelector()
+            for fileno in self.read_list:
+                self._selector.register(fileno, selectors.EVENT_READ)
 
     def verify_valid_gdb_subprocess(self):
         """Verify there is a process object, and that it is still running.
@@ -104,22 +249,28 @@ class GdbController():
             wait_for_result=False):
         """Write to gdb process. Block while parsing responses from gdb for a maximum of timeout_sec.
 
-        A mutex is obtained before writing and released before returning
+        write_mutex is held while writing, and read_mutex while reading the response
 
         Args:
             mi_cmd_to_write (str or list): String to write to gdb. If list, it is joined by newlines.
             timeout_sec (int): Maximum number of seconds to wait for response before exiting. Must be >= 0.
             verbose (bool): Be verbose in what is being written
             raise_error_on_timeout (bool): If read_response is True, raise error if no response is received
-            read_response (bool): Block and read response. If there is a separate thread running,
-            this can be false, and the reading thread read the output.
+            read_response (bool): Block and read response. If the reader thread is running,
+            this can be false, and the responses are left in its queue for get_gdb_response.
         Returns:
-            List of parsed gdb responses if read_response is True, otherwise []
+            List of parsed gdb responses if read_response is True, otherwise []. The responses are
+            complete once a result record has been read for each command written, followed by
+            a (gdb) prompt. Output gdb wrote before the command, such as its startup output, is included.
         Raises:
             NoGdbProcessError if there is no gdb subprocess running
+            GdbTimeoutError if gdb's stdin is not ready to be written to within timeout_sec
             TypeError if mi_cmd_to_write is not valid
+            RuntimeError if read_response is True and it is called in the reader thread (see subscribe)
         """
         self.verify_valid_gdb_subprocess()
+        if read_response:
+            self._verify_not_reader_thread()
         if timeout_sec < 0:
             print('warning: timeout_sec was negative, replacing with 0')
             timeout_sec = 0
@@ -142,6 +293,23 @@ class GdbController():
         else:
             mi_cmd_to_write_nl = mi_cmd_to_write
 
+        with self.write_mutex:
+            self._write_to_stdin(mi_cmd_to_write_nl, timeout_sec, blocking_call)
+
+        if read_response is True:
+            # each command gets a result record, and the response is complete once all of them are read
+            num_results = len([line for line in mi_cmd_to_write.split('\n') if line.strip()])
+            return self._get_gdb_response(timeout_sec, raise_error_on_timeout, verbose, blocking_call,
+                                          wait_for_result, num_results or None)
+        else:
+            return []
+
+    def _write_to_stdin(self, text, timeout_sec, blocking_call):
+        """Write text to gdb's stdin once it is ready. Must be called with write_mutex held.
+        Raises:
+            GdbTimeoutError if stdin is not ready within timeout_sec, such as when its pipe is full
+            because gdb is busy. Nothing is written.
+        """
         if USING_WINDOWS:
             # select not implemented in windows for pipes
             # assume it's always ready
@@ -151,24 +319,288 @@ class GdbController():
                 _, outputready, _ = select.select([], self.write_list, [])
             else:
                 _, outputready, _ = select.select([], self.write_list, [], timeout_sec)
+        if not outputready:
+            raise GdbTimeoutError('gdb was not ready to read "%s" after %s seconds' % (text.rstrip('\n'), timeout_sec))
         for fileno in outputready:
             if fileno == self.stdin_fileno:
                 # ready to write
-                self.gdb_process.stdin.write(mi_cmd_to_write_nl.encode())
+                if self._recorder is not None:
+                    self._recorder.record('stdin', text.encode())
+                self.gdb_process.stdin.write(text.encode())
                 # don't forget to flush for Python3, otherwise gdb won't realize there is data
                 # to evaluate, and we won't get a response
                 self.gdb_process.stdin.flush()
             else:
                 print('developer error: got unexpected fileno %d, event %d' % fileno)
 
-        if read_response is True:
-            return self.get_gdb_response(timeout_sec=timeout_sec, 
-                                         raise_error_on_timeout=raise_error_on_timeout, 
-                                         verbose=verbose, 
-                                         blocking_call=blocking_call, 
-                                         wait_for_result=wait_for_result)
+    def send(self, mi_cmd_to_write, verbose=False):
+        """Write a command to gdb without waiting for its response. The command is prefixed
+        with a token that gdb includes in the command's result record, so the response can be matched
+        to the command even when many commands are written before any of them are answered.
+
+        Output that gdb writes while handling the command is collected by the returned future
+        rather than returned by get_gdb_response. Since gdb handles commands in order, responses are
+        assigned to the oldest command still waiting for its result record. Result records that don't
+        have the token of a command written with send are still returned by write and get_gdb_response.
+
+        Args:
+            mi_cmd_to_write (str): Command to write to gdb, without a token
+            verbose (bool): Be verbose in what is being written
+        Returns:
+            GdbCommandFuture for the command's response
+        Raises:
+            NoGdbProcessError if there is no gdb subprocess running
+            GdbTimeoutError if gdb's stdin is not ready to be written to within DEFAULT_GDB_TIMEOUT_SEC
+            TypeError if mi_cmd_to_write is not a str
+        """
+        if type(mi_cmd_to_write) not in [str, unicode]:
+            raise TypeError('The gdb mi command must a be str. Got ' + str(type(mi_cmd_to_write)))
+        return self._send_commands([mi_cmd_to_write], verbose)[0]
+
+    def send_batch(self, mi_cmds_to_write, verbose=False):
+        """Write many commands to gdb at once, without waiting for their responses. Like send,
+        each command is prefixed with its own token, but all of them are written with a single
+        write to gdb's stdin, so gdb can handle them back to back.
+
+        Args:
+            mi_cmds_to_write (list): Commands (str) to write to gdb, without tokens
+            verbose (bool): Be verbose in what is being written
+        Returns:
+            List of GdbCommandFuture, one for each command, in the same order
+        Raises:
+            NoGdbProcessError if there is no gdb subprocess running
+            GdbTimeoutError if gdb's stdin is not ready to be written to within DEFAULT_GDB_TIMEOUT_SEC
+            TypeError if mi_cmds_to_write is not a list of str
+        """
+        if type(mi_cmds_to_write) != list or any(type(cmd) not in [str, unicode] for cmd in mi_cmds_to_write):
+            raise TypeError('The gdb mi commands must a be list of str. Got ' + str(mi_cmds_to_write))
+        return self._send_commands(mi_cmds_to_write, verbose)
+
+    def write_batch(self, mi_cmds_to_write, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, verbose=False,
+                    raise_error_on_timeout=True):
+        """Write many commands to gdb at once with send_batch, and wait for the result records of all of them.
+        Unlike writing a list with write, the responses are returned separately for each command.
+
+        Args:
+            mi_cmds_to_write (list): Commands (str) to write to gdb, without tokens
+            timeout_sec (float): Maximum time to wait for all result records. Must be >= 0.
+            verbose (bool): Be verbose in what is being written
+            raise_error_on_timeout (bool): Raise error if a result record is not received within timeout_sec
+        Returns:
+            List with a list of parsed gdb responses for each command, in the same order. Each list has
+            the responses gdb wrote while handling the command, ending with its result record
+            (unless it timed out and raise_error_on_timeout is False).
+        Raises:
+            NoGdbProcessError if there is no gdb subprocess running
+            GdbTimeoutError if a result record is not received within timeout_sec
+            TypeError if mi_cmds_to_write is not a list of str
+        """
+        futures = self.send_batch(mi_cmds_to_write, verbose)
+        try:
+            self._wait_for_commands(futures, timeout_sec, verbose)
+        except GdbTimeoutError:
+            if raise_error_on_timeout:
+                raise
+        return [future.responses for future in futures]
+
+    def _send_commands(self, mi_cmds_to_write, verbose):
+        """Create a future for each command, and write the commands with their tokens in one write
+        Returns: List of GdbCommandFuture"""
+        self.verify_valid_gdb_subprocess()
+        verbose = self.verbose or verbose
+        futures = []
+        # hold write_mutex while registering, so futures are in the same order as the commands gdb reads
+        with self.write_mutex:
+            with self._pending_commands_lock:
+                for mi_cmd_to_write in mi_cmds_to_write:
+                    token = self._next_token
+                    self._next_token += 1
+                    future = GdbCommandFuture(self, token, mi_cmd_to_write)
+                    self._pending_commands[token] = future
+                    futures.append(future)
+
+            text = ''.join('%d%s\n' % (future.token, future.command.rstrip('\n')) for future in futures)
+            if verbose:
+                print('\nwriting: %s' % text)
+            try:
+                self._write_to_stdin(text, DEFAULT_GDB_TIMEOUT_SEC, False)
+            except Exception:
+                with self._pending_commands_lock:
+                    for future in futures:
+                        self._pending_commands.pop(future.token, None)
+                raise
+        return futures
+
+    def _wait_for_commands(self, futures, timeout_sec, verbose=False):
+        """Read gdb's output until the result records of all futures have been received
+        Args:
+            futures (list): GdbCommandFuture objects to wait for
+            timeout_sec (float): Maximum time to wait. Must be >= 0.
+            verbose (bool): If true, more output it printed
+        Raises:
+            GdbTimeoutError if any result record is not received within timeout_sec
+            NoGdbProcessError if there is no gdb subprocess running, or gdb exits before all result
+            records are received
+            In both cases, the futures that didn't receive their result record are abandoned.
+        """
+        self.verify_valid_gdb_subprocess()
+        self._verify_not_reader_thread()
+        verbose = self.verbose or verbose
+        timeout_time_sec = time.time() + timeout_sec
+
+        if self._reader_thread is not None:
+            # the reader thread completes the futures, and wakes them up if gdb exits
+            for future in futures:
+                future._done_event.wait(max(0, timeout_time_sec - time.time()))
+            gdb_exited = self._reader_thread_exited
         else:
-            return []
+            gdb_exited = self._read_until_commands_done(futures, timeout_time_sec, verbose)
+
+        timed_out = [future for future in futures if not future.done()]
+        self.abandon_commands(timed_out)
+        if timed_out and gdb_exited:
+            raise NoGdbProcessError('gdb exited before sending the result of "%s"' % timed_out[0].command)
+        elif timed_out:
+            raise GdbTimeoutError('Did not get result of "%s" from gdb after %s seconds' % (timed_out[0].command, timeout_sec))
+
+    def abandon_commands(self, futures):
+        """Stop collecting the responses of commands written with send that haven't received their
+        result record, such as when the caller stops waiting for them. They stay pending until their
+        result record is read, so the output gdb writes for them is not mistaken for the output of
+        later commands, but it is returned by write, get_gdb_response and iter_responses instead,
+        like the output of commands written with write. Calling result on their futures raises
+        GdbTimeoutError.
+
+        Args:
+            futures (list): GdbCommandFutures returned by send or send_batch
+        Returns: List of the futures that were abandoned, i.e. the ones that weren't done or abandoned already
+        """
+        with self._pending_commands_lock:
+            abandoned = [future for future in futures if not future.done() and not future._abandoned]
+            for future in abandoned:
+                future._abandoned = True
+        return abandoned
+
+    def reset_session(self):
+        """Forget what previous users of this controller were waiting for, so the output of later
+        commands only goes to whoever writes them: unsubscribe all callbacks, and abandon all commands
+        written with send that haven't received their result record. gdb itself is left as it is.
+
+        Returns: Number of commands that were abandoned
+        """
+        self._subscribers.clear()
+        with self._pending_commands_lock:
+            futures = list(self._pending_commands.values())
+        return len(self.abandon_commands(futures))
+
+    def _read_until_commands_done(self, futures, timeout_time_sec, verbose):
+        """Read gdb's output until the result records of all futures have been received, or until timeout_time_sec
+        Returns: True if gdb's output ended first"""
+        while not all(future.done() for future in futures):
+            time_remaining_sec = timeout_time_sec - time.time()
+            if time_remaining_sec <= 0:
+                return False
+            # Another thread that is reading may read the results of these futures,
+            # so check them again every so often while waiting for read_mutex
+            if not _acquire_lock(self.read_mutex, min(time_remaining_sec, DEFAULT_GDB_TIMEOUT_SEC / 10.0)):
+                continue
+            try:
+                while not all(future.done() for future in futures):
+                    time_remaining_sec = timeout_time_sec - time.time()
+                    if time_remaining_sec <= 0:
+                        return False
+
+                    if USING_WINDOWS:
+                        responses = self._read_windows(verbose)
+                        reached_eof = False
+                    else:
+                        responses, reached_eof = self._read_available_output(time_remaining_sec, verbose)
+                    self._unclaimed_responses.extend(responses)
+
+                    if reached_eof:
+                        return True
+            finally:
+                self.read_mutex.release()
+        return False
+
+    def subscribe(self, callback, response_type=None, message=None):
+        """Call a function with each response from gdb that matches a filter, as soon as the response is read.
+        Callbacks are run in the reader thread if it is running, otherwise in the thread that is reading
+        gdb's output (i.e. during write, get_gdb_response, or GdbCommandFuture.result). Responses
+        are still returned as usual, after the callbacks have been called.
+
+        Callbacks run in the reader thread must not wait for gdb's output, since only the reader
+        thread reads it: write (unless read_response is False), get_gdb_response, iter_responses,
+        write_batch and GdbCommandFuture.result raise RuntimeError when called there. Callbacks can
+        write commands with send or send_batch, and wait for their results in another thread.
+
+        Args:
+            callback (function): Called with each matching parsed response
+            response_type (str): Only match responses with this type, such as 'notify' or 'console'. None to match any type.
+            message (str): Only match responses with this message, such as 'stopped'. None to match any message.
+        Returns:
+            Subscription id (int), to pass to unsubscribe
+        """
+        subscription_id = self._next_subscription_id
+        self._next_subscription_id += 1
+        self._subscribers[subscription_id] = (callback, response_type, message)
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        """Stop calling the callback of a subscription
+        Args:
+            subscription_id (int): Value returned by subscribe
+        Returns: None"""
+        self._subscribers.pop(subscription_id, None)
+
+    def _verify_not_reader_thread(self):
+        """Raise RuntimeError if called in the reader thread, such as by a subscriber callback,
+        where waiting for gdb's output would never end since only the reader thread reads it"""
+        if self._reader_thread is not None and threading.current_thread() is self._reader_thread:
+            raise RuntimeError("can't wait for gdb's output in the reader thread. "
+                               "Write commands with send or send_batch instead.")
+
+    def _publish(self, response):
+        """Call the callbacks of all subscriptions matching response"""
+        for callback, response_type, message in list(self._subscribers.values()):
+            if response_type is not None and response['type'] != response_type:
+                continue
+            if message is not None and response['message'] != message:
+                continue
+            try:
+                callback(response)
+            except Exception:
+                # a broken subscriber must not stop gdb's output from being read
+                traceback.print_exc()
+
+    def _read_in_background(self):
+        """Read gdb's output until gdb exits. Run by the reader thread."""
+        while self.gdb_process is not None:
+            try:
+                if USING_WINDOWS:
+                    responses = self._read_windows(self.verbose, include_prompts=True)
+                    reached_eof = self.gdb_process.poll() is not None
+                    if not responses:
+                        time.sleep(WINDOWS_READER_THREAD_POLL_SEC)
+                else:
+                    responses, reached_eof = self._read_available_output(None, self.verbose, include_prompts=True)
+            except (AttributeError, ValueError, OSError):
+                # gdb exited and its pipes were closed while reading
+                break
+
+            # responses, and _GDB_PROMPT for each (gdb) prompt, in the order they were read
+            for response in responses:
+                self._response_queue.put(response)
+
+            if reached_eof:
+                break
+
+        # commands that are still waiting won't get their result
+        with self._pending_commands_lock:
+            self._reader_thread_exited = True
+            for future in self._pending_commands.values():
+                future._done_event.set()
+        self._response_queue.put(_READER_THREAD_EXITED)
 
     def get_gdb_response(self, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, 
                          raise_error_on_timeout=True, verbose=False, 
@@ -176,8 +608,8 @@ class GdbController():
         """Get response from GDB, and block while doing so. If GDB does not have any response ready to be read
         by timeout_sec, an exception is raised.
 
-        A lock (mutex) is obtained before reading and released before returning. If the lock cannot
-        be obtained, no data is read and an empty list is returned.
+        read_mutex is obtained before reading and released before returning. If it cannot
+        be obtained within timeout_sec, no data is read, as if gdb had not responded.
 
         Args:
             timeout_sec (float): Time to wait for reponse. Must be >= 0.
@@ -193,191 +625,580 @@ class GdbController():
             GdbTimeoutError if response is not received within timeout_sec
             ValueError if select returned unexpected file number
             NoGdbProcessError if there is no gdb subprocess running
+            RuntimeError if it is called in the reader thread (see subscribe)
         """
+        return self._get_gdb_response(timeout_sec, raise_error_on_timeout, verbose, blocking_call, wait_for_result)
 
+    def _get_gdb_response(self, timeout_sec, raise_error_on_timeout, verbose, blocking_call, wait_for_result,
+                          num_results=None):
+        """See get_gdb_response
+        Args:
+            num_results (int): Number of commands that were written, whose result records complete the
+            response, or None to return at the first (gdb) prompt after any response
+        """
         self.verify_valid_gdb_subprocess()
+        self._verify_not_reader_thread()
         if timeout_sec < 0:
             print('warning: timeout_sec was negative, replacing with 0')
             timeout_sec = 0
 
         verbose = self.verbose or verbose
 
-        self.mutex.acquire(MUTEX_AQUIRE_WAIT_TIME_SEC)
-
-        if USING_WINDOWS:
-            retval = self._get_responses_windows(timeout_sec, verbose, blocking_call, wait_for_result)
-        else:
-            retval = self._get_responses_unix(timeout_sec, verbose, blocking_call, wait_for_result)
-
-        self.mutex.release()
+        collector = _ResponseCollector(num_results)
+        if _acquire_lock(self.read_mutex, None if blocking_call else timeout_sec):
+            try:
+                unclaimed_responses, self._unclaimed_responses = self._unclaimed_responses, []
+                if unclaimed_responses:
+                    # the reads that returned them were complete, but their prompts weren't kept
+                    collector.add(unclaimed_responses + [_GDB_PROMPT])
+
+                if unclaimed_responses and num_results is None:
+                    # don't wait since there is already a response to return
+                    pass
+                elif collector.is_complete(blocking_call, wait_for_result):
+                    # the results of the commands that were written were already read
+                    pass
+                elif self._reader_thread is not None:
+                    self._get_responses_from_reader_thread(collector, timeout_sec, blocking_call, wait_for_result)
+                elif USING_WINDOWS:
+                    self._get_responses_windows(collector, timeout_sec, verbose, blocking_call, wait_for_result)
+                else:
+                    self._get_responses_unix(collector, timeout_sec, verbose, blocking_call, wait_for_result)
+            finally:
+                self.read_mutex.release()
 
+        retval = collector.responses
         if not retval and raise_error_on_timeout:
             raise GdbTimeoutError('Did not get response from gdb after %s seconds' % timeout_sec)
         else:
             return retval
 
-    def _get_responses_windows(self, timeout_sec, verbose, blocking_call, wait_for_result):
-        """Get responses on windows. Assume no support for select and use a while loop."""
+    def iter_responses(self, until='result', timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, raise_error_on_timeout=True, verbose=False):
+        """Yield parsed responses from gdb as soon as they are read, rather than returning them in a list
+        once gdb's response is complete. Only the responses of a single read are held in memory, so commands
+        with very large output (such as 'info functions') can be processed with constant memory.
+
+        Args:
+            until (str): When to stop. 'result' stops after a result record, 'prompt' stops at a (gdb) prompt
+            that follows at least one response, and None stops once gdb writes nothing for timeout_sec.
+            timeout_sec (float): Maximum time to wait for gdb to write more output. Must be >= 0.
+            raise_error_on_timeout (bool): Raise an error if gdb writes nothing for timeout_sec before
+            reaching the point given by until
+            verbose (bool): If true, more output it printed
+        Yields:
+            Parsed gdb responses, returned from gdbmiparser.parse_response, with the
+            additional key 'stream' which is either 'stdout' or 'stderr'
+        Raises:
+            GdbTimeoutError if gdb writes nothing for timeout_sec
+            NoGdbProcessError if there is no gdb subprocess running
+            ValueError if until is not valid
+            RuntimeError if it is called in the reader thread (see subscribe)
+        """
+        if until not in ['result', 'prompt', None]:
+            raise ValueError('until must be "result", "prompt" or None. Got %s' % until)
+        self.verify_valid_gdb_subprocess()
+        self._verify_not_reader_thread()
+        if timeout_sec < 0:
+            print('warning: timeout_sec was negative, replacing with 0')
+            timeout_sec = 0
+        verbose = self.verbose or verbose
+
+        with self.read_mutex:
+            responses, self._unclaimed_responses = self._unclaimed_responses, []
+        # index in responses of the next response to yield
+        next_index = 0
+        gdb_prompt_received = False
+        reached_eof = False
+        num_yielded = 0
         timeout_time_sec = time.time() + timeout_sec
-        responses = []
-        while(True):
+        try:
+            while(True):
+                while next_index < len(responses):
+                    response = responses[next_index]
+                    next_index += 1
+                    num_yielded += 1
+                    if until == 'result' and response['type'] == 'result':
+                        # keep whatever was read after the result for the next caller
+                        self._return_unclaimed_responses(responses[next_index:])
+                        next_index = len(responses)
+                        yield response
+                        return
+                    yield response
+
+                if responses:
+                    timeout_time_sec = time.time() + timeout_sec
+                if until == 'prompt' and gdb_prompt_received and num_yielded:
+                    return
+                elif reached_eof or time.time() >= timeout_time_sec:
+                    if until is not None and raise_error_on_timeout:
+                        raise GdbTimeoutError('Did not get response from gdb after %s seconds' % timeout_sec)
+                    return
+
+                responses, gdb_prompt_received, reached_eof = self._read_next_responses(
+                    max(0, timeout_time_sec - time.time()), verbose)
+                next_index = 0
+        finally:
+            # the caller stopped iterating (break or close) before every response read was yielded
+            self._return_unclaimed_responses(responses[next_index:])
+
+    def _return_unclaimed_responses(self, responses):
+        """Put responses that were read but not returned back in front of the unclaimed
+        responses, so the next read returns them"""
+        if responses:
+            with self.read_mutex:
+                self._unclaimed_responses = responses + self._unclaimed_responses
+
+    def poll_output(self, verbose=False):
+        """Read the output gdb has already written, without waiting for more, so subscribers are called
+        with it and the futures of commands written with send are completed. Other responses are kept,
+        and returned by the next call to write, get_gdb_response or iter_responses.
+        Nothing is read if the reader thread is running, since it reads output as soon as it is written,
+        or if another thread is reading.
+
+        Args:
+            verbose (bool): If true, more output it printed
+        Returns: None
+        Raises:
+            NoGdbProcessError if there is no gdb subprocess running
+        """
+        self.verify_valid_gdb_subprocess()
+        verbose = self.verbose or verbose
+        if self._reader_thread is not None or not _acquire_lock(self.read_mutex, 0):
+            return
+        try:
+            if USING_WINDOWS:
+                responses = self._read_windows(verbose)
+            else:
+                responses, _ = self._read_available_output(0, verbose)
+            self._unclaimed_responses.extend(responses)
+        finally:
+            self.read_mutex.release()
+
+    def _read_next_responses(self, timeout_sec, verbose):
+        """Wait up to timeout_sec for gdb's output and parse what is available
+        Returns:
+            (list of parsed responses, True if a (gdb) prompt was read, True if gdb closed its output)
+        """
+        if self._reader_thread is not None:
             try:
-                self.gdb_process.stdout.flush()
-                raw_output = self.gdb_process.stdout.read()
-                responses.extend(self._get_responses_list(raw_output, 'stdout', verbose))
-            except IOError:
-                pass
+                response = self._response_queue.get(True, timeout_sec)
+            except queue.Empty:
+                return [], False, False
+            if response is _READER_THREAD_EXITED:
+                # leave it for the next caller too
+                self._response_queue.put(_READER_THREAD_EXITED)
+                return [], False, True
+            elif response is _GDB_PROMPT:
+                return [], True, False
+            return [response], False, False
+
+        if not _acquire_lock(self.read_mutex, timeout_sec):
+            return [], False, False
+        try:
+            if USING_WINDOWS:
+                responses = self._read_windows(verbose, include_prompts=True)
+                reached_eof = self.gdb_process.poll() is not None
+                if not responses:
+                    time.sleep(min(timeout_sec, WINDOWS_READER_THREAD_POLL_SEC))
+            else:
+                responses, reached_eof = self._read_available_output(timeout_sec, verbose, include_prompts=True)
+            collector = _ResponseCollector()
+            collector.add(responses)
+            return collector.responses, collector.prompt_after_last_response, reached_eof
+        finally:
+            self.read_mutex.release()
+
+    def _get_responses_from_reader_thread(self, collector, timeout_sec, blocking_call, wait_for_result):
+        """Add responses queued by the reader thread to collector, waiting for more until gdb's response is
+        complete or timeout_sec has passed."""
+        if blocking_call:
+            timeout_time_sec = None
+        else:
+            timeout_time_sec = time.time() + timeout_sec
 
+        while(True):
             try:
-                self.gdb_process.stderr.flush()
-                raw_output = self.gdb_process.stderr.read()
-                responses.extend(self._get_responses_list(raw_output, 'stderr', verbose))
-            except IOError:
-                pass
+                if timeout_time_sec is None:
+                    response = self._response_queue.get()
+                else:
+                    response = self._response_queue.get(True, max(0, timeout_time_sec - time.time()))
+            except queue.Empty:
+                break
 
-            if blocking_call:
-                result_received = False
+            if response is _READER_THREAD_EXITED:
+                # leave it for the next caller too
+                self._response_queue.put(_READER_THREAD_EXITED)
+                break
+            collector.add([response])
 
-                if wait_for_result:
-                    for response in responses:
-                        if response['type'] == 'result':
-                            result_received = True
-                            break
-                else:
-                    result_received = True
+            if collector.is_complete(blocking_call, wait_for_result):
+                break
 
-                if result_received:
-                    break
+    def _get_responses_windows(self, collector, timeout_sec, verbose, blocking_call, wait_for_result):
+        """Add responses to collector on windows. Assume no support for select and use a while loop
+        until gdb's response is complete or timeout_sec has passed."""
+        timeout_time_sec = time.time() + timeout_sec
+        while(True):
+            collector.add(self._read_windows(verbose, include_prompts=True))
+            if collector.is_complete(blocking_call, wait_for_result):
+                break
 
             if time.time() > timeout_time_sec:
                 break
+
+    def _read_windows(self, verbose, include_prompts=False):
+        """Read and parse whatever output is available on windows, without waiting
+        Returns: List of parsed responses (and _GDB_PROMPT for each (gdb) prompt if include_prompts)"""
+        responses = []
+        try:
+            self.gdb_process.stdout.flush()
+            raw_output = self.gdb_process.stdout.read()
+            responses.extend(self._get_responses_list(raw_output, 'stdout', verbose, include_prompts))
+        except IOError:
+            pass
+
+        try:
+            self.gdb_process.stderr.flush()
+            raw_output = self.gdb_process.stderr.read()
+            responses.extend(self._get_responses_list(raw_output, 'stderr', verbose, include_prompts))
+        except IOError:
+            pass
         return responses
 
-    def _get_responses_unix(self, timeout_sec, verbose, blocking_call, wait_for_result):
-        """Get responses on unix-like system. Use select to wait for output."""
+    def _get_responses_unix(self, collector, timeout_sec, verbose, blocking_call, wait_for_result):
+        """Add responses to collector on unix-like system. Sleep until gdb writes output, read all of it,
+        and repeat until gdb's response is complete or timeout_sec has passed.
+
+        See _ResponseCollector.is_complete for when the response is complete.
+        """
         if blocking_call:
-            events, _, _ = select.select(self.read_list, [], [])
+            timeout_time_sec = None
         else:
-            events, _, _ = select.select(self.read_list, [], [], timeout_sec)
-
-        # timeout_sec can be zero, in which case we won't waste the CPU cycles retrieving and computing a timeout time
-        if timeout_sec != 0:
             timeout_time_sec = time.time() + timeout_sec
-        responses = []
+
         while(True):
-            try:
-                for fileno in events:
-                    # new data is ready to read
-                    if fileno == self.stdout_fileno:
-                        self.gdb_process.stdout.flush()
-                        raw_output = self.gdb_process.stdout.read()
-                        stream = 'stdout'
-
-                    elif fileno == self.stderr_fileno:
-                        self.gdb_process.stderr.flush()
-                        raw_output = self.gdb_process.stderr.read()
-                        stream = 'stderr'
+            if timeout_time_sec is None:
+                new_responses, reached_eof = self._read_available_output(None, verbose, include_prompts=True)
+            else:
+                new_responses, reached_eof = self._read_available_output(max(0, timeout_time_sec - time.time()),
+                                                                         verbose, include_prompts=True)
+            collector.add(new_responses)
 
-                    else:
-                        self.mutex.release()
-                        raise ValueError('Developer error. Got unexpected file number %d' % fileno)
+            if collector.is_complete(blocking_call, wait_for_result):
+                break
 
-                    responses.extend(self._get_responses_list(raw_output, stream, verbose))
+            elif reached_eof:
+                break
 
-            except IOError:  # only occurs in python 2.7
-                pass
+            elif timeout_time_sec is not None and time.time() >= timeout_time_sec:
+                break
 
-            if blocking_call:
-                result_received = False
+    def _read_available_output(self, timeout_sec, verbose, include_prompts=False):
+        """Wait for gdb to write output, then read and parse all output that is available. Unix only.
+        Args:
+            timeout_sec (float): Maximum time to wait for output. None to wait until there is output.
+            verbose (bool): add verbose output when true
+            include_prompts (bool): Include _GDB_PROMPT in the responses for each (gdb) prompt
+        Returns:
+            (list of parsed responses, True if gdb closed its output pipes)
+        """
+        events = self._wait_for_output(timeout_sec)
+
+        responses = []
+        reached_eof = False
+        try:
+            for fileno in events:
+                # new data is ready to read
+                if fileno == self.stdout_fileno:
+                    self.gdb_process.stdout.flush()
+                    raw_output = self.gdb_process.stdout.read()
+                    stream = 'stdout'
+
+                elif fileno == self.stderr_fileno:
+                    self.gdb_process.stderr.flush()
+                    raw_output = self.gdb_process.stderr.read()
+                    stream = 'stderr'
 
-                if wait_for_result:
-                    for response in responses:
-                        if response['type'] == 'result':
-                            result_received = True
                 else:
-                    result_received = True
+                    raise ValueError('Developer error. Got unexpected file number %d' % fileno)
 
-                if result_received:
-                    break
+                if raw_output == b'':
+                    # gdb closed the pipe, no more output will ever arrive
+                    reached_eof = True
+                    if self._recorder is not None:
+                        self._recorder.record(stream, raw_output)
+                responses.extend(self._get_responses_list(raw_output, stream, verbose, include_prompts))
 
-            elif timeout_sec == 0:  # just exit immediately
-                break
+        except IOError:  # only occurs in python 2.7
+            pass
 
-            elif time.time() > timeout_time_sec:
-                break
+        return responses, reached_eof
 
-        return responses
+    def _wait_for_output(self, timeout_sec):
+        """Sleep until gdb's stdout or stderr has output to read
+        Args:
+            timeout_sec (float): Maximum time to sleep for. None to sleep until there is output.
+        Returns:
+            List of file numbers that are ready to read, which is empty if the timeout was reached
+        """
+        if self._selector is not None:
+            return [key.fd for key, _ in self._selector.select(timeout_sec)]
+        else:
+            events, _, _ = select.select(self.read_list, [], [], timeout_sec)
+            return events
 
-    def _get_responses_list(self, raw_output, stream, verbose):
-        """Get parsed response list from string output
+    def _get_responses_list(self, raw_output, stream, verbose, include_prompts=False):
+        """Get parsed response list from raw output
         Args:
-            raw_output (unicode): gdb output to parse
+            raw_output (bytes): gdb output to parse
             stream (str): either stdout or stderr
             verbose (bool): add verbose output when true
+            include_prompts (bool): Include _GDB_PROMPT in the list, in order, for each (gdb) prompt
         """
         responses = []
 
-        raw_output, self._incomplete_output[stream] = _buffer_incomplete_responses(raw_output, self._incomplete_output.get(stream))
-
-        if not raw_output:
-            return responses
-
-        response_list = list(filter(lambda x: x, raw_output.decode().split('\n')))  # remove blank lines
+        if self._recorder is not None and raw_output:
+            self._recorder.record(stream, raw_output)
 
         # parse each response from gdb into a dict, and store in a list
-        for response in response_list:
-            if gdbmiparser.response_is_finished(response):
-                pass
+        for parsed_response in self._parse_output(raw_output, stream):
+            if parsed_response is _GDB_PROMPT:
+                if include_prompts:
+                    responses.append(_GDB_PROMPT)
             else:
-                parsed_response = gdbmiparser.parse_response(response)
                 parsed_response['stream'] = stream
 
-                responses.append(parsed_response)
                 if verbose:
                     pprint(parsed_response)
+                if self._subscribers:
+                    self._publish(parsed_response)
+                if not (self._pending_commands and self._add_response_to_pending_command(parsed_response)):
+                    responses.append(parsed_response)
 
         return responses
 
+    def _parse_output(self, raw_output, stream):
+        """Parse the records of raw output that were completed by it
+        Returns: List of parsed responses, with _GDB_PROMPT in place of each (gdb) prompt"""
+        if self.incremental_parsing:
+            parser = self._incremental_parsers.get(stream)
+            if parser is None:
+                parser = self._incremental_parsers[stream] = gdbmiparser.IncrementalParser(self.value_cache,
+                                                                                           self.field_types)
+            parser.feed(raw_output)
+            parsed_responses = []
+            for parsed_response in parser.records():
+                if parsed_response['type'] == 'done':
+                    parsed_responses.append(_GDB_PROMPT)
+                elif self.as_records:
+                    parsed_responses.append(gdbmiparser.MiRecord.from_response(parsed_response))
+                else:
+                    parsed_responses.append(parsed_response)
+            return parsed_responses
+
+        framer = self._incomplete_output.get(stream)
+        if framer is None:
+            framer = self._incomplete_output[stream] = _LineFramer()
+
+        parsed_responses = []
+        for response in framer.feed(raw_output):
+            if not response:
+                # skip blank lines
+                pass
+            elif gdbmiparser.response_is_finished(response):
+                parsed_responses.append(_GDB_PROMPT)
+            else:
+                parsed_responses.append(gdbmiparser.parse_response(response, lazy_payload=self.lazy_payload,
+                                                                   as_record=self.as_records,
+                                                                   value_cache=self.value_cache,
+                                                                   field_types=self.field_types))
+        return parsed_responses
+
+    def _add_response_to_pending_command(self, response):
+        """Store a response in the future of the command it belongs to. gdb handles commands in the
+        order they are written, so responses belong to the oldest command that is still waiting for its
+        result record. A result record with a pending command's token completes that command.
+        Result records without a token, or with a token no pending command has, are the results of
+        commands written with write, so they are left for the caller that is reading them, and so are
+        the responses of abandoned commands.
+        Returns: True if the response was stored, False if no command is pending, it is another command's
+        result, or it belongs to an abandoned command"""
+        with self._pending_commands_lock:
+            if not self._pending_commands:
+                return False
+            if response['type'] == 'result':
+                future = self._pending_commands.pop(response.get('token'), None)
+                if future is None or future._abandoned:
+                    return False
+                future.responses.append(response)
+                future._result = response
+                future._done_event.set()
+            else:
+                oldest_future = next(iter(self._pending_commands.values()))
+                if oldest_future._abandoned:
+                    return False
+                oldest_future.responses.append(response)
+            return True
+
     def exit(self):
         """Terminate gdb process
         Returns: None"""
         if self.gdb_process:
             self.gdb_process.terminate()
+            if self._reader_thread is not None:
+                # the reader thread exits once it sees the pipes close
+                self._reader_thread.join(DEFAULT_GDB_TIMEOUT_SEC)
         self.gdb_process = None
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        if self._recorder is not None:
+            self._recorder.close()
         return None
 
 
-def _buffer_incomplete_responses(raw_output, buf):
-    """It is possible for some of gdb's output to be read before it completely finished its response.
-    In that case, a partial mi response was read, which cannot be parsed into structured data.
-    We want to ALWAYS parse complete mi records. To do this, we store a buffer of gdb's
-    output if gdb did not tell us it finished.
+def _get_gdb_cmd(gdb_path, gdb_args):
+    """Find the gdb executable, and build the command that runs it
+    Args:
+        gdb_path (str): Command to run in shell to spawn new gdb subprocess
+        gdb_args (list): Arguments to pass to shell when spawning new gdb subprocess
+    Returns:
+        (absolute path to gdb, list of the command to run gdb)
+    Raises:
+        ValueError if gdb_path is empty or the executable can't be found
+    """
+    if not gdb_path:
+        raise ValueError('a valid path to gdb must be specified')
+    abs_gdb_path = find_executable(gdb_path)
+    if abs_gdb_path is None:
+        raise ValueError('gdb executable could not be resolved from "%s"' % gdb_path)
+    return abs_gdb_path, [abs_gdb_path] + gdb_args
+
+
+def _acquire_lock(lock, timeout_sec):
+    """Acquire a threading lock, waiting at most timeout_sec, or as long as it takes if timeout_sec is None
+    Returns: True if the lock was acquired"""
+    if timeout_sec is None:
+        return lock.acquire()
+    elif PYTHON3:
+        return lock.acquire(True, timeout_sec)
+
+    # python 2 locks can't wait with a timeout
+    timeout_time_sec = time.time() + timeout_sec
+    while not lock.acquire(False):
+        if time.time() >= timeout_time_sec:
+            return False
+        time.sleep(LOCK_POLL_SEC)
+    return True
+
+
+class _ResponseCollector():
+    """Collects the responses gdb writes for one call, and where (gdb) prompts were read between them,
+    to tell when gdb's response is complete.
+
+    gdb's output for a command is any number of async and stream records, the command's result
+    record, and a (gdb) prompt, so the result record followed by a prompt is the end of the response.
+    Output that isn't a response to a command, such as gdb's startup output or async records written
+    while the inferior runs, also ends with a prompt, so when the number of commands written is
+    known, only their result records end the response.
 
     Args:
-        raw_output: Contents of the packet
-        buf (str): Buffered gdb response from the past. This is incomplete and needs to be prepended to
-        gdb's next output.
+        num_results (int): Number of result records that complete the response, or None if unknown
+    """
 
-    Returns:
-        (raw_output, buf)
+    def __init__(self, num_results=None):
+        self.num_results = num_results
+        self.responses = []
+        # whether a (gdb) prompt was read after the last response
+        self.prompt_after_last_response = False
+        # whether a (gdb) prompt was read after the last result record
+        self.prompt_after_result = False
+        self.results_received = 0
+
+    def add(self, responses_and_prompts):
+        """Add responses, and _GDB_PROMPT for each (gdb) prompt, in the order they were read"""
+        for response in responses_and_prompts:
+            if response is _GDB_PROMPT:
+                self.prompt_after_last_response = True
+                self.prompt_after_result = self.results_received != 0
+            else:
+                self.prompt_after_last_response = False
+                if response['type'] == 'result':
+                    self.results_received += 1
+                    self.prompt_after_result = False
+                self.responses.append(response)
+
+    def is_complete(self, blocking_call, wait_for_result):
+        """Determine whether to stop waiting for more of gdb's response
+
+        Args:
+            blocking_call (bool): Any response at all is enough, unless num_results is known
+            wait_for_result (bool): Only result records are enough, without the prompt that follows them
+        Returns:
+            True if the response is complete: num_results result records, the last one followed
+            by a (gdb) prompt. If num_results is None, a result record followed by a (gdb) prompt,
+            or any responses followed by a (gdb) prompt.
+        """
+        if self.num_results is not None:
+            return self.results_received >= self.num_results and (wait_for_result or self.prompt_after_result)
+        elif wait_for_result:
+            return self.results_received != 0
+        elif blocking_call:
+            return len(self.responses) != 0
+        else:
+            return len(self.responses) != 0 and (self.prompt_after_result or self.prompt_after_last_response)
+
+
+class _LineFramer():
+    """It is possible for some of gdb's output to be read before it completely finished its response.
+    In that case, a partial mi response was read, which cannot be parsed into structured data.
+    We want to ALWAYS parse complete mi records. To do this, output after the last newline
+    is stored in a bytearray until the rest of its line arrives.
+
+    Only the bytes of complete lines are decoded, and bytes that were already searched for a
+    newline are not searched again, so the cost of framing stays linear in the number of bytes
+    read even when a single line arrives over many reads.
     """
 
-    # save partial packets for future calls instead of discarding them
-    if raw_output:
-        if buf:
-            raw_output = b''.join([buf, raw_output])
-            buf = None
+    def __init__(self):
+        self._buf = bytearray()
+        # number of bytes at the start of _buf that are known not to contain a newline
+        self._scanned = 0
 
-        if b'\n' not in raw_output:
-            buf = raw_output
-            raw_output = None
+    def feed(self, raw_output):
+        """Add output read from gdb
+        Args:
+            raw_output (bytes): Contents of the packet. Can be None or empty.
+        Returns:
+            List of complete lines (str) that are now available, without their newlines
+        """
+        if not raw_output:
+            return []
 
-        elif not raw_output.endswith(b'\n'):
-            remainder_offset = raw_output.rindex(b'\n') + 1
-            buf = raw_output[remainder_offset:]
-            raw_output = raw_output[:remainder_offset]
+        self._buf += raw_output
+        end = self._buf.rfind(b'\n', self._scanned)
+        if end == -1:
+            self._scanned = len(self._buf)
+            return []
 
-    return (raw_output, buf)
+        # Decode everything up to and including the last newline
+        end += 1
+        if PYTHON3:
+            with memoryview(self._buf) as view:
+                text = str(view[:end], 'utf-8')
+        else:
+            text = bytes(self._buf[:end]).decode('utf-8')
+        # Deleting from the front of a bytearray does not move the remaining bytes
+        del self._buf[:end]
+        self._scanned = 0
+
+        lines = text.split('\n')
+        lines.pop()  # text ends with a newline, so the last item is always empty
+        return lines
+
+    def incomplete(self):
+        """Returns: bytes of the line that has not been completed yet, or None if there are none"""
+        return bytes(self._buf) if self._buf else None
 
 
 def _make_non_blocking(file_obj):
@@ -0,0 +1,185 @@
+"""GdbControllerPool class to reuse warm gdb subprocesses across many debugging jobs"""
+
+import time
+import threading
+from contextlib import contextmanager
+from pygdbmi.gdbcontroller import GdbController, NoGdbProcessError, GdbTimeoutError, DEFAULT_GDB_TIMEOUT_SEC
+from pygdbmi.micommands import check_result
+
+# Commands written to gdb when a controller is checked in, to return it to the state
+# of a freshly started gdb: kill the inferior, delete breakpoints, and unload the executable.
+# Unlike kill, 'kill inferiors' only warns if the inferior isn't running, rather than failing.
+DEFAULT_RESET_COMMANDS = ['kill inferiors 1', '-break-delete', '-file-exec-and-symbols']
+
+
+class _ResetError(ValueError):
+    """Raised when gdb responds to a reset command with an error"""
+    pass
+
+
+class GdbControllerPool():
+    """
+    Keep a number of gdb subprocesses running so jobs don't pay gdb's startup cost.
+    Controllers are checked out for a job and checked back in afterwards, at which point
+    gdb is reset so the next job starts from a clean state.
+
+    Args:
+        size (int): Number of idle gdb subprocesses to keep running. All are started right away.
+        max_idle_sec (float): Exit gdb subprocesses that have been idle for longer than this.
+        None to keep them running until the pool is closed. There is no timer: idle controllers are
+        only exited by checkout, checkin and evict_idle, so call evict_idle periodically to exit them
+        while the pool isn't used.
+        reset_commands (list): Commands written to gdb when a controller is checked in
+        reset_timeout_sec (float): Maximum time to wait for gdb to finish the reset commands.
+        Controllers that take longer, or for which any reset command fails, are exited instead
+        of being reused.
+        **controller_kwargs: Arguments passed to GdbController, such as gdb_path and gdb_args
+    Returns:
+        New GdbControllerPool object
+    """
+
+    def __init__(self, size=4, max_idle_sec=None, reset_commands=DEFAULT_RESET_COMMANDS,
+                 reset_timeout_sec=DEFAULT_GDB_TIMEOUT_SEC, **controller_kwargs):
+        if size < 0:
+            raise ValueError('size must be >= 0')
+        self.size = size
+        self.max_idle_sec = max_idle_sec
+        self.reset_commands = list(reset_commands)
+        self.reset_timeout_sec = reset_timeout_sec
+        self.controller_kwargs = controller_kwargs
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # (controller, time it was checked in) for each idle controller, most recently used last
+        self._idle = []
+        for _ in range(size):
+            self._idle.append((self._spawn(), time.time()))
+
+    def checkout(self):
+        """Get a running gdb controller for exclusive use until it is checked in.
+        Idle controllers whose gdb subprocess has died are replaced. If there are no idle
+        controllers, a new one is started.
+
+        Returns:
+            GdbController
+        Raises:
+            ValueError if the pool is closed
+        """
+        self.evict_idle()
+        while True:
+            with self.lock:
+                if self.closed:
+                    raise ValueError('pool is closed')
+                if not self._idle:
+                    break
+                gdbmi, _ = self._idle.pop()
+
+            try:
+                gdbmi.verify_valid_gdb_subprocess()
+                return gdbmi
+            except NoGdbProcessError:
+                gdbmi.exit()
+                self._replace_dead_controller()
+
+        return self._spawn()
+
+    def checkin(self, gdbmi):
+        """Return a controller to the pool. The callbacks subscribed by the job are unsubscribed, the
+        commands it wrote with send that are still waiting for their result are abandoned (see
+        GdbCommandFuture.result), gdb is reset with reset_commands, and the controller is kept for the
+        next job if it is still healthy and the pool isn't already full. Controllers that can't be reset
+        are exited and replaced.
+
+        Args:
+            gdbmi (GdbController): Controller returned by checkout
+        Returns: None
+        """
+        try:
+            self._reset(gdbmi)
+        except (NoGdbProcessError, GdbTimeoutError, _ResetError):
+            gdbmi.exit()
+            self._replace_dead_controller()
+            return
+
+        with self.lock:
+            if not self.closed and len(self._idle) < self.size:
+                self._idle.append((gdbmi, time.time()))
+                gdbmi = None
+        if gdbmi is not None:
+            gdbmi.exit()
+        self.evict_idle()
+
+    @contextmanager
+    def controller(self):
+        """Check out a controller for the duration of a with statement, and check it in afterwards
+
+            with pool.controller() as gdbmi:
+                gdbmi.write('-file-exec-and-symbols a.out')
+        """
+        gdbmi = self.checkout()
+        try:
+            yield gdbmi
+        finally:
+            self.checkin(gdbmi)
+
+    def evict_idle(self):
+        """Exit gdb subprocesses that have been idle for longer than max_idle_sec
+        Returns: Number of controllers that were exited"""
+        if self.max_idle_sec is None:
+            return 0
+
+        oldest_allowed_time = time.time() - self.max_idle_sec
+        with self.lock:
+            evicted = [gdbmi for gdbmi, checkin_time in self._idle if checkin_time < oldest_allowed_time]
+            self._idle = [(gdbmi, checkin_time) for gdbmi, checkin_time in self._idle if checkin_time >= oldest_allowed_time]
+        for gdbmi in evicted:
+            gdbmi.exit()
+        return len(evicted)
+
+    def num_idle(self):
+        """Returns: Number of idle controllers ready to be checked out"""
+        with self.lock:
+            return len(self._idle)
+
+    def close(self):
+        """Exit all idle gdb subprocesses. Controllers checked in afterwards are exited.
+        Returns: None"""
+        with self.lock:
+            self.closed = True
+            idle, self._idle = self._idle, []
+        for gdbmi, _ in idle:
+            gdbmi.exit()
+
+    def _spawn(self):
+        """Start a new gdb subprocess"""
+        return GdbController(**self.controller_kwargs)
+
+    def _replace_dead_controller(self):
+        """Start a new gdb subprocess in place of one that died, if the pool is not full"""
+        with self.lock:
+            if self.closed or len(self._idle) >= self.size:
+                return
+        gdbmi = self._spawn()
+        with self.lock:
+            if not self.closed and len(self._idle) < self.size:
+                self._idle.append((gdbmi, time.time()))
+                gdbmi = None
+        if gdbmi is not None:
+            gdbmi.exit()
+
+    def _reset(self, gdbmi):
+        """Reset the controller's session (see GdbController.reset_session), write reset_commands to gdb
+        and wait for their results. Leftover output is discarded.
+        Raises:
+            NoGdbProcessError if gdb is not running
+            GdbTimeoutError if gdb doesn't finish in time
+            _ResetError if gdb responds to any of the commands with an error
+        """
+        # callbacks and futures of the previous job must not see the output of the next one
+        gdbmi.reset_session()
+        gdbmi.verify_valid_gdb_subprocess()
+        futures = gdbmi.send_batch(self.reset_commands)
+        timeout_time_sec = time.time() + self.reset_timeout_sec
+        for command, future in zip(self.reset_commands, futures):
+            check_result(future.result(timeout_sec=max(0, timeout_time_sec - time.time())), command, _ResetError)
+        gdbmi.get_gdb_response(timeout_sec=0, raise_error_on_timeout=False)
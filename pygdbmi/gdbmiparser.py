@@ -9,12 +9,20 @@ See more at https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI.html#GDB_002fMI
 """
 
 
+import codecs
 import re
-from pygdbmi.printcolor import print_cyan, print_red, print_green
+from pygdbmi.printcolor import print_green
 from pprint import pprint
 
+try:
+    from pygdbmi import _gdbmiparser as _accelerator
+except ImportError:
+    # The C implementation of the parser is optional (see setup.py)
+    _accelerator = None
 
-def parse_response(gdb_mi_text):
+
+def parse_response(gdb_mi_text, lazy_payload=False, as_record=False, value_cache=None, fields=None,
+                   field_types=None):
     """Parse gdb mi text and turn it into a dictionary.
 
     See https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI-Stream-Records.html#GDB_002fMI-Stream-Records
@@ -22,22 +30,50 @@ def parse_response(gdb_mi_text):
 
     Args:
         gdb_mi_text (str): String output from gdb
+        lazy_payload (bool): Don't parse the payload of notify and result records until it
+        is used. See LazyPayloadResponse.
+        as_record (bool): Return a MiRecord instead of a dict
+        value_cache (ValueCache): Cache used to share equal string values of payloads
+        between records. Keys of payloads are always shared.
+        fields (list): Paths of the parts of the payload of notify and result records to parse,
+        such as ['frame.addr', 'frame.func', 'thread-id']. Other parts are skipped over without
+        being parsed. Keys in a path are separated by '.', and arrays are transparent, so
+        'stack.func' selects the function of every frame in a backtrace. A path can end at a dict
+        or array to select all of it. None to parse the entire payload. When given, lazy_payload
+        is ignored since there is little left to parse.
+        field_types (dict): Functions to convert the string values of keys of the payload with,
+        by key, such as DEFAULT_FIELD_TYPES. Values are converted wherever their key appears in
+        the payload. Values that can't be converted (ValueError) are left as strings.
 
     Returns:
-        dict with the following keys:
+        dict (or MiRecord) with the following keys:
         type (either 'notify', 'result', 'console', 'log', 'target', 'done'),
         message (str or None),
         payload (str, list, dict, or None)
     """
+    if as_record:
+        return MiRecord.from_response(parse_response(gdb_mi_text, lazy_payload, value_cache=value_cache,
+                                                     fields=fields, field_types=field_types))
+
+    projection = _get_projection(fields) if fields is not None else None
+
+    if lazy_payload and projection is None:
+        if _GDB_MI_NOTIFY_RE.match(gdb_mi_text):
+            return _get_lazy_payload_response('notify', _GDB_MI_NOTIFY_RE, gdb_mi_text,
+                                              value_cache, field_types)
+        elif _GDB_MI_RESULT_RE.match(gdb_mi_text):
+            return _get_lazy_payload_response('result', _GDB_MI_RESULT_RE, gdb_mi_text,
+                                              value_cache, field_types)
+
     if _GDB_MI_NOTIFY_RE.match(gdb_mi_text):
-        token, message, payload = _get_notify_msg_and_payload(gdb_mi_text)
+        token, message, payload = _get_notify_msg_and_payload(gdb_mi_text, value_cache, projection, field_types)
         return {'type': 'notify',
                 'message': message,
                 'payload': payload,
                 'token'  : token}
 
     elif _GDB_MI_RESULT_RE.match(gdb_mi_text):
-        token, message, payload = _get_result_msg_and_paylod(gdb_mi_text)
+        token, message, payload = _get_result_msg_and_paylod(gdb_mi_text, value_cache, projection, field_types)
         return {'type': 'result',
                 'message': message,
                 'payload': payload,
@@ -80,6 +116,473 @@ def response_is_finished(gdb_mi_text):
         return False
 
 
+class LazyPayloadResponse(dict):
+    """A parsed notify or result record whose payload is parsed the first time it is used.
+
+    The record's type, message and token are available right away. The text of the payload
+    is kept, and parsed (once) when the 'payload' key is accessed, or when the record is
+    used as a whole, such as when it is compared, printed, copied or iterated over. Filtering
+    records by type or message therefore costs nothing for records that are skipped.
+    """
+
+    def __init__(self, response_type, message, token, gdb_mi_text, payload_start, value_cache=None,
+                 field_types=None):
+        dict.__init__(self, type=response_type, message=message, token=token)
+        self._gdb_mi_text = gdb_mi_text
+        self._payload_start = payload_start
+        # arguments of _parse_payload
+        self._parse_options = (value_cache, field_types)
+
+    def is_payload_parsed(self):
+        """Returns: True if the payload has been parsed"""
+        return self._gdb_mi_text is None
+
+    def _parse_payload(self):
+        """Parse the payload and store it under the 'payload' key, if it hasn't been already"""
+        if self._gdb_mi_text is not None:
+            self._set_payload(_parse_payload(self._gdb_mi_text, self._payload_start, *self._parse_options))
+
+    def _set_payload(self, payload):
+        """Add the 'payload' key before the keys that follow it in the dicts parse_response returns,
+        so the order of the keys is the same as when the payload is parsed eagerly"""
+        later = [(key, dict.pop(self, key)) for key in list(dict.keys(self)) if key not in ('type', 'message')]
+        dict.__setitem__(self, 'payload', payload)
+        for key, value in later:
+            dict.__setitem__(self, key, value)
+        self._gdb_mi_text = None
+        self._parse_options = None
+
+    def __missing__(self, key):
+        if key == 'payload' and self._gdb_mi_text is not None:
+            self._parse_payload()
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key == 'payload':
+            self._parse_payload()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return (key == 'payload' and self._gdb_mi_text is not None) or dict.__contains__(self, key)
+
+    def __len__(self):
+        return dict.__len__(self) + (0 if self._gdb_mi_text is None else 1)
+
+    def __setitem__(self, key, value):
+        if key == 'payload' and self._gdb_mi_text is not None:
+            # the new value replaces the payload that would have been parsed
+            self._set_payload(value)
+        else:
+            dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if key == 'payload':
+            self._parse_payload()
+        dict.__delitem__(self, key)
+
+
+class ValueCache():
+    """Bounded cache of the string values of payloads, so values that are repeated in many
+    records, such as file names, addresses, and "y", are stored once instead of once per record.
+
+    When the cache is full it is emptied and starts over, like the re module's cache
+    of compiled patterns, which is cheaper than tracking which values are used most.
+
+    Args:
+        max_size (int): Maximum number of values in the cache
+        max_length (int): Length of the longest value to cache. Longer values
+        are rarely repeated, so they aren't worth hashing.
+    """
+
+    def __init__(self, max_size=4096, max_length=128):
+        self.max_size = max_size
+        self.max_length = max_length
+        self._values = {}
+
+    def get(self, value):
+        """Returns: The cached string equal to value, or value after adding it to the cache"""
+        if len(value) > self.max_length:
+            return value
+        values = self._values
+        cached = values.get(value)
+        if cached is None:
+            if len(values) >= self.max_size:
+                values.clear()
+            values[value] = cached = value
+        return cached
+
+    def __len__(self):
+        return len(self._values)
+
+
+class MiRecord(object):
+    """A parsed gdb mi record that uses much less memory than the equivalent dict.
+
+    Fields are stored in __slots__, and can be read as attributes (record.payload) or,
+    for compatibility with code written for dicts, as keys (record['payload']). Like the
+    dicts returned by parse_response, 'token' is only present for notify and result records,
+    and 'stream' only once it has been set. No other keys can be set.
+    """
+    __slots__ = ('type', 'message', '_payload', 'token', 'stream', '_gdb_mi_text', '_payload_start', '_parse_options')
+
+    # keys of the mapping interface, in the order of the keys of parse_response's dicts
+    FIELDS = ('type', 'message', 'payload', 'token', 'stream')
+
+    def __init__(self, response_type, message=None, payload=None):
+        self.type = response_type
+        self.message = message
+        self._payload = payload
+        self._gdb_mi_text = None
+        self._payload_start = 0
+        self._parse_options = None
+
+    @classmethod
+    def from_response(cls, response):
+        """Create a record from a dict returned by parse_response. A LazyPayloadResponse
+        whose payload hasn't been parsed yet gives a record whose payload is parsed lazily too.
+        Returns: MiRecord"""
+        record = cls(response['type'], response['message'])
+        if isinstance(response, LazyPayloadResponse) and not response.is_payload_parsed():
+            record._gdb_mi_text = response._gdb_mi_text
+            record._payload_start = response._payload_start
+            record._parse_options = response._parse_options
+        else:
+            record._payload = response['payload']
+        if 'token' in response:
+            record.token = response['token']
+        if 'stream' in response:
+            record.stream = response['stream']
+        return record
+
+    @property
+    def payload(self):
+        if self._gdb_mi_text is not None:
+            self._payload = _parse_payload(self._gdb_mi_text, self._payload_start, *self._parse_options)
+            self._gdb_mi_text = None
+            self._parse_options = None
+        return self._payload
+
+    @payload.setter
+    def payload(self, value):
+        self._payload = value
+        self._gdb_mi_text = None
+        self._parse_options = None
+
+    def to_dict(self):
+        """Returns: dict with the same keys and values, as returned by parse_response"""
+        return dict(self.items())
+
+    def __getitem__(self, key):
+        if key in MiRecord.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in MiRecord.FIELDS:
+            raise KeyError('MiRecord has no field %s' % repr(key))
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self or key == 'payload':
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        # 'payload' is always set, and checking it with hasattr would parse a lazy payload
+        return key == 'payload' or (key in MiRecord.FIELDS and hasattr(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in MiRecord.FIELDS if key in self]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (MiRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'MiRecord(%s)' % repr(self.to_dict())
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in MiRecord.__slots__ if hasattr(self, name))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+def _make_payload_parsing_method(name):
+    """Wrap a dict method so the payload is parsed before it is called"""
+    method = getattr(dict, name)
+
+    def parse_payload_then_call(self, *args, **kwargs):
+        self._parse_payload()
+        return method(self, *args, **kwargs)
+    parse_payload_then_call.__name__ = name
+    return parse_payload_then_call
+
+
+# dict methods that use all keys or values, so they need the payload to be parsed
+for _name in ['keys', 'values', 'items', '__iter__', '__eq__', '__ne__', '__repr__', 'copy', 'pop',
+              'popitem', 'setdefault', 'update', '__reduce_ex__',
+              'iterkeys', 'itervalues', 'iteritems', 'viewkeys', 'viewvalues', 'viewitems']:  # python 2
+    if hasattr(dict, _name):
+        setattr(LazyPayloadResponse, _name, _make_payload_parsing_method(_name))
+
+
+def parse_int(value):
+    """Convert a number in a gdb mi value, which is either decimal or hexadecimal with a leading 0x
+    Returns: int
+    Raises: ValueError if value is not a number"""
+    if value.startswith('0x'):
+        return int(value, 16)
+    return int(value, 10)
+
+
+def parse_octal(value):
+    """Convert a number gdb formats in octal, such as exit-code="010" for exit status 8
+    Returns: int
+    Raises: ValueError if value is not an octal number"""
+    return int(value, 8)
+
+
+# Fields of gdb mi payloads that hold numbers, for parse_response's field_types.
+# Values that aren't numbers, such as addr="<PENDING>", thread-id="all" or
+# breakpoint location number="1.2", are left as strings.
+DEFAULT_FIELD_TYPES = {
+    'addr': parse_int,
+    'begin': parse_int,
+    'bkptno': parse_int,
+    'core': parse_int,
+    'current-thread-id': parse_int,
+    'depth': parse_int,
+    'end': parse_int,
+    'exit-code': parse_octal,
+    'has_more': parse_int,
+    'ignore': parse_int,
+    'level': parse_int,
+    'line': parse_int,
+    'new-thread-id': parse_int,
+    'number': parse_int,
+    'numchild': parse_int,
+    'offset': parse_int,
+    'pid': parse_int,
+    'thread-id': parse_int,
+    'times': parse_int,
+}
+
+
+class IncrementalParser():
+    """Parse gdb mi output as it is read, instead of once each line is complete.
+
+    Push chunks of raw output of any size with feed(), and get the records that were
+    completed with records(). The payload of a notify or result record is parsed as its
+    text arrives, with the parser's state kept between chunks, so the work of parsing a
+    record of many megabytes is done while gdb is still writing it rather than all at once
+    after its last byte is read. Each chunk is only scanned once, so the total cost is
+    linear in the size of the output no matter how it is split into chunks.
+
+    Records are exactly what parse_response returns for each complete line, except that
+    blank lines are skipped.
+
+        parser = IncrementalParser()
+        parser.feed(b'^done,value="4')
+        parser.records()  # []
+        parser.feed(b'2"\\n(gdb) \\n')
+        parser.records()  # [{'type': 'result', ... 'payload': {'value': '42'}}, {'type': 'done', ...}]
+
+    Args:
+        value_cache (ValueCache): Cache used to share equal string values of payloads between records
+        field_types (dict): Functions to convert values of payloads with, by key. See parse_response.
+    """
+
+    def __init__(self, value_cache=None, field_types=None):
+        self.value_cache = value_cache
+        self.field_types = field_types
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._records = []
+        self._start_line()
+
+    def feed(self, raw_output):
+        """Parse a chunk of gdb's output
+        Args:
+            raw_output (bytes): Output read from gdb. Can be None or empty.
+        Returns: None
+        """
+        if not raw_output:
+            return
+        text = self._decoder.decode(raw_output)
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if end == -1:
+                if start < len(text):
+                    self._feed_line(text[start:] if start else text, False)
+                return
+            self._feed_line(text[start:end], True)
+            start = end + 1
+
+    def records(self):
+        """Returns: List of the records that were completed since the last call, in order"""
+        records = self._records
+        self._records = []
+        return records
+
+    def _start_line(self):
+        # How the current line is parsed: None until its start shows whether it is a notify or
+        # result record with a payload, then _LINE_PAYLOAD for those, or _LINE_WHOLE for lines
+        # that are parsed by parse_response once they are complete
+        self._mode = None
+        self._line_pieces = []
+        self._header = None
+        self._builder = None
+        # text at the end of the previous chunk that may be the start of a longer key
+        self._partial_key = ''
+        # pieces of a c-string whose closing quote hasn't been read yet, or None
+        self._partial_string = None
+        self._partial_string_escaped = False
+
+    def _feed_line(self, text, end_of_line):
+        """Parse text from the current line, which is complete if end_of_line"""
+        if self._mode is None:
+            self._line_pieces.append(text)
+            line_start = ''.join(self._line_pieces)
+            match = _GDB_MI_PAYLOAD_HEADER_RE.match(line_start)
+            if match:
+                self._mode = _LINE_PAYLOAD
+                self._line_pieces = []
+                token, marker, message = match.groups()
+                self._header = ('result' if marker == '^' else 'notify', message, int(token) if token != '' else None)
+                self._builder = _PayloadBuilder(self.field_types)
+                self._feed_payload(line_start[match.end():], end_of_line)
+                return
+            elif end_of_line or not _GDB_MI_PARTIAL_PAYLOAD_HEADER_RE.match(line_start):
+                self._mode = _LINE_WHOLE
+                self._line_pieces = [line_start]
+        elif self._mode == _LINE_WHOLE:
+            self._line_pieces.append(text)
+        else:
+            self._feed_payload(text, end_of_line)
+            return
+
+        if end_of_line:
+            line = ''.join(self._line_pieces)
+            if line:
+                self._records.append(parse_response(line, value_cache=self.value_cache, field_types=self.field_types))
+            self._start_line()
+
+    def _feed_payload(self, text, end_of_line):
+        """Tokenize payload text and build the payload from its tokens, leaving a token that may
+        be continued by the next chunk for later"""
+        builder = self._builder
+        end = len(text)
+        i = 0
+        if self._partial_string is not None:
+            i = self._feed_partial_string(text, 0, end_of_line)
+            if i is None:
+                return
+        elif self._partial_key:
+            text = self._partial_key + text
+            end = len(text)
+            self._partial_key = ''
+
+        match_token = _GDB_MI_TOKEN_RE.match
+        get_cached_value = self.value_cache.get if self.value_cache is not None else None
+        while not builder.done:
+            match = match_token(text, i)
+            if match is None:
+                i = _GDB_MI_WHITESPACE_RE.match(text, i).end()
+                if i >= end:
+                    break
+                # a c-string that isn't closed in this chunk
+                self._partial_string = []
+                self._partial_string_escaped = False
+                i = self._feed_partial_string(text, i + 1, end_of_line)
+                if i is None:
+                    return
+                continue
+
+            string, punctuation, key = match.groups()
+            if string is not None:
+                string = _parse_str(string)
+                if get_cached_value is not None:
+                    string = get_cached_value(string)
+                builder.add(_TOKEN_STRING, string)
+            elif punctuation is not None:
+                builder.add(punctuation, punctuation)
+            elif match.end() == end and not end_of_line:
+                # the rest of the key may be in the next chunk
+                self._partial_key = key
+                return
+            else:
+                builder.add(_TOKEN_KEY, _intern(key))
+            i = match.end()
+
+        if end_of_line:
+            response_type, message, token = self._header
+            self._records.append({'type': response_type,
+                                  'message': message,
+                                  'payload': builder.finish(),
+                                  'token': token})
+            self._start_line()
+
+    def _feed_partial_string(self, text, i, end_of_line):
+        """Continue a c-string that started in an earlier chunk (or earlier in text) at text[i]
+        Returns: Index after the closing quote, or None if the string is not complete yet"""
+        end = len(text)
+        start = i
+        if self._partial_string_escaped and i < end:
+            # the previous chunk ended with a backslash, which escapes this character
+            i += 1
+            self._partial_string_escaped = False
+        i = _GDB_MI_STRING_BODY_RE.match(text, i).end()
+        if i < end and text[i] == _GDB_MI_CHAR_STRING_START:
+            self._partial_string.append(text[start:i])
+            string = _parse_str(''.join(self._partial_string))
+            if self.value_cache is not None:
+                string = self.value_cache.get(string)
+            self._partial_string = None
+            self._builder.add(_TOKEN_STRING, string)
+            return i + 1
+
+        self._partial_string.append(text[start:])
+        if end_of_line:
+            # String is missing its closing quote. Use everything up to the end, like _parse_dict.
+            self._builder.add(_TOKEN_STRING, _parse_str(''.join(self._partial_string)))
+            self._partial_string = None
+            return end
+        # a trailing backslash escapes the first character of the next chunk
+        self._partial_string_escaped = self._partial_string_escaped or i < end
+        return None
+
+
 def assert_match(actual_char_or_str, expected_char_or_str):
     """If values don't match, print them and raise a ValueError, otherwise,
     continue
@@ -138,242 +641,483 @@ _GDB_MI_TARGET_OUTPUT_RE = re.compile('@"(.*)"', re.DOTALL)
 # Response finished
 _GDB_MI_RESPONSE_FINISHED_RE = re.compile('^\(gdb\)\s*$')
 
-_WHITESPACE = [' ', '\t', '\r', '\n']
-
 _GDB_MI_CHAR_DICT_START = '{'
+_GDB_MI_CHAR_DICT_END = '}'
 _GDB_MI_CHAR_ARRAY_START = '['
+_GDB_MI_CHAR_ARRAY_END = ']'
 _GDB_MI_CHAR_STRING_START = '"'
-_GDB_MI_VALUE_START_CHARS = [_GDB_MI_CHAR_DICT_START, _GDB_MI_CHAR_ARRAY_START, _GDB_MI_CHAR_STRING_START]
-
 
-def _get_notify_msg_and_payload(result):
+# Token types that IncrementalParser adds to _PayloadBuilder, in addition to the punctuation
+# characters { } [ ] , = which are their own token type
+_TOKEN_KEY = 'key'
+_TOKEN_STRING = 'string'
+
+try:
+    from sys import intern as _intern
+except ImportError:  # python 2, where only str (not unicode) can be interned
+    def _intern(string):
+        return intern(string) if type(string) == str else string  # noqa: F821
+
+# A single token of a gdb mi payload, with optional leading whitespace.
+# Groups are a quoted c-string (without its quotes), a punctuation
+# character, or a key. Each alternative matches its entire run of characters
+# at once so the regex engine, not Python, walks the individual characters.
+_GDB_MI_TOKEN_RE = re.compile(r'\s*(?:'
+                              r'"([^"\\]*(?:\\.[^"\\]*)*)"|'
+                              r'([{}\[\],=])|'
+                              r'([^\s{}\[\],="]+))', re.DOTALL)
+
+# Patterns the parser matches at once instead of a token at a time. Each one skips the
+# tokens that _parse_dict, _parse_val or _parse_array ignore where it is used, so the
+# result is the same as parsing the tokens of _GDB_MI_TOKEN_RE one by one.
+# A member of a dict: an optional comma, a key, '=', and a c-string or the start of a dict or array
+_GDB_MI_MEMBER_RE = re.compile(r'\s*,?\s*([^\s{}\[\],="]+)\s*=\s*(?:'
+                               r'"([^"\\]*(?:\\.[^"\\]*)*)"|'
+                               r'([{\[]))', re.DOTALL)
+# The value after a key: a c-string or the start of a dict or array, after anything else
+_GDB_MI_VALUE_RE = re.compile(r'[^"{\[]*(?:'
+                              r'"([^"\\]*(?:\\.[^"\\]*)*)"|'
+                              r'([{\[]))', re.DOTALL)
+# An item of an array, or its end: a c-string or a bracket, after keys, commas and anything else
+_GDB_MI_ARRAY_ITEM_RE = re.compile(r'[^"{\[\]]*(?:'
+                                   r'"([^"\\]*(?:\\.[^"\\]*)*)"|'
+                                   r'([{\[\]]))', re.DOTALL)
+
+# A quoted c-string, or a run of characters that aren't brackets, commas or quotes,
+# within a value that is skipped over rather than parsed
+_GDB_MI_SKIP_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[^"{}\[\],]+', re.DOTALL)
+
+# Start of a notify or result record that has a payload: token, record type, message, and the comma
+# before the payload. It is followed by the payload, since .* in _GDB_MI_NOTIFY_RE and
+# _GDB_MI_RESULT_RE matches the rest of any line.
+_GDB_MI_PAYLOAD_HEADER_RE = re.compile(r'(\d*)([\^*=])(\S+?),')
+# Start of a line that can still become the start of _GDB_MI_PAYLOAD_HEADER_RE
+_GDB_MI_PARTIAL_PAYLOAD_HEADER_RE = re.compile(r'\d*(?:[\^*=]\S*)?$')
+# Pieces of _GDB_MI_TOKEN_RE, for IncrementalParser, which continues c-strings that
+# are split between chunks
+_GDB_MI_WHITESPACE_RE = re.compile(r'\s*')
+_GDB_MI_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+# Values of IncrementalParser._mode
+_LINE_PAYLOAD = 'payload'
+_LINE_WHOLE = 'whole line'
+
+# Kinds of the frames of _PayloadBuilder's stack
+_FRAME_DICT = 'dict'
+_FRAME_ARRAY = 'array'
+_FRAME_VALUE = 'value'
+
+# Projections built by _get_projection, by tuple of fields
+_projections = {}
+_MAX_CACHED_PROJECTIONS = 100
+
+
+def _get_notify_msg_and_payload(result, value_cache=None, projection=None, field_types=None):
     """Get notify message and payload dict"""
-    groups = _GDB_MI_NOTIFY_RE.match(result).groups()
+    match = _GDB_MI_NOTIFY_RE.match(result)
+    groups = match.groups()
     token  = int(groups[0]) if groups[0] != '' else None
     message = groups[1].strip()
-    result_of_status = groups[2].strip()
-    _, payload = _parse_dict(result_of_status)
+    payload = _parse_payload(result, match.start(3), value_cache, field_types, projection)
     return token, message, payload
 
 
-def _get_result_msg_and_paylod(result):
+def _get_lazy_payload_response(response_type, regex, result, value_cache=None, field_types=None):
+    """Get notify or result record with a payload that is parsed when it is used"""
+    match = regex.match(result)
+    groups = match.groups()
+    token = int(groups[0]) if groups[0] != '' else None
+    message = groups[1].strip()
+    if groups[2] is None:
+        return {'type': response_type,
+                'message': message,
+                'payload': None,
+                'token': token}
+    return LazyPayloadResponse(response_type, message, token, result, match.start(3), value_cache, field_types)
+
+
+def _get_result_msg_and_paylod(result, value_cache=None, projection=None, field_types=None):
     """Get result message and payload dict"""
-    groups = _GDB_MI_RESULT_RE.match(result).groups()
+    match = _GDB_MI_RESULT_RE.match(result)
+    groups = match.groups()
     token  = int(groups[0]) if groups[0] != '' else None
     message = groups[1]
     if groups[2] is None:
         payload = None
     else:
-        str_to_parse = groups[2].strip()
-        i, payload = _parse_dict(str_to_parse)
+        payload = _parse_payload(result, match.start(3), value_cache, field_types, projection)
     return token, message, payload
 
 
-def _parse_dict(to_parse):
+def _parse_payload(to_parse, i, value_cache=None, field_types=None, projection=None):
+    """Parse the payload of a notify or result record
+    Args:
+        to_parse (str): Text of the record
+        i (int): Index in to_parse where the payload starts
+        value_cache (ValueCache): Cache to share equal string values through, or None
+        field_types (dict): Functions to convert values with, by key, or None
+        projection (dict): Keys to parse (see _get_projection), or None to parse all keys
+    return (dict):
+        Parsed payload. The C implementation is used if it is available and value_cache isn't.
+        Its result is converted afterwards, since it parses all values as strings.
+    """
+    if _accelerator is not None and value_cache is None and not _DEBUG:
+        payload = _accelerator.parse_payload(to_parse, i, projection)
+        if field_types is not None:
+            _convert_fields(payload, field_types)
+        return payload
+    return _parse_dict(to_parse, i, value_cache, field_types, projection)[1]
+
+
+def _skip_value(to_parse, i):
+    """Find the end of a value without parsing it
+    Args:
+        to_parse (str): Text being parsed
+        i (int): Index in to_parse after the value's key
+    return (int):
+        Index of the ',', '}' or ']' that ends the value, or the end of to_parse
+    """
+    end = len(to_parse)
+    match_skipped = _GDB_MI_SKIP_RE.match
+    depth = 0
+    while i < end:
+        char = to_parse[i]
+        if char == ',' or char == _GDB_MI_CHAR_DICT_END or char == _GDB_MI_CHAR_ARRAY_END:
+            if depth == 0:
+                break
+            elif char != ',':
+                depth -= 1
+            i += 1
+        elif char == _GDB_MI_CHAR_DICT_START or char == _GDB_MI_CHAR_ARRAY_START:
+            depth += 1
+            i += 1
+        else:
+            match = match_skipped(to_parse, i)
+            if match is None:
+                # String is missing its closing quote, so it runs to the end
+                return end
+            i = match.end()
+    return i
+
+
+def _get_projection(fields):
+    """Turn paths of fields into a tree of the keys to parse
+    Args:
+        fields (list): Paths such as 'frame.addr'
+    return (dict):
+        Dict of keys to parse. The value of each key is the projection of its value,
+        or None to parse all of it.
+    """
+    key = tuple(fields)
+    projection = _projections.get(key)
+    if projection is None:
+        projection = {}
+        for field in fields:
+            node = projection
+            parts = field.split('.')
+            for part in parts[:-1]:
+                if part in node and node[part] is None:
+                    # all of this value is already selected
+                    break
+                node = node.setdefault(part, {})
+            else:
+                node[parts[-1]] = None
+        if len(_projections) >= _MAX_CACHED_PROJECTIONS:
+            _projections.clear()
+        _projections[key] = projection
+    return projection
+
+
+def _convert_fields(value, field_types):
+    """Convert the values of keys in field_types wherever they appear in a parsed value, as the
+    Python parser does while parsing
+    Args:
+        value: Parsed value (dict, list or str), which is modified in place
+        field_types (dict): Functions to convert values with, by key
+    """
+    if isinstance(value, dict):
+        for key, val in list(value.items()):
+            if isinstance(val, (dict, list)):
+                _convert_fields(val, field_types)
+            elif key in field_types:
+                value[key] = _convert_value(val, field_types[key])
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)):
+                _convert_fields(item, field_types)
+
+
+def _parse_dict(to_parse, i, value_cache=None, field_types=None, projection=None):
     """Parse dictionary, with optional starting character '{'
+    Args:
+        to_parse (str): Complete text being parsed
+        i (int): Index in to_parse to start parsing at
+        value_cache (ValueCache): Cache to share equal string values through, or None
+        field_types (dict): Functions to convert values with, by key, or None
+        projection (dict): Keys to parse (see _get_projection), or None to parse all keys
     return (tuple):
-        Number of characters parsed from to_parse
+        Index in to_parse after the closing '}', or the end of to_parse
         Parsed dictionary
     """
-    if _DEBUG:
-        print_red('obj')
-        print_red(to_parse)
-    i = 0
+    match_member = _GDB_MI_MEMBER_RE.match
+    match_token = _GDB_MI_TOKEN_RE.match
     obj = {}
-    while i < len(to_parse):
-        c = to_parse[i]
-        if c in _WHITESPACE:
-            pass
-        elif c in ['{', ',']:
-            pass
-        elif c == '}':
-            # end of object, exit loop
-            break
+    while True:
+        # most members are key="value" or key={...} or key=[...], which are matched at once
+        match = match_member(to_parse, i)
+        if match is not None:
+            key, string, opener = match.groups()
+            if projection is not None and key not in projection:
+                i, dict_ended = _skip_member(to_parse, match.end(1))
+                if dict_ended:
+                    break
+                continue
+            i = match.end()
+            if string is not None:
+                val = _parse_str(string)
+                if value_cache is not None:
+                    val = value_cache.get(val)
+            elif opener == _GDB_MI_CHAR_DICT_START:
+                i, val = _parse_dict(to_parse, i, value_cache, field_types,
+                                     projection[key] if projection is not None else None)
+            else:
+                i, val = _parse_array(to_parse, i, value_cache, field_types,
+                                      projection[key] if projection is not None else None)
         else:
-            chars_used, key, val = _parse_key_val(to_parse[i:])
-            i = i + chars_used
-            obj[key] = val
-        i += 1
+            # anything else is stepped over a token at a time
+            match = match_token(to_parse, i)
+            if match is None:
+                # only whitespace, or a string without its closing quote, is left
+                i = len(to_parse)
+                break
+            string, punctuation, key = match.groups()
+            if punctuation == _GDB_MI_CHAR_DICT_END:
+                # end of object, exit loop
+                i = match.end()
+                break
+            elif key is None:
+                # strings, '{', '[', ']', ',' and '=' need no handling
+                i = match.end()
+                continue
+            elif projection is not None and key not in projection:
+                i, dict_ended = _skip_member(to_parse, match.end())
+                if dict_ended:
+                    break
+                continue
+            i, val = _parse_val(to_parse, match.end(), value_cache, field_types,
+                                projection[key] if projection is not None else None)
+
+        key = _intern(key)
+        if field_types is not None and key in field_types:
+            val = _convert_value(val, field_types[key])
+        obj[key] = val
     if _DEBUG:
         print_green(obj)
     return i, obj
 
 
-def _parse_key_val(to_parse):
-    """Parse key, value combination
+def _skip_member(to_parse, i):
+    """Skip over the value of a key that isn't parsed, and the ',', '}' or ']' after it
+    Args:
+        to_parse (str): Text being parsed
+        i (int): Index in to_parse after the key
     return (tuple):
-        Number of characters parsed from to_parse
-        Parsed key (string)
-        Parsed value (either a string, array, or dict)
+        Index in to_parse after the character that ends the value, or the end of to_parse
+        True if the dict ends with the value
     """
-    if _DEBUG:
-        print_red('keyval')
-        print_red(to_parse)
-
-    i = 0
-    size, key = _parse_key(to_parse[i:])
-    i += size
-    size, val = _parse_val(to_parse[i:])
-    i += size
-    if _DEBUG:
-        print_green(key)
-        print_green(val)
-    return i, key, val
+    i = _skip_value(to_parse, i)
+    if i >= len(to_parse):
+        return i, True
+    return i + 1, to_parse[i] == _GDB_MI_CHAR_DICT_END
 
 
-def _parse_key(to_parse):
-    """Parse key, value combination
-    return (tuple):
-        Number of characters parsed from to_parse
-        Parsed key (string)
-    """
-    if _DEBUG:
-        print_red('key')
-        print_red(to_parse)
-
-    buf = ''
-    i = 0
-    key = ''
-    while i < len(to_parse) - 1:
-        c = to_parse[i]
-        if c == '=':
-            key = buf
-            # consume '=' sign so caller doesn't get it again
-            i += 1
-            break
-        buf += c
-        i += 1
-    if _DEBUG:
-        print_green(key)
-    return i, key
-
-
-def _parse_val(to_parse):
-    """Parse value from string
+def _parse_val(to_parse, i, value_cache=None, field_types=None, projection=None):
+    """Parse the value following a key
+    Args:
+        to_parse (str): Complete text being parsed
+        i (int): Index in to_parse after the key
+        value_cache (ValueCache): Cache to share equal string values through, or None
+        field_types (dict): Functions to convert values with, by key, or None
+        projection (dict): Keys of dicts in the value to parse, or None to parse all of it
     return (tuple):
-        Number of characters parsed from to_parse
+        Index in to_parse after the value
         Parsed value (either a string, array, or dict)
     """
-    if _DEBUG:
-        print_red('val')
-        print_red(to_parse)
-
-    i = 0
-    val = ''
-    buf = ''
-    while i < len(to_parse) - 1:
-        c = to_parse[i]
-
-        if c == '{':
+    # The '=' separating the key from its value, and anything else before it, needs no handling
+    match = _GDB_MI_VALUE_RE.match(to_parse, i)
+    if match is None:
+        val = _parse_unterminated_str(to_parse, i)
+        if val is None:
+            val = ''
+        i = len(to_parse)
+    else:
+        string, opener = match.groups()
+        i = match.end()
+        if string is not None:
+            val = _parse_str(string)
+            if value_cache is not None:
+                val = value_cache.get(val)
+        elif opener == _GDB_MI_CHAR_DICT_START:
             # Start object
-            size, val = _parse_dict(to_parse[i:])
-            i += size
-            break
-        elif c == '[':
-            # Start of an array
-            size, val = _parse_array(to_parse[i:])
-            i += size
-            break
-        elif c == '"':
-            # Start of a string
-            size, val = _parse_str(to_parse[i:])
-            i += size
-            break
+            i, val = _parse_dict(to_parse, i, value_cache, field_types, projection)
         else:
-            buf += c
-        i += 1
-
+            # Start of an array
+            i, val = _parse_array(to_parse, i, value_cache, field_types, projection)
     if _DEBUG:
         print_green(val)
     return i, val
 
 
-def _parse_array(to_parse):
+def _parse_array(to_parse, i, value_cache=None, field_types=None, projection=None):
     """Parse an array
+    Args:
+        to_parse (str): Complete text being parsed
+        i (int): Index in to_parse after the opening '['
+        value_cache (ValueCache): Cache to share equal string values through, or None
+        field_types (dict): Functions to convert values with, by key, or None
+        projection (dict): Keys of dicts in the array to parse, or None to parse all of them
     return (tuple):
-        Number of characters parsed from to_parse
+        Index in to_parse after the closing ']', or the end of to_parse
         Parsed array
     """
-    if _DEBUG:
-        print_red('array')
-        print_red(to_parse)
-
-    assert_match(_GDB_MI_CHAR_ARRAY_START, to_parse[0])
-
-    # Skip first open bracket so we don't end up in an
-    # endless loop trying to re-parse the array
-    i = 1
-
+    # Keys of lists of results (i.e. 'frame' in stack=[frame={},frame={}])
+    # are dropped, as are ',' and '=', by the start of _GDB_MI_ARRAY_ITEM_RE
+    match_item = _GDB_MI_ARRAY_ITEM_RE.match
     arr = []
-    while i < len(to_parse) - 1:
-        c = to_parse[i]
-
-        if c in _GDB_MI_VALUE_START_CHARS:
-            size, val = _parse_val(to_parse[i:])
+    while True:
+        match = match_item(to_parse, i)
+        if match is None:
+            string = _parse_unterminated_str(to_parse, i)
+            if string is not None:
+                arr.append(string)
+            i = len(to_parse)
+            break
+        string, bracket = match.groups()
+        i = match.end()
+        if string is not None:
+            string = _parse_str(string)
+            if value_cache is not None:
+                string = value_cache.get(string)
+            arr.append(string)
+        elif bracket == _GDB_MI_CHAR_DICT_START:
+            i, val = _parse_dict(to_parse, i, value_cache, field_types, projection)
             arr.append(val)
-            i += size
-        elif c in _WHITESPACE:
-            pass
-        elif c == ',':
-            pass
-        elif c == ']':
+        elif bracket == _GDB_MI_CHAR_ARRAY_START:
+            i, val = _parse_array(to_parse, i, value_cache, field_types, projection)
+            arr.append(val)
+        else:
             # Stop when this array has finished. Note
             # that elements of this array can be also be arrays.
             break
-        i += 1
     if _DEBUG:
         print_green(arr)
     return i, arr
 
 
-def _parse_str(to_parse):
-    """Parse a string
-    return (tuple):
-        Number of characters parsed from to_parse
-        Parsed string, without surrounding quotes
+def _parse_unterminated_str(to_parse, i):
+    """Parse what is left of to_parse when no token can be matched at i, which is either
+    whitespace, or a string that is missing its closing quote
+    return (str):
+        Everything after the opening quote, or None if there is no string
     """
+    quote = to_parse.find(_GDB_MI_CHAR_STRING_START, i)
+    if quote == -1:
+        return None
+    return _parse_str(to_parse[quote + 1:])
 
-    # characters that gdb escapes that should not be
-    # escaped by this parser
-    CHARS_TO_REMOVE_GDB_ESCAPE = ['"']
 
-    if _DEBUG:
-        print_red('string')
-        print_red(to_parse)
-
-    assert_match(_GDB_MI_CHAR_STRING_START, to_parse[0])
-    i = 1  # Skip the opening quote
-    buf = ''
-    while i < len(to_parse) - 1:
-        c = to_parse[i]
-        if _DEBUG:
-            print_cyan(c)
-
-        if c == '\\' and i < (len(to_parse) - 1):
-            # We are on a backslash and there is another character after the backslash
-            # to parse. Handle this case specially since gdb escaped it for us
-
-            # Get the next char that is being escaped
-            c2 = to_parse[i + 1]
-            if c2 in CHARS_TO_REMOVE_GDB_ESCAPE:
-                # only store the escaped character in the buffer; don't store the backslash
-                # (don't leave it escaped)
-                buf += to_parse[i + 1]
-            else:
-                # store the backslash and the following character in the buffer (leave it escaped)
-                buf += c + to_parse[i + 1]
+class _PayloadBuilder():
+    """Build a payload from tokens that are added one at a time, for IncrementalParser.
 
-            # consume the backslash and the next character
-            i += 2
+    This is _parse_dict, _parse_val and _parse_array with their recursion replaced by an
+    explicit stack, so parsing can stop when a chunk of text runs out and resume with the
+    next one. Each frame of the stack is [kind, dict or list being built, key of the value].
+    For all tokens, the result is the same as _parse_dict(...) for the text they were split from.
+    """
 
+    def __init__(self, field_types=None):
+        self.field_types = field_types
+        self.payload = {}
+        self._stack = [[_FRAME_DICT, self.payload, None]]
+        # set once the top level dict is closed. Tokens after that are ignored, like _parse_dict does.
+        self.done = False
+
+    def add(self, token_type, value):
+        """Add the next token of _GDB_MI_TOKEN_RE: (_TOKEN_KEY, key), (_TOKEN_STRING, string)
+        or a punctuation character as both token_type and value"""
+        frame = self._stack[-1]
+        kind = frame[0]
+        if kind == _FRAME_DICT:
+            if token_type == _TOKEN_KEY:
+                self._stack.append([_FRAME_VALUE, None, value])
+            elif token_type == _GDB_MI_CHAR_DICT_END:
+                self._end_frame()
+            # '{', ',', '=' and anything else are skipped, as in _parse_dict
+        elif token_type == _GDB_MI_CHAR_DICT_START:
+            self._stack.append([_FRAME_DICT, {}, None])
+        elif token_type == _GDB_MI_CHAR_ARRAY_START:
+            self._stack.append([_FRAME_ARRAY, [], None])
+        elif token_type == _TOKEN_STRING:
+            if kind == _FRAME_VALUE:
+                self._set_value(value)
+            else:
+                frame[1].append(value)
+        elif token_type == _GDB_MI_CHAR_ARRAY_END and kind == _FRAME_ARRAY:
+            self._end_frame()
+        # The '=' after a key, keys of lists of results, and ',' are skipped
+
+    def finish(self):
+        """Close everything that is still open, as _parse_dict does when the text ends
+        return (dict):
+            The payload
+        """
+        while not self.done:
+            if self._stack[-1][0] == _FRAME_VALUE:
+                # a key without a value
+                self._set_value('')
+            else:
+                self._end_frame()
+        return self.payload
+
+    def _end_frame(self):
+        """Pop the dict or array on top of the stack, and put it in the frame below"""
+        value = self._stack.pop()[1]
+        if not self._stack:
+            self.done = True
+        elif self._stack[-1][0] == _FRAME_VALUE:
+            self._set_value(value)
         else:
-            # Quote is closed. Exit (and don't include the end quote).
-            if c == '"':
-                break
-            buf += c
-            i += 1
+            self._stack[-1][1].append(value)
 
-    string = buf
-    if _DEBUG:
-        print_green(string)
-    return i, string
+    def _set_value(self, value):
+        """Pop the value frame on top of the stack, and set its key in the dict below"""
+        key = self._stack.pop()[2]
+        if self.field_types is not None and key in self.field_types:
+            value = _convert_value(value, self.field_types[key])
+        self._stack[-1][1][key] = value
+
+
+def _convert_value(value, convert):
+    """Convert a string value with a function of field_types
+    return:
+        Converted value, or value if it isn't a string or can't be converted
+    """
+    if isinstance(value, (dict, list)):
+        return value
+    try:
+        return convert(value)
+    except ValueError:
+        return value
+
+
+def _parse_str(string):
+    """Remove gdb's escaping from the contents of a c-string
+    Args:
+        string (str): Text between the quotes of a c-string
+    return (str):
+        Parsed string. Escaped quotes are unescaped, all other
+        escape sequences are left as-is.
+    """
+    if '\\' in string:
+        string = string.replace('\\"', '"')
+    return string
@@ -0,0 +1,302 @@
+"""MemoryCache class to read the inferior's memory through a page cache, with few round trips to gdb
+
+See https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI-Data-Manipulation.html
+"""
+
+import binascii
+import numbers
+import threading
+import time
+from pygdbmi.gdbcontroller import DEFAULT_GDB_TIMEOUT_SEC
+from pygdbmi.gdbmiparser import parse_int
+
+
+class MemoryReadError(ValueError):
+    """Raised when memory of the inferior can't be read"""
+
+    def __init__(self, address, message=None):
+        ValueError.__init__(self, message or 'Cannot access memory at address 0x%x' % address)
+        self.address = address
+
+
+class MemoryCache():
+    """
+    Read the inferior's memory through a cache of fixed size pages.
+
+    Missing pages are read with -data-read-memory-bytes, one command per run of adjacent
+    pages, so many small reads of nearby addresses cost a single round trip to gdb. read_many
+    reads the pages of all of its ranges in one batch of commands, written to gdb at once.
+    Memory decoded from gdb's hex is copied once, into the bytearray of each page it is in.
+
+    The cache is emptied whenever the inferior runs or stops (*running and *stopped records),
+    and pages are dropped when gdb reports that memory was written (=memory-changed), so reads
+    never return memory from before the inferior last ran.
+
+        memory = MemoryCache(gdbmi)
+        header = memory.read(0x601010, 16)
+        nodes = memory.read_many([(address, 24) for address in node_addresses])
+
+    Args:
+        gdbcontroller (GdbController): Controller of the gdb debugging the inferior
+        page_size (int): Size of the pages that are read and cached, in bytes
+        max_pages (int): Maximum number of pages to cache. When the cache is full it is
+        emptied and starts over, like gdbmiparser.ValueCache. Of the pages read for a single
+        read of more than max_pages pages, only the first max_pages are cached.
+        timeout_sec (float): Maximum time to wait for gdb to read the memory of a call to read,
+        read_into, read_many or prefetch
+    Returns:
+        New MemoryCache object
+    """
+
+    def __init__(self, gdbcontroller, page_size=4096, max_pages=16384, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC):
+        if page_size <= 0:
+            raise ValueError('page_size must be > 0')
+        self.gdbcontroller = gdbcontroller
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.timeout_sec = timeout_sec
+        # (bytearray of the page, tuple of (start, end) offsets of unreadable parts), by page number
+        self._pages = {}
+        # incremented when the cache is invalidated, so pages read meanwhile aren't cached
+        self._generation = 0
+        # the cache is invalidated from subscriber callbacks, which can run in gdbcontroller's reader thread
+        self._lock = threading.Lock()
+        self._subscription_ids = [gdbcontroller.subscribe(self._on_run_or_stop, 'notify', 'running'),
+                                  gdbcontroller.subscribe(self._on_run_or_stop, 'notify', 'stopped'),
+                                  gdbcontroller.subscribe(self._on_memory_changed, 'notify', 'memory-changed')]
+
+    def read(self, address, length):
+        """Read memory of the inferior
+        Args:
+            address (int): Address to start reading at
+            length (int): Number of bytes to read
+        Returns:
+            bytes
+        Raises:
+            MemoryReadError if any of the memory can't be read
+        """
+        buffer = bytearray(length)
+        self.read_into(address, buffer)
+        return bytes(buffer)
+
+    def read_into(self, address, buffer):
+        """Read memory of the inferior into an existing buffer, such as a bytearray or a writable memoryview
+        Args:
+            address (int): Address to start reading at
+            buffer: Writable buffer. len(buffer) bytes are read.
+        Returns: None
+        Raises:
+            MemoryReadError if any of the memory can't be read
+        """
+        pages = self._get_pages([(address, len(buffer))])
+        self._copy(pages, address, memoryview(buffer))
+
+    def read_many(self, ranges):
+        """Read many ranges of memory, reading all pages that aren't cached in a single batch of commands
+        Args:
+            ranges (list): (address, length) tuples
+        Returns:
+            List of bytes, one for each range
+        Raises:
+            MemoryReadError if any of the memory can't be read
+        """
+        pages = self._get_pages(ranges)
+        results = []
+        for address, length in ranges:
+            buffer = bytearray(length)
+            self._copy(pages, address, memoryview(buffer))
+            results.append(bytes(buffer))
+        return results
+
+    def prefetch(self, ranges):
+        """Read the pages of ranges of memory into the cache, without raising if they can't be read
+        Args:
+            ranges (list): (address, length) tuples
+        Returns: None
+        """
+        self._get_pages(ranges)
+
+    def invalidate(self, address=None, length=None):
+        """Drop cached pages
+        Args:
+            address (int): Start of the memory to drop, or None to drop all of it
+            length (int): Number of bytes to drop
+        Returns: None
+        """
+        with self._lock:
+            self._generation += 1
+            if address is None:
+                self._pages.clear()
+            else:
+                for page_number in self._page_numbers(address, length):
+                    self._pages.pop(page_number, None)
+
+    def close(self):
+        """Stop listening for gdb's notifications, and empty the cache
+        Returns: None"""
+        for subscription_id in self._subscription_ids:
+            self.gdbcontroller.unsubscribe(subscription_id)
+        self._subscription_ids = []
+        self.invalidate()
+
+    def __len__(self):
+        """Returns: Number of cached pages"""
+        return len(self._pages)
+
+    def _page_numbers(self, address, length):
+        if length <= 0:
+            return range(0)
+        return range(address // self.page_size, (address + length - 1) // self.page_size + 1)
+
+    def _get_pages(self, ranges):
+        """Get the pages of ranges of memory, reading the ones that aren't cached from gdb
+        Returns:
+            Dict of (bytearray, unreadable parts) by page number, which includes every page of ranges
+        """
+        needed = set()
+        for address, length in ranges:
+            needed.update(self._page_numbers(address, length))
+
+        with self._lock:
+            pages = dict((page_number, self._pages[page_number]) for page_number in needed
+                         if page_number in self._pages)
+            generation = self._generation
+        missing = sorted(needed.difference(pages))
+        if not missing:
+            return pages
+
+        # one command per run of adjacent pages
+        runs = []
+        for page_number in missing:
+            if runs and runs[-1][1] == page_number:
+                runs[-1][1] += 1
+            else:
+                runs.append([page_number, page_number + 1])
+        timeout_time_sec = time.time() + self.timeout_sec
+        new_pages, failed_runs = self._read_runs(runs, timeout_time_sec)
+
+        # retry the pages of runs that failed one at a time, so an unreadable page
+        # doesn't prevent the pages next to it from being read
+        retry_runs = [[page_number, page_number + 1] for start, end in failed_runs if end - start > 1
+                      for page_number in range(start, end)]
+        failed_pages = [start for start, end in failed_runs if end - start == 1]
+        if retry_runs:
+            retried_pages, retry_failed_runs = self._read_runs(retry_runs, timeout_time_sec)
+            new_pages.update(retried_pages)
+            failed_pages.extend(start for start, _ in retry_failed_runs)
+        for page_number in failed_pages:
+            new_pages[page_number] = (bytearray(self.page_size), ((0, self.page_size),))
+
+        with self._lock:
+            if generation == self._generation:
+                cached_pages = new_pages
+                if len(new_pages) > self.max_pages:
+                    cached_pages = dict((page_number, new_pages[page_number])
+                                        for page_number in sorted(new_pages)[:self.max_pages])
+                if len(self._pages) + len(cached_pages) > self.max_pages:
+                    self._pages.clear()
+                self._pages.update(cached_pages)
+        pages.update(new_pages)
+        return pages
+
+    def _read_runs(self, runs, timeout_time_sec):
+        """Read runs of pages from gdb, with one -data-read-memory-bytes command per run, in a single batch
+        Args:
+            runs (list): [first page number, page number after the last] for each run
+            timeout_time_sec (float): Time by which all of the runs must be read
+        Returns:
+            (dict of (bytearray, unreadable parts) by page number, list of runs gdb couldn't read at all)
+        """
+        page_size = self.page_size
+        futures = self.gdbcontroller.send_batch(['-data-read-memory-bytes 0x%x %d' % (start * page_size, (end - start) * page_size)
+                                                 for start, end in runs])
+        try:
+            results = [future.result(timeout_sec=max(0, timeout_time_sec - time.time())) for future in futures]
+        except BaseException:
+            # the rest of the batch won't be waited for, so its output must not go to later commands
+            self.gdbcontroller.abandon_commands(futures)
+            raise
+
+        pages = {}
+        failed_runs = []
+        for (start, end), result in zip(runs, results):
+            if result['message'] == 'error':
+                failed_runs.append((start, end))
+                continue
+
+            run_address = start * page_size
+            run_pages = [bytearray(page_size) for _ in range(start, end)]
+            readable = []
+            for block in result['payload'].get('memory') or []:
+                contents = memoryview(binascii.unhexlify(block['contents']))
+                # begin is the block's address. Ignore any part of it outside of the run.
+                block_start = _to_int(block['begin']) - run_address
+                skipped = max(0, -block_start)
+                block_start += skipped
+                block_end = min(len(run_pages) * page_size, block_start + len(contents) - skipped)
+                if block_end <= block_start:
+                    continue
+                # copy each part of the block into the page it is in
+                position = block_start
+                while position < block_end:
+                    index, offset = divmod(position, page_size)
+                    count = min(page_size - offset, block_end - position)
+                    contents_start = skipped + position - block_start
+                    run_pages[index][offset:offset + count] = contents[contents_start:contents_start + count]
+                    position += count
+                readable.append((block_start, block_end))
+
+            for index, page_number in enumerate(range(start, end)):
+                page_start = index * page_size
+                holes = _holes(readable, page_start, page_start + page_size)
+                pages[page_number] = (run_pages[index], holes)
+        return pages, failed_runs
+
+    def _copy(self, pages, address, view):
+        """Copy memory from pages into a memoryview
+        Raises: MemoryReadError if part of the memory is unreadable"""
+        page_size = self.page_size
+        end = address + len(view)
+        position = address
+        while position < end:
+            page_number = position // page_size
+            data, holes = pages[page_number]
+            offset = position - page_number * page_size
+            count = min(page_size - offset, end - position)
+            for hole_start, hole_end in holes:
+                if hole_start < offset + count and offset < hole_end:
+                    raise MemoryReadError(page_number * page_size + max(hole_start, offset))
+            view[position - address:position - address + count] = memoryview(data)[offset:offset + count]
+            position += count
+
+    def _on_run_or_stop(self, response):
+        self.invalidate()
+
+    def _on_memory_changed(self, response):
+        payload = response['payload'] or {}
+        try:
+            self.invalidate(_to_int(payload['addr']), _to_int(payload['len']))
+        except (KeyError, ValueError):
+            self.invalidate()
+
+
+def _to_int(value):
+    """Returns: value of a gdb mi field as an int, whether or not it was converted with field_types"""
+    return value if isinstance(value, numbers.Integral) else parse_int(value)
+
+
+def _holes(readable, start, end):
+    """Returns: Tuple of (start, end) offsets, relative to start, of the parts of start:end not in readable"""
+    holes = []
+    position = start
+    for readable_start, readable_end in sorted(readable):
+        if readable_end <= position:
+            continue
+        if readable_start >= end:
+            break
+        if readable_start > position:
+            holes.append((position - start, readable_start - start))
+        position = max(position, readable_end)
+    if position < end:
+        holes.append((position - start, end - start))
+    return tuple(holes)
@@ -0,0 +1,49 @@
+"""Functions to write gdb mi commands and check their results, for modules that run commands
+through a GdbController, such as SymbolCache, VarObjectCache and BacktraceCache
+
+See https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI-Result-Records.html
+"""
+
+
+def mi_quote(string):
+    """Quote a string as an mi c-string, so it can be passed as one argument of a command,
+    such as a path or an expression with spaces or quotes in it
+    Args:
+        string (str): String to quote
+    Returns:
+        str, such as '"a \\"b\\""' for 'a "b"'
+    """
+    return '"%s"' % string.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def check_result(result, command, error_cls):
+    """Raise an error with gdb's message if a command's result record is an error
+    Args:
+        result (dict): Parsed result record of the command
+        command (str): The command, for the message of the error if gdb didn't give one
+        error_cls (class): Exception to raise, such as SymbolQueryError
+    Returns:
+        result
+    Raises:
+        error_cls if result is a ^error record
+    """
+    if result['message'] == 'error':
+        payload = result['payload'] or {}
+        raise error_cls(payload.get('msg', 'gdb error in %s' % command))
+    return result
+
+
+def run_command(gdbcontroller, command, timeout_sec, error_cls):
+    """Write a command with GdbController.send, and wait for its result record
+    Args:
+        gdbcontroller (GdbController): Controller of the gdb to run the command in
+        command (str): Command to write, without a token
+        timeout_sec (float): Maximum time to wait for the result record
+        error_cls (class): Exception to raise if gdb responds with an error
+    Returns:
+        The result record
+    Raises:
+        error_cls if gdb responded with an error
+        GdbTimeoutError if the result record is not received within timeout_sec
+    """
+    return check_result(gdbcontroller.send(command).result(timeout_sec=timeout_sec), command, error_cls)
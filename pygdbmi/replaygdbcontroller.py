@@ -0,0 +1,131 @@
+"""ReplayGdbController class to replay a recorded gdb session without running gdb"""
+
+import threading
+import time
+from pygdbmi.gdbcontroller import GdbController
+from pygdbmi.sessionrecording import read_session_recording
+
+
+class ReplayGdbController(GdbController):
+    """
+    Replay a session recorded with GdbController(record_path=...) instead of running gdb.
+
+    The recorded output goes through the same buffering and parsing as output read from gdb,
+    split into the same chunks it was read in, so replaying a recording exercises all of
+    GdbController's I/O and parsing, deterministically and without gdb installed.
+
+    Writes are not sent anywhere, and are not compared with what was recorded. Each write
+    releases the output that gdb wrote after the corresponding recorded write, so the same
+    sequence of writes gets the same responses as the recorded session.
+
+    Args:
+        recording_path (str): File written by SessionRecorder
+        verbose (bool): Print verbose output if True
+        realtime (bool): Wait as long between chunks of output as gdb did when they were
+        recorded. By default output is available as fast as it can be parsed.
+        Other keyword arguments are passed to GdbController, except gdb_path and gdb_args,
+        which are ignored.
+    Returns:
+        New ReplayGdbController object
+    Raises:
+        ValueError if recording_path is not a session recording
+    """
+
+    def __init__(self, recording_path, verbose=False, realtime=False, **kwargs):
+        self.recording_path = recording_path
+        self.realtime = realtime
+        kwargs.pop('gdb_path', None)
+        kwargs.pop('gdb_args', None)
+        GdbController.__init__(self, gdb_path=None, gdb_args=[], verbose=verbose, **kwargs)
+
+    def _start_gdb(self, gdb_path, gdb_args, verbose):
+        """Load the recording instead of spawning gdb"""
+        header, self._events = read_session_recording(self.recording_path)
+        self.cmd = header.get('cmd', [])
+        self.abs_gdb_path = self.cmd[0] if self.cmd else None
+
+        if verbose:
+            print('Replaying gdb session "%s" from %s' % (' '.join(self.cmd), self.recording_path))
+
+        # index of the next event to replay
+        self._next_event = 0
+        # number of writes made, and of recorded writes passed while replaying
+        self._writes_made = 0
+        self._writes_replayed = 0
+        self._last_event_time = 0.0
+        # notified when a write is made, or when the process is terminated
+        self._replay_condition = threading.Condition()
+        self.gdb_process = _ReplayedProcess(self._replay_condition)
+
+    def _write_to_stdin(self, text, timeout_sec, blocking_call):
+        """Release the output that follows the next recorded write. Must be called with write_mutex held."""
+        with self._replay_condition:
+            self._writes_made += 1
+            self._replay_condition.notify_all()
+        if self._recorder is not None:
+            self._recorder.record('stdin', text.encode())
+
+    def _read_available_output(self, timeout_sec, verbose, include_prompts=False):
+        """Wait for the next recorded chunk of output to be released, then parse it.
+        See GdbController._read_available_output"""
+        if timeout_sec is not None:
+            timeout_time_sec = time.time() + timeout_sec
+
+        with self._replay_condition:
+            while True:
+                if self.gdb_process is None or self.gdb_process.poll() is not None:
+                    return [], True
+
+                if self._next_event < len(self._events):
+                    event_time, stream, raw_output = self._events[self._next_event]
+                    if stream != 'stdin':
+                        self._next_event += 1
+                        break
+                    elif self._writes_replayed < self._writes_made:
+                        self._next_event += 1
+                        self._writes_replayed += 1
+                        continue
+
+                # wait for a write, or for the process to be terminated
+                if timeout_sec is None:
+                    self._replay_condition.wait()
+                else:
+                    remaining_sec = timeout_time_sec - time.time()
+                    if remaining_sec <= 0:
+                        return [], False
+                    self._replay_condition.wait(remaining_sec)
+
+        if self.realtime:
+            time.sleep(max(0, event_time - self._last_event_time))
+        self._last_event_time = event_time
+
+        reached_eof = False
+        if raw_output == b'':
+            # gdb closed the pipe when this was recorded
+            reached_eof = True
+            if stream == 'stdout':
+                self.gdb_process.returncode = 0
+        return self._get_responses_list(raw_output, stream, verbose, include_prompts), reached_eof
+
+    def _read_windows(self, verbose, include_prompts=False):
+        """Parse the next recorded chunk of output if it has been released, without waiting"""
+        responses, _ = self._read_available_output(0, verbose, include_prompts)
+        return responses
+
+
+class _ReplayedProcess():
+    """Stands in for the gdb subprocess while replaying a recording"""
+
+    def __init__(self, condition):
+        self.returncode = None
+        self._condition = condition
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        with self._condition:
+            if self.returncode is None:
+                self.returncode = -15
+            # wake readers waiting for output that will never be released
+            self._condition.notify_all()
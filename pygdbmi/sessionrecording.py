@@ -0,0 +1,108 @@
+"""Record the raw input and output of a gdb session to a file, to replay it later with
+ReplayGdbController
+
+A recording is a text file of json objects, one per line. The first line is a header:
+
+    {"pygdbmi_session_recording": 1, "cmd": ["/usr/bin/gdb", "--nx", ...]}
+
+and each following line is one chunk of bytes written to gdb's stdin, or read from its
+stdout or stderr, in the order they were written or read:
+
+    {"time": 0.0123, "stream": "stdout", "data": "<base64 encoded bytes>"}
+
+time is the number of seconds since recording started. Chunks of output are stored
+exactly as they were read, so replaying a recording splits gdb's output at the same
+places, including in the middle of a line. An empty chunk of stdout or stderr
+means gdb closed that pipe.
+"""
+
+import base64
+import io
+import json
+import threading
+import time
+
+RECORDING_FORMAT_VERSION = 1
+STREAMS = ('stdin', 'stdout', 'stderr')
+
+
+class SessionRecorder():
+    """Write chunks of a gdb session's input and output to a recording file
+
+    Args:
+        path (str): File to write the recording to. It is overwritten if it exists.
+        cmd (list): The command that started gdb, stored in the header of the recording
+    """
+
+    def __init__(self, path, cmd=None):
+        self.path = path
+        self._file = io.open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._start_time = time.time()
+        self._write_line({'pygdbmi_session_recording': RECORDING_FORMAT_VERSION, 'cmd': list(cmd or [])})
+
+    def record(self, stream, data):
+        """Add a chunk to the recording
+        Args:
+            stream (str): 'stdin', 'stdout' or 'stderr'
+            data (bytes): The bytes that were written or read
+        Returns: None
+        """
+        if stream not in STREAMS:
+            raise ValueError('stream must be one of %s. Got %r' % (', '.join(STREAMS), stream))
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_line({'time': round(time.time() - self._start_time, 6),
+                              'stream': stream,
+                              'data': base64.b64encode(data).decode('ascii')})
+
+    def close(self):
+        """Finish writing the recording. Chunks recorded after closing are dropped.
+        Returns: None"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write_line(self, obj):
+        self._file.write(json.dumps(obj, sort_keys=True) + u'\n')
+        # flush every chunk so the recording is usable even if the program crashes
+        self._file.flush()
+
+
+def read_session_recording(path):
+    """Read a recording written by SessionRecorder
+    Args:
+        path (str): The recording file
+    Returns:
+        (header dict, list of (time, stream, bytes) tuples in the order they were recorded)
+    Raises:
+        ValueError if the file is not a session recording
+    """
+    with io.open(path, encoding='utf-8') as f:
+        lines = [line for line in f.read().split('\n') if line.strip()]
+
+    if not lines:
+        raise ValueError('%s is empty, not a pygdbmi session recording' % path)
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or 'pygdbmi_session_recording' not in header:
+        raise ValueError('%s is not a pygdbmi session recording' % path)
+    if header['pygdbmi_session_recording'] != RECORDING_FORMAT_VERSION:
+        raise ValueError('unsupported session recording version %r in %s' %
+                         (header['pygdbmi_session_recording'], path))
+
+    events = []
+    for line_number, line in enumerate(lines[1:], start=2):
+        try:
+            event = json.loads(line)
+            stream = event['stream']
+            events.append((float(event['time']), stream, base64.b64decode(event['data'])))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError('invalid session recording %s, line %d: %s' % (path, line_number, e))
+        if stream not in STREAMS:
+            raise ValueError('invalid session recording %s, line %d: unknown stream %r' % (path, line_number, stream))
+    return header, events
@@ -0,0 +1,238 @@
+"""SymbolCache class to keep the results of symbol and source file queries on disk, per executable
+
+Listing the source files or functions of a large executable takes gdb seconds, and parsing the
+result takes longer still. The result only depends on the executable, so SymbolCache stores it
+the first time, and serves it from disk whenever the same executable is loaded again.
+"""
+
+import binascii
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from pygdbmi.gdbcontroller import DEFAULT_GDB_TIMEOUT_SEC
+from pygdbmi.micommands import mi_quote, run_command
+
+# Commands whose results only depend on the executable, which SymbolCache.query can cache
+CACHEABLE_COMMANDS = ('-file-list-exec-source-files',
+                      '-symbol-info-functions',
+                      '-symbol-info-variables',
+                      '-symbol-info-types',
+                      '-symbol-info-modules',
+                      '-symbol-info-module-functions',
+                      '-symbol-info-module-variables',
+                      '-symbol-list-lines')
+
+CACHE_FORMAT_VERSION = 1
+
+# Type of ELF notes that hold the build-id, and the owner of those notes
+_NT_GNU_BUILD_ID = 3
+_GNU_NOTE_NAME = b'GNU\x00'
+_PT_NOTE = 4
+_SHT_NOTE = 7
+
+
+class SymbolQueryError(ValueError):
+    """Raised when gdb responds to a query with an error"""
+    pass
+
+
+class SymbolCache():
+    """
+    Cache the parsed results of symbol and source file queries on disk, keyed by the
+    executable's path, modification time, size and build-id.
+
+        symbols = SymbolCache(gdbmi)
+        symbols.load_executable('/path/to/a.out')
+        source_files = symbols.query('-file-list-exec-source-files')['files']
+
+    The payloads returned by query are shared with the cache, and must not be modified.
+    The cache files are pickles, so the cache directory must only be writable by the user.
+
+    Args:
+        gdbcontroller (GdbController): Controller of the gdb to load executables in
+        cache_dir (str): Directory of the cache files. Defaults to pygdbmi/symbols
+        in $XDG_CACHE_HOME (~/.cache).
+        timeout_sec (float): Maximum time to wait for gdb to load an executable or answer a query
+    Returns:
+        New SymbolCache object
+    """
+
+    def __init__(self, gdbcontroller, cache_dir=None, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC):
+        self.gdbcontroller = gdbcontroller
+        if cache_dir is None:
+            cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            cache_dir = os.path.join(cache_home, 'pygdbmi', 'symbols')
+        self.cache_dir = cache_dir
+        self.timeout_sec = timeout_sec
+        self.executable = None
+        # key of the loaded executable, and its cached results by command
+        self._key = None
+        self._results = {}
+
+    def load_executable(self, path):
+        """Load an executable and its symbols in gdb with -file-exec-and-symbols, and the cached
+        results of queries about it from disk
+        Args:
+            path (str): Path of the executable
+        Returns: None
+        Raises:
+            SymbolQueryError if gdb can't load the executable
+        """
+        self._run('-file-exec-and-symbols %s' % mi_quote(path))
+        self.executable = os.path.abspath(path)
+        self._key = executable_key(self.executable)
+        self._results = self._read_cache_file()
+
+    def query(self, command):
+        """Get the payload of the result of a command about the loaded executable, from the
+        cache if the command has been run for the same executable before
+        Args:
+            command (str): One of CACHEABLE_COMMANDS, with its arguments
+        Returns:
+            Payload of the command's result record (dict). It is the cached payload itself, returned
+            again by every query of the same command, so it must not be modified. Copy it first
+            (copy.deepcopy) to change it. It is not copied here since payloads can be very large.
+        Raises:
+            ValueError if no executable is loaded, or the command is not cacheable
+            SymbolQueryError if gdb responds with an error, which is not cached
+        """
+        if self._key is None:
+            raise ValueError('load an executable with load_executable first')
+        command = ' '.join(command.split())
+        if command.split(' ', 1)[0] not in CACHEABLE_COMMANDS:
+            raise ValueError('results of "%s" are not cacheable' % command)
+
+        if command not in self._results:
+            payload = self._run(command)['payload']
+            self._results[command] = dict(payload) if payload is not None else {}
+            self._write_cache_file()
+        return self._results[command]
+
+    def is_cached(self, command):
+        """Returns: True if the result of command for the loaded executable is in the cache"""
+        return ' '.join(command.split()) in self._results
+
+    def _cache_file_path(self):
+        # one file per path, which is replaced when the executable changes
+        name = hashlib.sha1(self.executable.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + '.pickle')
+
+    def _read_cache_file(self):
+        """Returns: Cached results for the loaded executable by command, which is empty if there are none"""
+        try:
+            with open(self._cache_file_path(), 'rb') as f:
+                cached = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+            return {}
+        if (not isinstance(cached, dict) or cached.get('version') != CACHE_FORMAT_VERSION or
+                cached.get('key') != self._key):
+            return {}
+        return cached['results']
+
+    def _write_cache_file(self):
+        """Write the results for the loaded executable. The file is replaced atomically, so
+        concurrent sessions never read a partly written file."""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        cache_file_path = self._cache_file_path()
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': CACHE_FORMAT_VERSION, 'key': self._key, 'results': self._results},
+                            f, pickle.HIGHEST_PROTOCOL)
+            if hasattr(os, 'replace'):
+                os.replace(temp_path, cache_file_path)
+            else:  # python 2
+                if os.name == 'nt' and os.path.exists(cache_file_path):
+                    os.remove(cache_file_path)
+                os.rename(temp_path, cache_file_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def _run(self, command):
+        return run_command(self.gdbcontroller, command, self.timeout_sec, SymbolQueryError)
+
+
+def executable_key(path):
+    """Identify a version of an executable file
+    Args:
+        path (str): Path of the executable
+    Returns:
+        (absolute path, modification time, size, build-id or None) tuple
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    mtime = getattr(stat, 'st_mtime_ns', None) or stat.st_mtime
+    return (path, mtime, stat.st_size, read_build_id(path))
+
+
+def read_build_id(path):
+    """Read the build-id of an ELF file, from its NT_GNU_BUILD_ID note
+    Args:
+        path (str): Path of the file
+    Returns:
+        Build-id as a hex string, or None if the file is not an ELF file or has no build-id
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(64)
+            if len(header) < 52 or header[:4] != b'\x7fELF':
+                return None
+            is_64_bit = header[4:5] == b'\x02'
+            endian = '<' if header[5:6] == b'\x01' else '>'
+            if is_64_bit:
+                if len(header) < 64:
+                    return None
+                phoff, shoff = struct.unpack_from(endian + 'QQ', header, 32)
+                phentsize, phnum, shentsize, shnum = struct.unpack_from(endian + 'HHHH', header, 54)
+                # p_type, p_offset, p_filesz and sh_type, sh_offset, sh_size
+                segment_format = endian + 'I4xQ16xQ'
+                section_format = endian + '4xI16xQQ'
+            else:
+                phoff, shoff = struct.unpack_from(endian + 'II', header, 28)
+                phentsize, phnum, shentsize, shnum = struct.unpack_from(endian + 'HHHH', header, 42)
+                segment_format = endian + 'II8xI'
+                section_format = endian + '4xI8xII'
+
+            notes = []
+            for i in range(phnum):
+                f.seek(phoff + i * phentsize)
+                entry = f.read(struct.calcsize(segment_format))
+                if len(entry) == struct.calcsize(segment_format):
+                    entry_type, offset, size = struct.unpack(segment_format, entry)
+                    if entry_type == _PT_NOTE:
+                        notes.append((offset, size))
+            if not notes:
+                # object files and split debug files only have sections
+                for i in range(shnum):
+                    f.seek(shoff + i * shentsize)
+                    entry = f.read(struct.calcsize(section_format))
+                    if len(entry) == struct.calcsize(section_format):
+                        entry_type, offset, size = struct.unpack(section_format, entry)
+                        if entry_type == _SHT_NOTE:
+                            notes.append((offset, size))
+
+            for offset, size in notes:
+                f.seek(offset)
+                build_id = _find_build_id(f.read(size), endian)
+                if build_id is not None:
+                    return build_id
+    except (IOError, OSError, struct.error):
+        pass
+    return None
+
+
+def _find_build_id(notes, endian):
+    """Returns: The hex desc of the NT_GNU_BUILD_ID note in the contents of a note segment or section, or None"""
+    i = 0
+    while i + 12 <= len(notes):
+        name_size, desc_size, note_type = struct.unpack_from(endian + 'III', notes, i)
+        name_start = i + 12
+        desc_start = name_start + (name_size + 3) // 4 * 4
+        if note_type == _NT_GNU_BUILD_ID and notes[name_start:name_start + name_size] == _GNU_NOTE_NAME:
+            return binascii.hexlify(notes[desc_start:desc_start + desc_size]).decode('ascii')
+        i = desc_start + (desc_size + 3) // 4 * 4
+    return None
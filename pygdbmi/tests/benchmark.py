@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of the gdb mi parser and of GdbController's output buffering
+
+Run from top level directory:
+
+    python -m pygdbmi.tests.benchmark --save before.json
+    (change something, or check out another revision)
+    python -m pygdbmi.tests.benchmark --compare before.json
+
+Each corpus is a list of lines of gdb mi output. They are generated to resemble
+the output of commands that produce a lot of it, except for 'recorded', which
+is the output of a real gdb session (response_samples.txt).
+
+None of the benchmarks run gdb. Sessions recorded with GdbController(record_path=...) can be
+benchmarked too, by replaying them through ReplayGdbController:
+
+    python -m pygdbmi.tests.benchmark --replay session.jsonl
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import tempfile
+import timeit
+from pygdbmi import gdbmiparser
+from pygdbmi.replaygdbcontroller import ReplayGdbController
+from pygdbmi.sessionrecording import SessionRecorder, read_session_recording
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+# Number of bytes the controller benchmark reads at once, like a read from gdb's stdout pipe
+CHUNK_SIZE_BYTES = 4096
+
+
+def _scaled(count, scale):
+    """Returns: count multiplied by scale, but at least 1"""
+    return max(1, int(count * scale))
+
+
+def deep_backtrace(scale):
+    """One -stack-list-frames result with many frames"""
+    frames = ','.join('frame={level="%d",addr="0x%016x",func="recurse",file="recurse.c",'
+                      'fullname="/home/user/project/src/recurse.c",line="%d",arch="i386:x86-64"}'
+                      % (i, 0x400500 + i, 10 + i % 50) for i in range(_scaled(20000, scale)))
+    return ['^done,stack=[%s]' % frames]
+
+
+def var_list_children(scale):
+    """One -var-list-children result for a large array"""
+    children = ','.join('child={name="var1.%d",exp="%d",numchild="0",value="%d",type="int",thread-id="1"}'
+                        % (i, i, i * 7) for i in range(_scaled(20000, scale)))
+    return ['^done,numchild="%d",children=[%s],has_more="0"' % (_scaled(20000, scale), children)]
+
+
+def register_dump(scale):
+    """Many -data-list-register-values results"""
+    values = ','.join('{number="%d",value="0x%016x"}' % (i, i * 0x1234567) for i in range(200))
+    return ['^done,register-values=[%s]' % values for _ in range(_scaled(500, scale))]
+
+
+def console_flood(scale):
+    """Console output of a cli command that prints a lot, such as info functions"""
+    return ['~"0x%016x  function_number_%d(int, char const*, \\"quoted\\");\\n"' % (i, i)
+            for i in range(_scaled(100000, scale))]
+
+
+def small_notify_records(scale):
+    """Async records like those written while stepping through a program"""
+    records = ['*running,thread-id="all"',
+               '*stopped,reason="end-stepping-range",frame={addr="0x000000000040059c",func="main",args=[],'
+               'file="hello.c",fullname="/home/user/hello.c",line="9"},thread-id="1",stopped-threads="all",core="3"',
+               '=breakpoint-modified,bkpt={number="1",type="breakpoint",disp="keep",enabled="y",'
+               'addr="0x000000000040059c",func="main",file="hello.c",fullname="/home/user/hello.c",line="9",'
+               'thread-groups=["i1"],times="1",original-location="main"}',
+               '=thread-created,id="2",group-id="i1"']
+    return [records[i % len(records)] for i in range(_scaled(50000, scale))]
+
+
+def recorded(scale):
+    """Output of a real gdb session, repeated"""
+    test_directory = os.path.dirname(os.path.abspath(__file__))
+    with io.open(os.path.join(test_directory, 'response_samples.txt'), encoding='utf-8') as f:
+        lines = [line for line in f.read().split('\n') if line]
+    return lines * _scaled(100, scale)
+
+
+CORPORA = [deep_backtrace, var_list_children, register_dump, console_flood, small_notify_records, recorded]
+
+
+def measure(function, repeat):
+    """Call function repeat times
+    Returns: (fastest time in seconds, peak bytes allocated during one call or None if unavailable)"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+
+    peak_memory = None
+    if tracemalloc:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(times), peak_memory
+
+
+def benchmark_parser(lines):
+    """Returns a function that parses every line of the corpus"""
+    def parse():
+        for line in lines:
+            gdbmiparser.parse_response(line)
+    return parse
+
+
+def controller_without_gdb():
+    """Returns: A ReplayGdbController of an empty session, which buffers and parses output
+    exactly like GdbController, without running gdb"""
+    fd, recording_path = tempfile.mkstemp(suffix='.jsonl')
+    os.close(fd)
+    try:
+        SessionRecorder(recording_path, ['gdb']).close()
+        return ReplayGdbController(recording_path)
+    finally:
+        os.remove(recording_path)
+
+
+def benchmark_controller(gdbmi, lines):
+    """Returns a function that feeds the corpus to GdbController in chunks, as if it were read from gdb"""
+    raw_output = ('\n'.join(lines) + '\n').encode()
+    chunks = [raw_output[i:i + CHUNK_SIZE_BYTES] for i in range(0, len(raw_output), CHUNK_SIZE_BYTES)]
+
+    def read():
+        for chunk in chunks:
+            gdbmi._get_responses_list(chunk, 'benchmark', False)
+    return read
+
+
+def benchmark_replay(recording_path):
+    """Returns a function that replays a recorded session through ReplayGdbController, as fast
+    as its output can be read and parsed"""
+    _, events = read_session_recording(recording_path)
+    writes = [data.decode() for _, stream, data in events if stream == 'stdin']
+
+    def replay():
+        gdbmi = ReplayGdbController(recording_path)
+        for text in writes:
+            gdbmi.write(text, read_response=False)
+        while gdbmi._next_event < len(events):
+            _, reached_eof = gdbmi._read_available_output(0, False)
+            if reached_eof:
+                break
+        gdbmi.exit()
+    return replay
+
+
+def run_benchmarks(scale=1.0, repeat=3, include_controller=True, verbose=True, replay_paths=()):
+    """Run every benchmark on every corpus
+
+    Args:
+        scale (float): Multiplier for the size of the generated corpora
+        repeat (int): Number of times to run each benchmark. The fastest run is reported.
+        include_controller (bool): Also benchmark GdbController._get_responses_list
+        verbose (bool): Print results as they are measured
+        replay_paths (list): Session recordings to benchmark replaying with ReplayGdbController
+    Returns:
+        Dict of results, keyed by '<benchmark>/<corpus>'
+    """
+    gdbmi = controller_without_gdb() if include_controller else None
+    results = {}
+    try:
+        for corpus in CORPORA:
+            lines = corpus(scale)
+            num_bytes = sum(len(line.encode()) + 1 for line in lines)
+            benchmarks = [('parse_response', benchmark_parser(lines))]
+            if gdbmi:
+                benchmarks.append(('_get_responses_list', benchmark_controller(gdbmi, lines)))
+
+            for benchmark_name, function in benchmarks:
+                elapsed_sec, peak_memory = measure(function, repeat)
+                result = {'records': len(lines),
+                          'bytes': num_bytes,
+                          'seconds': elapsed_sec,
+                          'records_per_sec': len(lines) / elapsed_sec if elapsed_sec else float('inf'),
+                          'mb_per_sec': num_bytes / 1e6 / elapsed_sec if elapsed_sec else float('inf'),
+                          'peak_memory_bytes': peak_memory}
+                key = '%s/%s' % (benchmark_name, corpus.__name__)
+                results[key] = result
+                if verbose:
+                    print_result(key, result)
+
+        for recording_path in replay_paths:
+            _, events = read_session_recording(recording_path)
+            output = b''.join(data for _, stream, data in events if stream != 'stdin')
+            num_records = len([line for line in output.split(b'\n') if line.strip()])
+            elapsed_sec, peak_memory = measure(benchmark_replay(recording_path), repeat)
+            result = {'records': num_records,
+                      'bytes': len(output),
+                      'seconds': elapsed_sec,
+                      'records_per_sec': num_records / elapsed_sec if elapsed_sec else float('inf'),
+                      'mb_per_sec': len(output) / 1e6 / elapsed_sec if elapsed_sec else float('inf'),
+                      'peak_memory_bytes': peak_memory}
+            key = 'replay/%s' % os.path.basename(recording_path)
+            results[key] = result
+            if verbose:
+                print_result(key, result)
+    finally:
+        if gdbmi:
+            gdbmi.exit()
+    return results
+
+
+def print_result(key, result, baseline=None):
+    """Print one line of results, with the speedup relative to baseline if given"""
+    peak_memory = result['peak_memory_bytes']
+    line = '%-42s %10d records %12.0f records/s %8.2f MB/s %10s peak' % (
+        key, result['records'], result['records_per_sec'], result['mb_per_sec'],
+        '%.2f MB' % (peak_memory / 1e6) if peak_memory is not None else 'n/a')
+    if baseline:
+        line += '   %.2fx speed' % (baseline['seconds'] / result['seconds'] if result['seconds'] else float('inf'))
+        if peak_memory is not None and baseline.get('peak_memory_bytes'):
+            line += ', %.2fx memory' % (float(peak_memory) / baseline['peak_memory_bytes'])
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the size of the generated corpora')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each benchmark (fastest is reported)')
+    parser.add_argument('--no-controller', action='store_true', help="don't benchmark GdbController's output buffering")
+    parser.add_argument('--replay', action='append', default=[], metavar='RECORDING',
+                        help='also benchmark replaying this session recording (can be repeated)')
+    parser.add_argument('--save', help='write results to this json file')
+    parser.add_argument('--compare', help='json file saved by a previous run to compare results with')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args.scale, args.repeat, not args.no_controller, verbose=baseline is None,
+                             replay_paths=args.replay)
+
+    if baseline is not None:
+        for key in sorted(results):
+            print_result(key, results[key], baseline.get(key))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
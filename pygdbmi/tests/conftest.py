@@ -0,0 +1,4 @@
+import sys
+
+# AsyncGdbController and its tests use syntax that older versions of python can't compile
+collect_ignore = [] if sys.version_info >= (3, 6) else ['test_async.py']
@@ -7,11 +7,57 @@ Run from top level directory: ./tests/test_app.py
 """
 
 import os
+import sys
+import io
+import json
 import random
+import time
 import unittest
 import subprocess
+import tempfile
+from pygdbmi import gdbmiparser
 from pygdbmi.gdbmiparser import parse_response, assert_match
-from pygdbmi.gdbcontroller import GdbController, NoGdbProcessError
+from pygdbmi.gdbcontroller import GdbController, NoGdbProcessError, GdbTimeoutError, PYTHON3, _LineFramer
+from pygdbmi.gdbcontrollerpool import GdbControllerPool
+from pygdbmi.sessionrecording import SessionRecorder
+from pygdbmi.replaygdbcontroller import ReplayGdbController
+
+
+def _read_parser_corpus():
+    """Returns: Entries of the parser regression corpus, each a dict with the 'input'
+    mi string and the 'expected' parsed response"""
+    corpus_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'parser_corpus.json')
+    with io.open(corpus_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _replay(exchanges, output_interval_sec=None, **kwargs):
+    """Replay a synthetic gdb session, in which gdb writes each output once its command is written
+    Args:
+        exchanges (list): (command, output) tuples. Commands written in a single batch are separated
+        by newlines, and so are the records of an output. A (gdb) prompt is added after each output.
+        An output can also be a list of outputs, which are read separately.
+        output_interval_sec (float): Replay in real time, with gdb taking this long to write each output
+        kwargs: Passed to ReplayGdbController
+    Returns:
+        ReplayGdbController
+    """
+    recording_path = os.path.join(tempfile.mkdtemp(), 'session.jsonl')
+    recorder = SessionRecorder(recording_path, ['gdb'])
+    for command, output in exchanges:
+        recorder.record('stdin', (command + '\n').encode())
+        for chunk in (output if isinstance(output, list) else [output]):
+            recorder.record('stdout', (chunk + '\n(gdb) \n').encode())
+    recorder.close()
+    if output_interval_sec is not None:
+        with io.open(recording_path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        for index, event in enumerate(lines[1:]):
+            event['time'] = index * output_interval_sec
+        with io.open(recording_path, 'w', encoding='utf-8') as f:
+            f.write(u''.join(json.dumps(line) + u'\n' for line in lines))
+        kwargs['realtime'] = True
+    return ReplayGdbController(recording_path, **kwargs)
 
 
 class TestPyGdbMi(unittest.TestCase):
@@ -56,6 +102,256 @@ class TestPyGdbMi(unittest.TestCase):
         # Test records with token
         assert_match(parse_response('1342^done'), {'type': 'result', 'payload': None, 'message': 'done', "token": 1342})
 
+    def test_parser_regression_corpus(self):
+        """Test that the parser returns the same dictionaries for every record
+        in the regression corpus. The expected output was recorded from the original
+        slice-based parser."""
+        corpus = _read_parser_corpus()
+        assert(len(corpus) != 0)
+        for entry in corpus:
+            assert_match(parse_response(entry['input']), entry['expected'])
+
+    def test_parser_large_record(self):
+        """Test that a very large record, such as a deep backtrace, is parsed correctly"""
+        num_frames = 10000
+        frames = ','.join('frame={level="%d",addr="0x00000000004004ed",func="f",file="hello.c",line="5"}' % i
+                          for i in range(num_frames))
+        response = parse_response('^done,stack=[%s]' % frames)
+        stack = response['payload']['stack']
+        assert(len(stack) == num_frames)
+        assert(stack[0] == {'level': '0', 'addr': '0x00000000004004ed', 'func': 'f', 'file': 'hello.c', 'line': '5'})
+        assert(stack[-1]['level'] == str(num_frames - 1))
+
+    def test_parser_lazy_payload(self):
+        """Test that payloads are parsed on first use, and that lazy responses equal eagerly parsed ones"""
+        text = '123*stopped,reason="breakpoint-hit",frame={func="main",args=[]},thread-id="1"'
+        response = parse_response(text, lazy_payload=True)
+        assert(response['type'] == 'notify')
+        assert(response['message'] == 'stopped')
+        assert(response['token'] == 123)
+        assert('payload' in response)
+        assert(len(response) == 4)
+        assert(response.get('stream') is None)
+        assert(not response.is_payload_parsed())
+
+        assert(response['payload']['frame'] == {'func': 'main', 'args': []})
+        assert(response.is_payload_parsed())
+
+        for entry in _read_parser_corpus():
+            assert_match(parse_response(entry['input'], lazy_payload=True), entry['expected'])
+            assert_match(json.loads(json.dumps(parse_response(entry['input'], lazy_payload=True))), entry['expected'])
+
+        response = parse_response(text, lazy_payload=True)
+        response['payload'] = None
+        assert_match(dict(response), {'type': 'notify', 'message': 'stopped', 'token': 123, 'payload': None})
+
+        # keys are in the same order as in eagerly parsed responses, even if more were added before
+        # parsing, where dicts keep their order (python 3.7+)
+        for set_payload in (False, True):
+            response = parse_response(text, lazy_payload=True)
+            expected = parse_response(text)
+            response['stream'] = expected['stream'] = 'stdout'
+            if set_payload:
+                response['payload'] = expected['payload'] = None
+            assert(response == expected)
+            if sys.version_info >= (3, 7):
+                assert(repr(response) == repr(expected))
+                assert(json.dumps(response) == json.dumps(expected))
+
+    def test_parser_mi_record(self):
+        """Test that MiRecord has the same keys and values as the dicts returned by the parser"""
+        from pygdbmi.gdbmiparser import MiRecord
+        record = parse_response('^done,value="2"', as_record=True)
+        assert(isinstance(record, MiRecord))
+        assert(record.type == 'result')
+        assert(record['payload'] == {'value': '2'})
+        assert(record.payload is record['payload'])
+        assert(record.token is None)
+        assert('stream' not in record)
+        assert(record.get('stream') is None)
+        record['stream'] = 'stdout'
+        assert(record.keys() == ['type', 'message', 'payload', 'token', 'stream'])
+        with self.assertRaises(KeyError):
+            record['other'] = 1
+
+        record = parse_response('~"hello"', as_record=True)
+        assert('token' not in record)
+        with self.assertRaises(KeyError):
+            record['token']
+
+        for entry in _read_parser_corpus():
+            for lazy_payload in (False, True):
+                record = parse_response(entry['input'], lazy_payload=lazy_payload, as_record=True)
+                assert_match(record, entry['expected'])
+                assert_match(record.to_dict(), entry['expected'])
+                if sys.version_info >= (3, 7):
+                    # keys are in the same order as in the dicts, where dicts keep their order
+                    expected = parse_response(entry['input'])
+                    assert(list(record.keys()) == list(expected.keys()))
+                    assert(json.dumps(record.to_dict()) == json.dumps(expected))
+
+    def test_parser_shared_strings(self):
+        """Test that keys are shared between records, and values are when a ValueCache is used"""
+        from pygdbmi.gdbmiparser import ValueCache
+        text = '^done,bkpt={number="1",file="hello.c",fullname="/home/user/hello.c",enabled="y"}'
+        first = parse_response(text)
+        second = parse_response(text)
+        assert(first == second)
+        for first_key, second_key in zip(sorted(first['payload']['bkpt']), sorted(second['payload']['bkpt'])):
+            assert(first_key is second_key)
+        assert(first['payload']['bkpt']['fullname'] is not second['payload']['bkpt']['fullname'])
+
+        value_cache = ValueCache(max_size=3)
+        first = parse_response(text, value_cache=value_cache)
+        second = parse_response(text, value_cache=value_cache)
+        assert(first == second)
+        assert(first['payload']['bkpt']['enabled'] is second['payload']['bkpt']['enabled'])
+        assert(len(value_cache) <= 3)
+
+        value_cache = ValueCache(max_length=4)
+        assert(value_cache.get('/home/user/hello.c') == '/home/user/hello.c')
+        assert(len(value_cache) == 0)
+
+    def test_parser_fields(self):
+        """Test that only the requested fields of payloads are parsed"""
+        text = ('*stopped,reason="end-stepping-range",frame={addr="0x000000000040059c",func="main",'
+                'args=[{name="argc",value="1"},{name="argv",value="0x7fffffffe0b8"}],file="hello.c",'
+                'line="9"},thread-id="1",stopped-threads="all",core="3"')
+        response = parse_response(text, fields=['frame.addr', 'frame.func', 'thread-id'])
+        assert_match(response, {'type': 'notify',
+                                'message': 'stopped',
+                                'payload': {'frame': {'addr': '0x000000000040059c', 'func': 'main'}, 'thread-id': '1'},
+                                'token': None})
+        response = parse_response(text, fields=['frame.args.name', 'core', 'missing.key'])
+        assert_match(response['payload'], {'frame': {'args': [{'name': 'argc'}, {'name': 'argv'}]}, 'core': '3'})
+        response = parse_response(text, fields=['frame.args.name', 'frame'])
+        assert_match(response['payload'], {'frame': parse_response(text)['payload']['frame']})
+
+        # skipped values can contain brackets and commas in strings, and be unterminated
+        response = parse_response('^done,a={b="},]{[",c=[x,{y="z"}]},d="1",e="unterminated', fields=['d', 'e'])
+        assert_match(response['payload'], {'d': '1', 'e': 'unterminated'})
+
+    def test_parser_field_types(self):
+        """Test that values of fields in field_types are converted while parsing"""
+        from pygdbmi.gdbmiparser import DEFAULT_FIELD_TYPES, parse_int
+        text = ('^done,bkpt={number="1",type="breakpoint",addr="<MULTIPLE>",times="0",thread-id="all",'
+                'locations=[{number="1.1",addr="0x00000000004004ed",line="5"}]}')
+        response = parse_response(text, field_types=DEFAULT_FIELD_TYPES)
+        assert_match(response['payload'], {'bkpt': {'number': 1, 'type': 'breakpoint', 'addr': '<MULTIPLE>',
+                                                    'times': 0, 'thread-id': 'all',
+                                                    'locations': [{'number': '1.1', 'addr': 0x4004ed, 'line': 5}]}})
+        for lazy_payload in (False, True):
+            assert_match(parse_response(text, lazy_payload=lazy_payload, as_record=True, field_types=DEFAULT_FIELD_TYPES),
+                         response)
+        assert_match(parse_response(text, field_types={'type': str.upper})['payload']['bkpt']['type'], 'BREAKPOINT')
+        assert(parse_int('0x10') == 16)
+        assert(parse_int('10') == 10)
+        # gdb writes exit codes in octal
+        response = parse_response('*stopped,reason="exited",exit-code="010"', field_types=DEFAULT_FIELD_TYPES)
+        assert(response['payload']['exit-code'] == 8)
+
+    @unittest.skipIf(gdbmiparser._accelerator is None, 'C parser is not built')
+    def test_parser_accelerator(self):
+        """Test that the C parser returns exactly what the Python parser does, including for malformed input"""
+        def parse_in_python(text, start, projection=None):
+            return gdbmiparser._parse_dict(text, start, projection=projection)[1]
+
+        inputs = [entry['input'] for entry in _read_parser_corpus()]
+        inputs += ['a="unterminated', 'a="trailing backslash\\', 'a=b,c={d', '}a="1"', '[x="1"],y=z', 'a="\\\\\\"b"',
+                   u'a="\u00e9\u4e2d\U0001f600",\u00e9=["\\"",{}]', ' \t\n', '']
+        rand = random.Random(0)
+        for _ in range(2000):
+            inputs.append(''.join(rand.choice(u'ab=,{}[]"\\ \t\u00e9') for _ in range(rand.randint(0, 20))))
+
+        # skipped members end at the first ',', '}' or ']' outside of nested values, however malformed
+        projections = [None] + [gdbmiparser._get_projection(fields) for fields in
+                                [['a'], ['b.a'], ['a.b', 'b'], [u'\u00e9.a.b', 'a.a']]]
+        for text in inputs:
+            for start in set([0, len(text) // 2, len(text)]):
+                for projection in projections:
+                    expected = parse_in_python(text, start, projection)
+                    actual = gdbmiparser._accelerator.parse_payload(text, start, projection)
+                    assert_match(actual, expected)
+                    assert_match(repr(actual), repr(expected))
+
+        # field_types are converted after the C parser returns,
+        # which is the same as what the Python parser returns
+        accelerator = gdbmiparser._accelerator
+        parsed_payloads = []
+
+        class CountingAccelerator():
+            def parse_payload(self, text, start, projection=None):
+                parsed_payloads.append(text)
+                return accelerator.parse_payload(text, start, projection)
+
+        options = [{'fields': ['frame.addr', 'frame.func', 'thread-id', 'bkpt', 'stack.level', 'value', 'a.b']},
+                   {'field_types': gdbmiparser.DEFAULT_FIELD_TYPES},
+                   {'fields': ['bkpt', 'frame.line', 'stack'], 'field_types': gdbmiparser.DEFAULT_FIELD_TYPES}]
+        corpus_inputs = [entry['input'] for entry in _read_parser_corpus()]
+        for kwargs in options:
+            gdbmiparser._accelerator = CountingAccelerator()
+            try:
+                del parsed_payloads[:]
+                accelerated = [parse_response(text, **kwargs) for text in corpus_inputs]
+                assert(len(parsed_payloads) != 0)
+                assert(len(parsed_payloads) == len([r for r in accelerated if r.get('payload') is not None
+                                                    and r['type'] in ['notify', 'result']]))
+                gdbmiparser._accelerator = None
+                expected = [parse_response(text, **kwargs) for text in corpus_inputs]
+            finally:
+                gdbmiparser._accelerator = accelerator
+            assert_match(accelerated, expected)
+
+    def test_parser_incremental(self):
+        """Test that IncrementalParser returns what parse_response does for every line, however the
+        output is split into chunks, and that the controller can parse with it"""
+        lines = [entry['input'] for entry in _read_parser_corpus() if '\n' not in entry['input']]
+        lines += ['^done,a="unterminated', '*stopped,a="trailing backslash\\', '=x,a=b,c={d', '^done,}a="1"',
+                  '12^done,value="\\\\\\"b",k=[x="1"],y=z', u'=\u00e9,a="\u00e9\u4e2d\U0001f600"', '^done ,a="1"',
+                  '^,,a="1"', '123', '(gdb) ', '~"console"', 'inferior output', '']
+        rand = random.Random(0)
+        for _ in range(500):
+            lines.append(rand.choice(['^done,', '*stopped,', '']) +
+                         ''.join(rand.choice(u'ab=,{}[]"\\ \t\u00e9') for _ in range(rand.randint(0, 20))))
+        raw_output = u'\n'.join(lines + ['']).encode('utf-8')
+        expected = [parse_response(line, field_types=gdbmiparser.DEFAULT_FIELD_TYPES) for line in lines if line]
+
+        for chunk_sizes in [[len(raw_output)], [1], [2, 3, 5, 7], [4096], [1, 100, 37]]:
+            parser = gdbmiparser.IncrementalParser(field_types=gdbmiparser.DEFAULT_FIELD_TYPES)
+            records = []
+            i = 0
+            chunk_number = 0
+            while i < len(raw_output):
+                chunk_size = chunk_sizes[chunk_number % len(chunk_sizes)]
+                parser.feed(raw_output[i:i + chunk_size])
+                i += chunk_size
+                chunk_number += 1
+                records.extend(parser.records())
+            assert_match(records, expected)
+
+        # the payload of an incomplete record is parsed as it arrives
+        parser = gdbmiparser.IncrementalParser()
+        parser.feed(b'^done,stack=[frame={level="0"},fra')
+        assert(parser._builder.payload == {} and len(parser._builder._stack) == 3)
+        parser.feed(b'me={level="1"}]\n')
+        assert(parser.records() == [{'type': 'result', 'message': 'done', 'token': None,
+                                     'payload': {'stack': [{'level': '0'}, {'level': '1'}]}}])
+
+        gdbmi = GdbController(incremental_parsing=True)
+        responses = gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=10)
+        assert(responses[-1]['payload'] == {'value': '2'})
+        assert(responses[-1]['stream'] == 'stdout')
+        gdbmi.exit()
+
+    def test_benchmark(self):
+        """Test that the benchmarks run, without gdb, and report results for every corpus"""
+        from pygdbmi.tests import benchmark
+        results = benchmark.run_benchmarks(scale=0.001, repeat=1, verbose=False)
+        assert(len(results) == 2 * len(benchmark.CORPORA))
+        for result in results.values():
+            assert(result['records'] != 0)
+            assert(result['records_per_sec'] > 0)
+
     def _get_c_program(self):
         """build c program and return path to binary"""
         FILENAME = 'pygdbmiapp.a'
@@ -90,6 +386,9 @@ class TestPyGdbMi(unittest.TestCase):
         assert(len(responses) != 0)
 
         responses = gdbmi.write(['-exec-run', '-exec-continue'], timeout_sec=3)
+        assert(len([r for r in responses if r['type'] == 'result']) == 2)
+        # the inferior runs to the end after -exec-continue's result, so its output may follow it
+        responses += gdbmi.iter_responses(until=None, timeout_sec=1)
         found_match = False
         for r in responses:
             if r.get('payload', '') == '  leading spaces should be preserved. So should trailing spaces.  ':
@@ -109,6 +408,704 @@ class TestPyGdbMi(unittest.TestCase):
             got_no_process_exception = True
         assert(got_no_process_exception is True)
 
+    def test_controller_idle_read(self):
+        """Test that waiting for output that never arrives sleeps rather than spinning
+        on the pipes, and that a response is returned as soon as gdb finishes it"""
+        gdbmi = GdbController()
+        # gdb's startup output is returned with the response to the first command
+        responses = gdbmi.write('-gdb-version', timeout_sec=5)
+        assert(responses[0]['message'] == 'thread-group-added')
+        assert(responses[-1]['type'] == 'result')
+
+        start_cpu_time = time.process_time() if PYTHON3 else time.clock()
+        start_time = time.time()
+        responses = gdbmi.get_gdb_response(timeout_sec=1, raise_error_on_timeout=False)
+        elapsed_cpu_time = (time.process_time() if PYTHON3 else time.clock()) - start_cpu_time
+        assert(responses == [])
+        assert(time.time() - start_time >= 1)
+        assert(elapsed_cpu_time < 0.5)
+
+        start_time = time.time()
+        responses = gdbmi.write('-gdb-version', timeout_sec=5)
+        assert(len(responses) != 0)
+        assert(time.time() - start_time < 5)
+        gdbmi.exit()
+
+    def test_controller_send(self):
+        """Test that many commands can be written before reading any response, and that
+        each response is matched to its command by token"""
+        gdbmi = GdbController()
+        futures = [gdbmi.send('-data-evaluate-expression %d+1' % i) for i in range(20)]
+        assert(len(set(future.token for future in futures)) == len(futures))
+
+        # waiting on the last command reads the responses of all earlier commands
+        result = futures[-1].result(timeout_sec=5)
+        assert(result['type'] == 'result')
+        assert(result['token'] == futures[-1].token)
+        for i, future in enumerate(futures):
+            assert(future.done())
+            assert(future.result()['message'] == 'done')
+            assert(future.result()['payload'] == {'value': str(i + 1)})
+            assert(future.responses[-1] is future.result())
+
+        got_type_error = False
+        try:
+            gdbmi.send(['-gdb-version'])
+        except TypeError:
+            got_type_error = True
+        assert(got_type_error is True)
+
+        # commands that can't be written because gdb's stdin isn't ready are not left waiting for a result
+        write_list = gdbmi.write_list
+        gdbmi.write_list = []  # as if the pipe to gdb's stdin were full
+        with self.assertRaises(GdbTimeoutError):
+            gdbmi.send_batch(['-gdb-version', '-list-features'])
+        assert(len(gdbmi._pending_commands) == 0)
+        gdbmi.write_list = write_list
+        gdbmi.exit()
+
+        # results without a token, or with a token that wasn't sent, are left for write and get_gdb_response
+        gdbmi = _replay([('-data-evaluate-expression 1\n99-data-evaluate-expression 3',
+                          '^done,value="1"\n(gdb) \n99^done,value="3"'),
+                         ('1-data-evaluate-expression 2', '1^done,value="2"')])
+        gdbmi.write(['-data-evaluate-expression 1', '99-data-evaluate-expression 3'], read_response=False)
+        future = gdbmi.send('-data-evaluate-expression 2')
+        assert(future.result(timeout_sec=5)['payload'] == {'value': '2'})
+        assert(future.responses == [future.result()])
+        responses = gdbmi.get_gdb_response(timeout_sec=1)
+        assert([(response['token'], response['payload']) for response in responses] ==
+               [(None, {'value': '1'}), (99, {'value': '3'})])
+        gdbmi.exit()
+
+        # a command whose result timed out is abandoned, so its output isn't given to later commands
+        gdbmi = _replay([('1-interpreter-exec console "info"', []),
+                         ('2-data-evaluate-expression 2', '~"info"\n1^done\n(gdb) \n2^done,value="2"')])
+        future = gdbmi.send('-interpreter-exec console "info"')
+        with self.assertRaises(GdbTimeoutError):
+            future.result(timeout_sec=0.1)
+        next_future = gdbmi.send('-data-evaluate-expression 2')
+        assert(next_future.result(timeout_sec=5)['payload'] == {'value': '2'})
+        assert(next_future.responses == [next_future.result()])
+        responses = gdbmi.get_gdb_response(timeout_sec=1)
+        assert([(response['type'], response.get('token')) for response in responses] == [('console', None), ('result', 1)])
+        assert(len(gdbmi._pending_commands) == 0)
+        with self.assertRaises(GdbTimeoutError):
+            future.result(timeout_sec=5)
+        gdbmi.exit()
+
+        # reset_session drops subscriptions and abandons the commands that are still pending
+        gdbmi = _replay([('1-interpreter-exec console "info"', []),
+                         ('-data-evaluate-expression 2', '~"info"\n1^done\n(gdb) \n^done,value="2"')])
+        published = []
+        gdbmi.subscribe(published.append)
+        future = gdbmi.send('-interpreter-exec console "info"')
+        assert(gdbmi.reset_session() == 1)
+        assert(gdbmi.reset_session() == 0)
+        responses = gdbmi.write('-data-evaluate-expression 2', timeout_sec=5, wait_for_result=True)
+        assert([response['type'] for response in responses] == ['console', 'result', 'result'])
+        assert(future.responses == [] and published == [])
+        with self.assertRaises(GdbTimeoutError):
+            future.result(timeout_sec=5)
+        gdbmi.exit()
+
+        # if gdb exits before sending a result, waiting for it fails right away, and the command is abandoned
+        for use_reader_thread in [False, True]:
+            recording_path = os.path.join(tempfile.mkdtemp(), 'session.jsonl')
+            recorder = SessionRecorder(recording_path, ['gdb'])
+            recorder.record('stdin', b'1-gdb-exit\n')
+            recorder.record('stdout', b'')
+            recorder.close()
+            gdbmi = ReplayGdbController(recording_path, use_reader_thread=use_reader_thread)
+            future = gdbmi.send('-gdb-exit')
+            start_time = time.time()
+            with self.assertRaises(NoGdbProcessError):
+                future.result(timeout_sec=10)
+            assert(time.time() - start_time < 5)
+            with self.assertRaises(GdbTimeoutError):
+                future.result(timeout_sec=0)
+            gdbmi.exit()
+
+    def test_controller_write_batch(self):
+        """Test that a batch of commands is written at once, and responses are returned per command"""
+        gdbmi = GdbController()
+
+        commands = ['-data-evaluate-expression %d*2' % i for i in range(50)]
+        commands.append('-interpreter-exec console "show version"')
+        results = gdbmi.write_batch(commands, timeout_sec=5)
+        assert(len(results) == len(commands))
+        for i, responses in enumerate(results[:-1]):
+            assert(responses[-1]['type'] == 'result')
+            assert(responses[-1]['payload'] == {'value': str(i * 2)})
+        console_responses = results[-1]
+        assert(console_responses[0]['type'] == 'console')
+        assert(console_responses[-1]['type'] == 'result')
+        assert(len(set(responses[-1]['token'] for responses in results)) == len(commands))
+
+        futures = gdbmi.send_batch(['-data-evaluate-expression 1+1', '-data-evaluate-expression 2+2'])
+        assert(futures[1].result(timeout_sec=5)['payload'] == {'value': '4'})
+        assert(futures[0].result()['payload'] == {'value': '2'})
+
+        with self.assertRaises(TypeError):
+            gdbmi.send_batch('-gdb-version')
+        gdbmi.exit()
+
+    def test_controller_threads(self):
+        """Test that many threads can write and read at once, that each response is returned to exactly
+        one caller, and that writing doesn't wait for a thread that is waiting for output"""
+        import threading
+        from pygdbmi.gdbcontroller import MUTEX_AQUIRE_WAIT_TIME_SEC  # noqa: F401, deprecated but still importable
+        gdbmi = GdbController()
+        assert(gdbmi.mutex is gdbmi.write_mutex)
+
+        # commands written with send get their own results, whichever thread reads them
+        errors = []
+
+        def send_commands(thread_number):
+            try:
+                for i in range(20):
+                    value = thread_number * 1000 + i
+                    result = gdbmi.send('-data-evaluate-expression %d' % value).result(timeout_sec=10)
+                    if result['payload'] != {'value': str(value)}:
+                        errors.append(result)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=send_commands, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(errors == [])
+
+        # responses read by concurrent get_gdb_response calls are neither lost nor duplicated
+        num_commands = 100
+        for i in range(num_commands):
+            gdbmi.write('-data-evaluate-expression %d' % i, read_response=False)
+        values = []
+
+        def read_responses():
+            timeout_time_sec = time.time() + 10
+            while len(values) < num_commands and time.time() < timeout_time_sec:
+                for response in gdbmi.get_gdb_response(timeout_sec=0.2, raise_error_on_timeout=False):
+                    if response['type'] == 'result':
+                        values.append(response['payload']['value'])
+        threads = [threading.Thread(target=read_responses) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(sorted(values) == sorted(str(i) for i in range(num_commands)))
+
+        # a thread waiting for output doesn't block writing
+        responses = []
+        reader = threading.Thread(target=lambda: responses.extend(gdbmi.get_gdb_response(timeout_sec=5,
+                                                                                         wait_for_result=True)))
+        reader.start()
+        time.sleep(0.2)
+        start_time = time.time()
+        gdbmi.write('-data-evaluate-expression 7*6', read_response=False)
+        assert(time.time() - start_time < 1)
+        reader.join()
+        assert(responses[-1]['payload'] == {'value': '42'})
+        gdbmi.exit()
+
+    def test_controller_completion(self):
+        """Test that write returns as soon as gdb's response is complete, rather than after timeout_sec"""
+        from pygdbmi.gdbcontroller import _ResponseCollector, _GDB_PROMPT
+        gdbmi = GdbController()
+        start_time = time.time()
+        for i in range(10):
+            responses = gdbmi.write('-data-evaluate-expression %d' % i, timeout_sec=10)
+            assert(responses[-1]['payload'] == {'value': str(i)})
+        assert(time.time() - start_time < 5)
+        gdbmi.exit()
+
+        result = {'type': 'result', 'message': 'done', 'payload': None, 'token': None}
+        notify = {'type': 'notify', 'message': 'stopped', 'payload': {}, 'token': None}
+        collector = _ResponseCollector()
+        collector.add([_GDB_PROMPT])
+        assert(not collector.is_complete(False, False))
+        collector.add([result])
+        assert(not collector.is_complete(False, False))
+        assert(collector.is_complete(False, True))
+        collector.add([_GDB_PROMPT, notify])
+        assert(collector.is_complete(False, False))
+        assert(collector.responses == [result, notify])
+
+        collector = _ResponseCollector()
+        collector.add([notify])
+        assert(collector.is_complete(True, False))
+        assert(not collector.is_complete(False, False))
+        collector.add([_GDB_PROMPT])
+        assert(collector.is_complete(False, False))
+
+        # when the number of commands is known, other output and leftover prompts don't complete the response
+        collector = _ResponseCollector(2)
+        collector.add([notify, _GDB_PROMPT, _GDB_PROMPT, result])
+        assert(not collector.is_complete(True, False))
+        collector.add([_GDB_PROMPT, result])
+        assert(collector.is_complete(False, True))
+        assert(not collector.is_complete(False, False))
+        collector.add([_GDB_PROMPT])
+        assert(collector.is_complete(False, False))
+
+        # gdb's startup output arrives before the first command is written
+        recording_path = os.path.join(tempfile.mkdtemp(), 'session.jsonl')
+        recorder = SessionRecorder(recording_path, ['gdb'])
+        recorder.record('stdout', b'=thread-group-added,id="i1"\n(gdb) \n')
+        recorder.record('stdin', b'-data-evaluate-expression 1\n-data-evaluate-expression 2\n')
+        recorder.record('stdout', b'^done,value="1"\n(gdb) \n')
+        recorder.record('stdout', b'^done,value="2"\n(gdb) \n')
+        recorder.record('stdin', b'-data-evaluate-expression 3\n')
+        recorder.record('stdout', b'^done,value="3"\n(gdb) \n')
+        recorder.close()
+        gdbmi = ReplayGdbController(recording_path)
+        responses = gdbmi.write(['-data-evaluate-expression 1', '-data-evaluate-expression 2'], timeout_sec=5)
+        assert([response['message'] for response in responses] == ['thread-group-added', 'done', 'done'])
+        assert([response['payload'] for response in responses[1:]] == [{'value': '1'}, {'value': '2'}])
+        responses = gdbmi.write('-data-evaluate-expression 3', timeout_sec=5)
+        assert([response['payload'] for response in responses] == [{'value': '3'}])
+        gdbmi.exit()
+
+    def test_controller_iter_responses(self):
+        """Test that responses can be consumed one at a time as they are read"""
+        gdbmi = GdbController()
+        gdbmi.write('-gdb-version', timeout_sec=5)
+
+        gdbmi.write('-interpreter-exec console "show version"', read_response=False)
+        responses = gdbmi.iter_responses(until='result', timeout_sec=5)
+        first_response = next(responses)
+        assert(first_response['type'] == 'console')
+        remaining_responses = list(responses)
+        assert(remaining_responses[-1]['type'] == 'result')
+        assert(remaining_responses[-1]['message'] == 'done')
+
+        # nothing left to read
+        got_timeout_exception = False
+        try:
+            list(gdbmi.iter_responses(timeout_sec=0.5))
+        except GdbTimeoutError:
+            got_timeout_exception = True
+        assert(got_timeout_exception is True)
+        assert(list(gdbmi.iter_responses(until=None, timeout_sec=0.5)) == [])
+        gdbmi.exit()
+
+        # responses read but not yielded when the caller stops iterating are returned by the next read
+        gdbmi = _replay([('-interpreter-exec console "info"', '~"a"\n~"b"\n^done')])
+        gdbmi.write('-interpreter-exec console "info"', read_response=False)
+        responses = gdbmi.iter_responses(until='result', timeout_sec=5)
+        assert(next(responses)['payload'] == 'a')
+        responses.close()
+        assert([response['payload'] for response in gdbmi.get_gdb_response(timeout_sec=1)] == ['b', None])
+        gdbmi.exit()
+
+    def test_controller_reader_thread(self):
+        """Test that the reader thread queues responses and calls subscribers as output arrives"""
+        gdbmi = GdbController(use_reader_thread=True)
+        results = []
+        all_responses = []
+        gdbmi.subscribe(results.append, response_type='result')
+        subscription_id = gdbmi.subscribe(all_responses.append)
+
+        responses = gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=5, wait_for_result=True)
+        assert(responses[-1]['payload'] == {'value': '2'})
+        assert(results[-1] is responses[-1])
+
+        # futures are completed by the reader thread
+        future = gdbmi.send('-data-evaluate-expression 2+2')
+        assert(future.result(timeout_sec=5)['payload'] == {'value': '4'})
+        assert(results[-1] is future.result())
+
+        gdbmi.unsubscribe(subscription_id)
+        num_responses = len(all_responses)
+        gdbmi.write('-gdb-version', timeout_sec=5)
+        assert(len(all_responses) == num_responses)
+
+        # callbacks run in the reader thread can't wait for output, which only that thread reads,
+        # but they can send commands
+        errors = []
+        futures = []
+
+        def write_from_callback(response):
+            try:
+                gdbmi.write('-data-evaluate-expression 3+3', timeout_sec=5)
+            except RuntimeError as e:
+                errors.append(e)
+            futures.append(gdbmi.send('-data-evaluate-expression 4+4'))
+        subscription_id = gdbmi.subscribe(write_from_callback, response_type='console')
+        start_time = time.time()
+        gdbmi.write('-interpreter-exec console "show version"', timeout_sec=5, wait_for_result=True)
+        gdbmi.unsubscribe(subscription_id)
+        assert(time.time() - start_time < 5)
+        assert(len(errors) != 0 and len(errors) == len(futures))
+        assert(futures[-1].result(timeout_sec=5)['payload'] == {'value': '8'})
+
+        gdbmi.exit()
+        assert(not gdbmi._reader_thread.is_alive())
+
+    def test_var_object_cache(self):
+        """Test that VarObjectCache creates varobjs once per frame, lists children on demand, and applies
+        only -var-update's changelist after the inferior stops. gdb is replayed from a recording."""
+        from pygdbmi.varobjectcache import VarObjectCache, VarObjectError
+
+        def selected_frame(token, depth, func):
+            # commands written to identify the selected frame, and gdb's output for them
+            return ('%d-thread-list-ids\n%d-stack-info-depth\n%d-stack-info-frame' % (token, token + 1, token + 2),
+                    '%d^done,thread-ids={thread-id="1"},current-thread-id="1",number-of-threads="1"\n(gdb) \n'
+                    '%d^done,depth="%d"\n(gdb) \n%d^done,frame={level="0",addr="0x4005a0",func="%s",file="app.c"}'
+                    % (token, token + 1, depth, token + 2, func))
+
+        gdbmi = _replay([
+                selected_frame(1, 2, 'main'),
+                ('4-var-create - * "myvar"',
+                 '4^done,name="var1",numchild="3",value="{...}",type="struct my_type_t",thread-id="1",has_more="0"'),
+                selected_frame(5, 2, 'main'),
+                ('8-var-list-children --all-values var1',
+                 '8^done,numchild="3",children=[child={name="var1.a",exp="a",numchild="0",value="1",type="int",'
+                 'thread-id="1"},child={name="var1.b",exp="b",numchild="0",value="1.20000005",type="float",'
+                 'thread-id="1"},child={name="var1.c",exp="c",numchild="0",value="4",type="size_t",thread-id="1"}],'
+                 'has_more="0"'),
+                ('-exec-next',
+                 ['^running\n*running,thread-id="all"', '*stopped,reason="end-stepping-range",thread-id="1"']),
+                ('9-var-update --all-values *',
+                 '9^done,changelist=[{name="var1.a",value="2",in_scope="true",type_changed="false",has_more="0"}]'),
+                ('10-var-update --all-values *',
+                 '10^done,changelist=[{name="var1",value="7",in_scope="true",type_changed="true",new_type="int",'
+                 'new_num_children="0",has_more="0"}]'),
+                selected_frame(11, 3, 'f'),
+                ('14-var-create - * "myvar"', '14^done,name="var2",numchild="0",value="3",type="int",thread-id="1"'),
+                ('15-var-delete var1', '15^done,ndeleted="1"'),
+                selected_frame(16, 3, 'f'),
+                ('19-var-create - * "nosuchvar"', '19^error,msg="-var-create: unable to create variable object"'),
+                ('20-var-delete var2', '20^done,ndeleted="1"')])
+        varobjs = VarObjectCache(gdbmi)
+        myvar = varobjs.watch('myvar')
+        assert((myvar.name, myvar.type, myvar.numchild) == ('var1', 'struct my_type_t', 3))
+        assert(varobjs.watch('myvar') is myvar)
+
+        children = varobjs.children(myvar)
+        assert([(child.expression, child.value) for child in children] == [('a', '1'), ('b', '1.20000005'), ('c', '4')])
+        assert(varobjs.children(myvar) is children)
+        assert(len(varobjs) == 4)
+
+        # nothing is written until the inferior stops. *stopped is read by refresh, after write returned.
+        assert(varobjs.refresh() == [])
+        responses = gdbmi.write('-exec-next', timeout_sec=10)
+        assert([response['message'] for response in responses] == ['running', 'running'])
+        changed = varobjs.refresh()
+        assert(changed == [children[0]] and children[0].value == '2' and children[1].value == '1.20000005')
+        assert(varobjs.refresh() == [])
+
+        changed = varobjs.update()
+        assert(changed == [myvar] and (myvar.type, myvar.value, myvar.numchild) == ('int', '7', 0))
+        assert(varobjs.get('var1.a') is None and varobjs.children(myvar) == [])
+
+        # in another frame, the same expression is another variable
+        other_myvar = varobjs.watch('myvar')
+        assert(other_myvar is not myvar and (other_myvar.name, other_myvar.value) == ('var2', '3'))
+
+        varobjs.delete(myvar)
+        assert(len(varobjs) == 1)
+        got_error = False
+        try:
+            varobjs.watch('nosuchvar')
+        except VarObjectError as e:
+            got_error = '-var-create' in str(e)
+        assert(got_error is True)
+        varobjs.close()
+        assert(len(varobjs) == 0)
+        gdbmi.exit()
+
+    def test_memory_cache(self):
+        """Test that MemoryCache reads whole pages, coalesces adjacent pages into one command,
+        handles unreadable memory, and is emptied when the inferior stops. gdb is replayed from a recording."""
+        from pygdbmi.memorycache import MemoryCache, MemoryReadError
+
+        def memory(address, length):
+            # the inferior's memory: each byte is the low byte of its address
+            contents = ''.join('%02x' % ((address + i) & 0xff) for i in range(length))
+            return '{begin="0x%x",offset="0x0",end="0x%x",contents="%s"}' % (address, address + length, contents)
+
+        gdbmi = _replay([
+                ('1-data-read-memory-bytes 0x1000 16', '1^done,memory=[%s]' % memory(0x1000, 16)),
+                ('2-data-read-memory-bytes 0x1010 32\n3-data-read-memory-bytes 0x1040 16',
+                 '2^done,memory=[%s]\n(gdb) \n3^done,memory=[%s]' % (memory(0x1010, 32), memory(0x1040, 8))),
+                ('4-data-read-memory-bytes 0x2000 32', '4^error,msg="Unable to read memory."'),
+                ('5-data-read-memory-bytes 0x2000 16\n6-data-read-memory-bytes 0x2010 16',
+                 '5^done,memory=[%s]\n(gdb) \n6^error,msg="Unable to read memory."' % memory(0x2000, 16)),
+                ('-exec-next', '^running\n*running,thread-id="all"\n(gdb) \n*stopped,reason="end-stepping-range"'),
+                ('7-data-read-memory-bytes 0x1000 16', '7^done,memory=[%s]' % memory(0x1000, 16)),
+                ('8-data-read-memory-bytes 0x3000 48', '8^done,memory=[%s]' % memory(0x2ff8, 56))],
+            field_types=gdbmiparser.DEFAULT_FIELD_TYPES)
+        cache = MemoryCache(gdbmi, page_size=16)
+        assert(cache.read(0x1004, 4) == b'\x04\x05\x06\x07')
+        # served from the cache
+        buffer = bytearray(8)
+        cache.read_into(0x1008, memoryview(buffer))
+        assert(buffer == bytearray(range(8, 16)))
+
+        # overlapping and adjacent ranges are read with one command per run of pages, in a single batch
+        results = cache.read_many([(0x1010, 4), (0x1012, 20), (0x1040, 4)])
+        assert(results == [b'\x10\x11\x12\x13', bytes(bytearray(range(0x12, 0x26))), b'\x40\x41\x42\x43'])
+        assert(len(cache) == 4)
+        # only the first 8 bytes of the page at 0x1040 were readable
+        got_error = False
+        try:
+            cache.read(0x1046, 4)
+        except MemoryReadError as e:
+            got_error = e.address == 0x1048
+        assert(got_error is True)
+
+        # when a run can't be read, its pages are read one at a time
+        cache.prefetch([(0x2000, 32)])
+        assert(cache.read_many([(0x2000, 4)]) == [b'\x00\x01\x02\x03'])
+        got_error = False
+        try:
+            cache.read(0x200e, 4)
+        except MemoryReadError as e:
+            got_error = e.address == 0x2010
+        assert(got_error is True)
+
+        gdbmi.write('-exec-next', timeout_sec=10)
+        assert(len(cache) == 0)
+        assert(cache.read(0x1000, 2) == b'\x00\x01')
+
+        # a read of more than max_pages pages only caches max_pages of them. Memory gdb
+        # reports outside of the pages read is ignored.
+        cache.max_pages = 2
+        assert(cache.read(0x3000, 48) == bytes(bytearray(range(48))))
+        assert(len(cache) == 2)
+        cache.close()
+        gdbmi.exit()
+
+        # timeout_sec is for all the commands of a read, not for each of them
+        addresses = [0x0, 0x20, 0x40, 0x60]
+        gdbmi = _replay([('\n'.join('%d-data-read-memory-bytes 0x%x 16' % (token, address)
+                                    for token, address in enumerate(addresses, 1)),
+                          ['%d^done,memory=[%s]' % (token, memory(address, 16))
+                           for token, address in enumerate(addresses, 1)])],
+                        output_interval_sec=0.3)
+        cache = MemoryCache(gdbmi, page_size=16, timeout_sec=0.5)
+        got_error = False
+        try:
+            cache.read_many([(address, 1) for address in addresses])
+        except GdbTimeoutError:
+            got_error = True
+        assert(got_error is True)
+        # the commands after the one that timed out were abandoned too
+        assert(gdbmi.reset_session() == 0)
+        gdbmi.exit()
+
+    def test_symbol_cache(self):
+        """Test that SymbolCache serves query results from disk when the same executable is loaded
+        again, and not once it has changed. gdb is replayed from recordings."""
+        import struct
+        from pygdbmi.symbolcache import SymbolCache, read_build_id
+
+        # a minimal 64 bit ELF file with a build-id note
+        directory = tempfile.mkdtemp()
+        executable = os.path.join(directory, 'a.out')
+        note = struct.pack('<III', 4, 4, 3) + b'GNU\x00' + b'\xde\xad\xbe\xef'
+        header = bytearray(64)
+        header[0:6] = b'\x7fELF\x02\x01'
+        struct.pack_into('<QQ', header, 32, 64, 0)
+        struct.pack_into('<HHHH', header, 54, 56, 1, 64, 0)
+        program_header = struct.pack('<IIQQQQQQ', 4, 4, 120, 0, 0, len(note), len(note), 4)
+        with open(executable, 'wb') as f:
+            f.write(bytes(header) + program_header + note)
+        assert(read_build_id(executable) == 'deadbeef')
+        assert(read_build_id(__file__) is None)
+
+        functions = ('{debug=[{filename="hello.c",fullname="/tmp/hello.c",symbols=[{line="15",name="main",'
+                     'type="int (void)",description="int main(void);"}]}]}')
+        cache_dir = os.path.join(directory, 'cache')
+        gdbmi = _replay([('1-file-exec-and-symbols', '1^done'), ('2-symbol-info-functions', '2^done,symbols=' + functions)])
+        symbols = SymbolCache(gdbmi, cache_dir=cache_dir)
+        got_error = False
+        try:
+            symbols.query('-symbol-info-functions')
+        except ValueError:
+            got_error = True
+        assert(got_error is True)
+        symbols.load_executable(executable)
+        assert(not symbols.is_cached('-symbol-info-functions'))
+        payload = symbols.query('-symbol-info-functions')
+        assert(payload['symbols']['debug'][0]['symbols'][0]['name'] == 'main')
+        assert(symbols.query('-symbol-info-functions') is payload)
+        got_error = False
+        try:
+            symbols.query('-stack-list-frames')
+        except ValueError:
+            got_error = True
+        assert(got_error is True)
+        gdbmi.exit()
+
+        # a new session gets the result without asking gdb
+        gdbmi = _replay([('1-file-exec-and-symbols', '1^done'), ('2-file-exec-and-symbols', '2^done')])
+        symbols = SymbolCache(gdbmi, cache_dir=cache_dir)
+        symbols.load_executable(executable)
+        assert(symbols.is_cached('-symbol-info-functions'))
+        assert(symbols.query('-symbol-info-functions') == payload)
+
+        # until the executable changes
+        os.utime(executable, (0, 0))
+        symbols.load_executable(executable)
+        assert(not symbols.is_cached('-symbol-info-functions'))
+        gdbmi.exit()
+
+    def test_backtrace_cache(self):
+        """Test that BacktraceCache fetches the innermost frames of the stack, and takes the frames
+        below them from the previous backtrace only when the deepest fetched frames match it.
+        gdb is replayed from a recording."""
+        from pygdbmi.backtrace import Backtrace, BacktraceCache, BacktraceError
+
+        exchanges = []
+        commands = []
+
+        def fetch(stack, low, high, with_depth=False, depth=None):
+            # gdb's responses to -stack-info-depth, then to -stack-list-frames and -stack-list-arguments for low to high
+            # depth is what -stack-info-depth reports, if not the length of the stack
+            levels = list(enumerate(stack))[low:high + 1]
+            batch = [('-stack-list-frames %d %d' % (low, high), 'stack=[%s]' % ','.join(
+                      'frame={level="%d",addr="0x%x",func="%s",file="app.c",line="%d"}' % (level, addr, func, line)
+                      for level, (addr, func, line, _) in levels)),
+                     ('-stack-list-arguments --simple-values %d %d' % (low, high), 'stack-args=[%s]' % ','.join(
+                      'frame={level="%d",args=[{name="n",type="int",value="%d"}]}' % (level, n)
+                      for level, (_, _, _, n) in levels))]
+            if with_depth:
+                batch.insert(0, ('-stack-info-depth', 'depth="%d"' % (len(stack) if depth is None else depth)))
+            commands.extend(command for command, _ in batch)
+            exchanges.append(('\n'.join('%d%s' % (len(commands) - len(batch) + i + 1, command)
+                                        for i, (command, _) in enumerate(batch)),
+                              '\n(gdb) \n'.join('%d^done,%s' % (len(commands) - len(batch) + i + 1, payload)
+                                                 for i, (_, payload) in enumerate(batch))))
+
+        # (addr, func, line, argument) of each frame, innermost first
+        main = [(0x4008, 'recurse', 10, n) for n in range(10)] + [(0x4100, 'main', 20, 0)]
+        stop1 = [(0x4010, 'inner', 3, 7), (0x4020, 'outer', 5, 3)] + main
+        stop2 = [(0x4014, 'inner', 4, 7), (0x4020, 'outer', 5, 3)] + main
+        stop3 = [(0x4030, 'leaf', 1, 9), (0x4018, 'inner', 4, 7), (0x4020, 'outer', 5, 3)] + main
+        # the same breakpoint, reached through different callers
+        stop4 = [(0x5000, 'leaf', 30, 1), (0x5100, 'caller_a', 40, 0), (0x5110, 'path_a', 41, 0),
+                 (0x5120, 'path_a', 42, 0)] + main
+        stop5 = [(0x5000, 'leaf', 30, 1), (0x5200, 'caller_b', 50, 0), (0x5210, 'path_b', 51, 0),
+                 (0x5220, 'path_b', 52, 0)] + main
+        fetch(stop1, 0, 2, True)
+        fetch(stop1, 3, 12)
+        fetch(stop2, 0, 2, True)
+        fetch(stop3, 0, 2, True)
+        fetch(stop3, 3, 8)
+        fetch(stop4, 0, 2, True)
+        fetch(stop4, 3, 8)
+        fetch(stop5, 0, 2, True)
+        fetch(stop5, 3, 8)
+        # gdb lists fewer frames than -stack-info-depth said there are
+        short_stack = [(0x6000, 'leaf', 60, 0), (0x6010, 'middle', 61, 0), (0x6020, 'middle', 62, 0),
+                       (0x6100, 'main', 70, 0)]
+        fetch(short_stack, 0, 2, True, depth=6)
+        fetch(short_stack, 3, 5)
+        fetch(short_stack, 4, 5)
+        token = len(commands) + 1
+        exchanges.append(('%d-stack-info-depth\n%d-stack-list-frames 0 2\n%d-stack-list-arguments --simple-values 0 2'
+                          % (token, token + 1, token + 2),
+                          '\n(gdb) \n'.join('%d^error,msg="No stack."' % t for t in range(token, token + 3))))
+
+        gdbmi = _replay(exchanges)
+        backtraces = BacktraceCache(gdbmi, window=3)
+        # without a previous backtrace, the rest of the stack is fetched at once
+        backtrace1 = backtraces.get()
+        assert([frame.func for frame in backtrace1][:4] == ['inner', 'outer', 'recurse', 'recurse'])
+        assert(len(backtrace1) == 13 and backtrace1[0].args == (('n', 'int', '7'),))
+        assert(backtrace1[12].line == '20' and backtrace1[12].addr == '0x4100')
+
+        # the frames at levels 1 and 2 are unchanged, so only the first window is fetched
+        backtrace2 = backtraces.get()
+        assert(len(backtrace2) == 13 and backtrace2[0].line == '4')
+        assert(all(backtrace2[level] is backtrace1[level] for level in range(1, 13)))
+
+        # a call shifts the stack down. After the first window, twice as many frames are fetched.
+        backtrace3 = backtraces.get()
+        assert([frame.func for frame in backtrace3][:3] == ['leaf', 'inner', 'outer'])
+        assert(backtrace3[1] is not backtrace2[0])
+        assert(all(backtrace3[level] is backtrace2[level - 1] for level in range(2, 14)))
+        assert(backtrace3 == Backtrace(backtrace3.frames))
+
+        # the same innermost frame at the same depth doesn't mean its callers are the same
+        backtrace4 = backtraces.get()
+        backtrace5 = backtraces.get()
+        assert(backtrace5[0] is backtrace4[0])
+        assert([frame.func for frame in backtrace5][:5] == ['leaf', 'caller_b', 'path_b', 'path_b', 'recurse'])
+
+        # listing stops once gdb lists no more frames
+        backtrace6 = BacktraceCache(gdbmi, window=3).get()
+        assert([frame.func for frame in backtrace6] == ['leaf', 'middle', 'middle', 'main'])
+
+        got_error = False
+        try:
+            backtraces.get()
+        except BacktraceError as e:
+            got_error = str(e) == 'No stack.'
+        assert(got_error is True)
+        gdbmi.exit()
+
+    def test_controller_pool(self):
+        """Test that the pool reuses gdb subprocesses, resets them, and replaces ones that died"""
+        from pygdbmi.gdbcontrollerpool import DEFAULT_RESET_COMMANDS
+        pool = GdbControllerPool(size=2, reset_timeout_sec=5)
+        assert(pool.num_idle() == 2)
+        pool.reset_commands.append('-data-evaluate-expression 0')
+        assert(DEFAULT_RESET_COMMANDS == ['kill inferiors 1', '-break-delete', '-file-exec-and-symbols'])
+
+        published = []
+        with pool.controller() as gdbmi:
+            assert(pool.num_idle() == 1)
+            gdbmi.subscribe(published.append)
+            responses = gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=5, wait_for_result=True)
+            assert(responses[-1]['payload'] == {'value': '2'})
+            gdb_process = gdbmi.gdb_process
+        assert(pool.num_idle() == 2)
+
+        # the most recently checked in controller is reused, without the previous job's subscriptions
+        gdbmi = pool.checkout()
+        assert(gdbmi.gdb_process is gdb_process)
+        del published[:]
+        gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=5, wait_for_result=True)
+        assert(published == [])
+
+        # commands the previous job didn't wait for are abandoned, so they don't collect the output
+        # of the reset commands or of the next job
+        unresolved_future = gdbmi.send('-interpreter-exec console "show version"')
+        pool.checkin(gdbmi)
+        gdbmi = pool.checkout()
+        assert(gdbmi.gdb_process is gdb_process)
+        responses = gdbmi.write('-interpreter-exec console "show version"', timeout_sec=5)
+        assert(responses[0]['type'] == 'console' and responses[-1]['type'] == 'result')
+        assert(unresolved_future.responses == [])
+        assert(gdbmi.reset_session() == 0)
+
+        # a controller whose gdb died is replaced by a new one
+        gdbmi.gdb_process.kill()
+        gdbmi.gdb_process.wait()
+        pool.checkin(gdbmi)
+        assert(pool.num_idle() == 2)
+
+        # so is a controller for which any reset command fails, not just the last one
+        gdbmi = pool.checkout()
+        pool.reset_commands.insert(0, '-bad-reset-command')
+        pool.checkin(gdbmi)
+        pool.reset_commands.pop(0)
+        assert(gdbmi.gdb_process is None)
+        assert(pool.num_idle() == 2)
+        for _ in range(2):
+            pool.checkout().verify_valid_gdb_subprocess()
+
+        pool.close()
+        got_value_error = False
+        try:
+            pool.checkout()
+        except ValueError:
+            got_value_error = True
+        assert(got_value_error is True)
+
     def test_controller_buffer(self):
         """test that a partial response gets successfully buffered
         by the controller, then fully read when more data arrives"""
@@ -120,7 +1117,7 @@ class TestPyGdbMi(unittest.TestCase):
         response = gdbmi._get_responses_list(to_be_buffered, stream, verbose)
         # Nothing should have been parsed yet
         assert(len(response) == 0)
-        assert(gdbmi._incomplete_output[stream] == to_be_buffered)
+        assert(gdbmi._incomplete_output[stream].incomplete() == to_be_buffered)
 
         remaining_gdb_output = b'cols="6"}\n(gdb) \n'
         response = gdbmi._get_responses_list(remaining_gdb_output, stream, verbose)
@@ -132,6 +1129,21 @@ class TestPyGdbMi(unittest.TestCase):
         assert(r['type'] == 'result')
         assert(r['payload'] == {'BreakpointTable': {'nr_cols': '6', 'nr_rows': '1'}})
 
+    def test_line_framer(self):
+        """Test that raw output is split into complete, decoded lines no matter how it is chunked"""
+        framer = _LineFramer()
+        assert(framer.feed(b'^done,value="caf\xc3') == [])
+        assert(framer.incomplete() == b'^done,value="caf\xc3')
+        assert(framer.feed(b'\xa9"\n(gdb) \n~"par') == [u'^done,value="caf\xe9"', u'(gdb) '])
+        assert(framer.incomplete() == b'~"par')
+
+        # a long line that arrives in many small reads
+        long_line = b'~"' + b'x' * 100000 + b'"'
+        for i in range(0, len(long_line), 7):
+            assert(framer.feed(long_line[i:i + 7]) == [])
+        assert(framer.feed(b'\n\n') == [u'~"par' + long_line.decode(), u''])
+        assert(framer.incomplete() is None)
+
     def test_controller_buffer_randomized(self):
         """
         The following code reads a sample gdb mi stream randomly to ensure partial
@@ -162,7 +1174,56 @@ class TestPyGdbMi(unittest.TestCase):
             assert(responses[-1] == {'stream': stream, 'message': u'thread-group-started', 'type': 'notify', 'payload': {u'pid': u'48337', u'id': u'i1'}, 'token': None})
 
             for stream in gdbmi._incomplete_output.keys():
-                assert(gdbmi._incomplete_output[stream] is None)
+                assert(gdbmi._incomplete_output[stream].incomplete() is None)
+
+    def test_session_replay(self):
+        """Test that a recorded session is replayed through the controller without gdb, in the
+        chunks it was recorded in, and that a live session can be recorded and replayed"""
+        from pygdbmi.sessionrecording import read_session_recording
+
+        recording_path = os.path.join(tempfile.mkdtemp(), 'session.jsonl')
+        recorder = SessionRecorder(recording_path, ['gdb', '--interpreter=mi2'])
+        recorder.record('stdout', b'=thread-group-added,id="i1"\n(gdb) \n')
+        recorder.record('stdin', b'-break-insert main\n')
+        recorder.record('stdout', b'^done,bkpt={number="1",type="break')
+        recorder.record('stdout', b'point"}\n(gdb) \n')
+        recorder.record('stdin', b'-gdb-exit\n')
+        recorder.record('stdout', b'^exit\n')
+        recorder.record('stdout', b'')
+        recorder.close()
+        header, events = read_session_recording(recording_path)
+        assert(header['cmd'] == ['gdb', '--interpreter=mi2'])
+        assert([stream for _, stream, _ in events] == ['stdout', 'stdin', 'stdout', 'stdout', 'stdin', 'stdout', 'stdout'])
+
+        gdbmi = ReplayGdbController(recording_path)
+        assert(gdbmi.cmd == ['gdb', '--interpreter=mi2'])
+        responses = gdbmi.get_gdb_response(timeout_sec=1)
+        assert(responses[0]['message'] == 'thread-group-added')
+        # output recorded after a write is only available once the write is made
+        assert(gdbmi.get_gdb_response(timeout_sec=0, raise_error_on_timeout=False) == [])
+        responses = gdbmi.write('-break-insert main')
+        assert(responses == [{'type': 'result', 'message': 'done', 'token': None, 'stream': 'stdout',
+                              'payload': {'bkpt': {'number': '1', 'type': 'breakpoint'}}}])
+        responses = gdbmi.write('-gdb-exit', raise_error_on_timeout=False)
+        assert(responses[-1]['message'] == 'exit')
+        got_no_process_exception = False
+        try:
+            gdbmi.write('-gdb-version')
+        except NoGdbProcessError:
+            got_no_process_exception = True
+        assert(got_no_process_exception is True)
+        gdbmi.exit()
+
+        # record a live session, then replay it
+        commands = ['-data-evaluate-expression 1', '-interpreter-exec console "help"', '-data-evaluate-expression 2']
+        gdbmi = GdbController(record_path=recording_path)
+        recorded_responses = [gdbmi.write(command, timeout_sec=10) for command in commands]
+        gdbmi.exit()
+
+        gdbmi = ReplayGdbController(recording_path)
+        assert([gdbmi.write(command, timeout_sec=10) for command in commands] == recorded_responses)
+        gdbmi.exit()
+        assert(gdbmi.gdb_process is None)
 
 
 def main():
@@ -170,6 +1231,10 @@ def main():
     suite = unittest.TestSuite()
 
     suite.addTests(loader.loadTestsFromTestCase(TestPyGdbMi))
+    if sys.version_info >= (3, 6):
+        # AsyncGdbController and its tests use syntax that older versions of python can't compile
+        from pygdbmi.tests.test_async import TestAsyncGdbController
+        suite.addTests(loader.loadTestsFromTestCase(TestAsyncGdbController))
 
     runner = unittest.TextTestRunner(verbosity=1)
     result = runner.run(suite)
@@ -0,0 +1,74 @@
+"""Tests of AsyncGdbController, which requires Python 3.6+
+
+They are in their own module since older versions of python can't compile them. Run with
+
+    python -m pygdbmi.tests.test_async
+"""
+
+import asyncio
+import unittest
+from pygdbmi.asyncgdbcontroller import AsyncGdbController
+from pygdbmi.gdbcontroller import GdbTimeoutError, NoGdbProcessError
+
+
+class TestAsyncGdbController(unittest.TestCase):
+
+    def test_async_controller(self):
+        """Test that commands written concurrently from an event loop each get their own response"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        gdbmi = AsyncGdbController()
+        loop.run_until_complete(gdbmi.start())
+
+        all_responses = loop.run_until_complete(asyncio.gather(
+            gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=5),
+            gdbmi.write(['-data-evaluate-expression 2+2', '-data-evaluate-expression 3+3'], timeout_sec=5)))
+        assert(all_responses[0][-1]['type'] == 'result')
+        assert(all_responses[0][-1]['payload'] == {'value': '2'})
+        assert(all_responses[1][-1]['payload'] == {'value': '6'})
+        # like GdbController.write, writing no commands doesn't wait for anything
+        assert(loop.run_until_complete(gdbmi.write([])) == [])
+
+        # the responses of a command whose write timed out go to responses(), not to later commands
+        async def write_after_timeout():
+            console_responses = gdbmi.responses(types=('console',))
+            first_console_response = asyncio.ensure_future(console_responses.__anext__())
+            await asyncio.sleep(0)
+            got_timeout_exception = False
+            try:
+                await gdbmi.write('-interpreter-exec console "show version"', timeout_sec=0)
+            except GdbTimeoutError:
+                got_timeout_exception = True
+            assert(got_timeout_exception is True)
+            responses = await gdbmi.write('-data-evaluate-expression 1+1', timeout_sec=5)
+            assert((await asyncio.wait_for(first_console_response, 5))['type'] == 'console')
+            await console_responses.aclose()
+            return responses
+
+        responses = loop.run_until_complete(write_after_timeout())
+        assert([(response['type'], response['payload']) for response in responses] == [('result', {'value': '2'})])
+        assert(len(gdbmi._pending_commands) == 0)
+
+        # commands whose write fails are not left waiting for a result
+        def broken_write(data):
+            raise BrokenPipeError()
+        gdbmi.gdb_process.stdin.write = broken_write
+        with self.assertRaises(BrokenPipeError):
+            loop.run_until_complete(gdbmi.write(['-gdb-version', '-list-features']))
+        assert(len(gdbmi._pending_commands) == 0)
+        del gdbmi.gdb_process.stdin.write
+
+        loop.run_until_complete(gdbmi.exit())
+        assert(gdbmi.gdb_process is None)
+        got_no_process_exception = False
+        try:
+            loop.run_until_complete(gdbmi.write('-gdb-version'))
+        except NoGdbProcessError:
+            got_no_process_exception = True
+        assert(got_no_process_exception is True)
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,294 @@
+"""VarObjectCache class to watch expressions through gdb variable objects, updating only what changed
+
+See https://sourceware.org/gdb/onlinedocs/gdb/GDB_002fMI-Variable-Objects.html
+"""
+
+import time
+from pygdbmi.gdbcontroller import DEFAULT_GDB_TIMEOUT_SEC
+from pygdbmi.micommands import mi_quote, run_command
+
+# Values of -var-update's in_scope field
+_IN_SCOPE = 'true'
+_INVALID = 'invalid'
+
+
+class VarObjectError(ValueError):
+    """Raised when gdb responds to a variable object command with an error, such as
+    for an expression that can't be evaluated"""
+    pass
+
+
+class VarObject(object):
+    """A gdb variable object, as last reported by gdb
+
+    Attributes:
+        name (str): gdb's name of the variable object, such as 'var1' or 'var1.a'
+        expression (str): Expression of a watched variable object, or for a child, the
+        part of its parent it represents (such as 'a' or '3')
+        type (str): Type of the value
+        value (str): The value, as formatted by gdb
+        numchild (int): Number of children. For a dynamic variable object this is the
+        number of children gdb has listed so far.
+        thread_id (str): Thread the variable object is bound to, or None
+        has_more (bool): A dynamic variable object has children that have not been listed yet
+        dynamic (bool): The children are computed by a pretty printer
+        in_scope (bool): False if the variable object's frame is not the current frame
+        parent (VarObject): Variable object this is a child of, or None if it is watched
+    """
+    __slots__ = ('name', 'expression', 'type', 'value', 'numchild', 'thread_id', 'has_more', 'dynamic',
+                 'in_scope', 'parent', '_children')
+
+    def __init__(self, name, expression, parent=None):
+        self.name = name
+        self.expression = expression
+        self.type = None
+        self.value = None
+        self.numchild = 0
+        self.thread_id = None
+        self.has_more = False
+        self.dynamic = False
+        self.in_scope = True
+        self.parent = parent
+        # list of children once they have been listed with -var-list-children
+        self._children = None
+
+    def _update(self, fields):
+        """Set attributes from a -var-create result or a child of -var-list-children"""
+        if 'type' in fields:
+            self.type = fields['type']
+        if 'value' in fields:
+            self.value = fields['value']
+        if 'numchild' in fields:
+            self.numchild = int(fields['numchild'])
+        if 'thread-id' in fields:
+            self.thread_id = str(fields['thread-id'])
+        if 'has_more' in fields:
+            self.has_more = int(fields['has_more']) != 0
+        if 'dynamic' in fields:
+            self.dynamic = int(fields['dynamic']) != 0
+
+    def __repr__(self):
+        return 'VarObject(name=%r, expression=%r, type=%r, value=%r, numchild=%d)' % (
+            self.name, self.expression, self.type, self.value, self.numchild)
+
+
+class VarObjectCache():
+    """
+    Watch expressions through gdb variable objects (varobjs), so that refreshing a view of
+    variables costs as much as what changed rather than the size of the data.
+
+    Each expression is created as a varobj once. Children are listed the first time they
+    are asked for, so only the parts of large structs and arrays that are expanded are
+    ever transferred. After the inferior stops, a single -var-update --all-values reports
+    the varobjs whose values changed, and only those are updated.
+
+        varobjs = VarObjectCache(gdbmi)
+        myvar = varobjs.watch('myvar')
+        fields = varobjs.children(myvar)
+        gdbmi.write('-exec-next')
+        # once gdb has written *stopped
+        for varobj in varobjs.refresh():
+            print(varobj.name, varobj.value)
+
+    Commands are written with GdbController.send, so the cache can be used alongside other
+    commands. It is not thread safe.
+
+    Args:
+        gdbcontroller (GdbController): Controller of the gdb to create variable objects in
+        timeout_sec (float): Maximum time to wait for the result of each command, or of each batch of commands
+    Returns:
+        New VarObjectCache object
+    """
+
+    def __init__(self, gdbcontroller, timeout_sec=DEFAULT_GDB_TIMEOUT_SEC):
+        self.gdbcontroller = gdbcontroller
+        self.timeout_sec = timeout_sec
+        # every known variable object, by name
+        self._varobjs = {}
+        # watched variable objects, by (expression, frame)
+        self._watched = {}
+        # set when the inferior stops, until the next update
+        self._stopped = False
+        self._subscription_id = gdbcontroller.subscribe(self._on_stopped, 'notify', 'stopped')
+
+    def watch(self, expression, frame='*'):
+        """Get the variable object of an expression, creating it the first time
+        Args:
+            expression (str): Expression to evaluate, such as 'myvar' or 'argv[0]'
+            frame (str): Frame to evaluate the expression in: '*' for the frame that is
+            current when the variable object is created, '@' for a floating variable object
+            that is evaluated in whatever frame is current, or the address of a frame.
+            With '*', a variable object is only returned again while the same frame is
+            selected, so watching an expression costs a round trip to identify the frame.
+        Returns:
+            VarObject
+        Raises:
+            VarObjectError if gdb can't create a variable object for the expression
+        """
+        key = (expression, frame)
+        if frame == '*':
+            key += (self._selected_frame(),)
+        varobj = self._watched.get(key)
+        if varobj is not None and not varobj.in_scope:
+            # its frame returned, and the frame now selected is a new one in the same place
+            self.delete(varobj)
+            varobj = None
+        if varobj is None:
+            result = self._run('-var-create - %s %s' % (frame, mi_quote(expression)))
+            varobj = VarObject(result['payload']['name'], expression)
+            varobj._update(result['payload'])
+            self._varobjs[varobj.name] = varobj
+            self._watched[key] = varobj
+        return varobj
+
+    def children(self, varobj):
+        """Get the children of a variable object, listing them with -var-list-children the first time
+        Args:
+            varobj (VarObject): Variable object returned by watch or children
+        Returns:
+            List of VarObject
+        Raises:
+            VarObjectError if gdb can't list the children
+        """
+        if varobj._children is None:
+            if varobj.numchild == 0 and not varobj.has_more:
+                children = []
+            else:
+                payload = self._run('-var-list-children --all-values %s' % varobj.name)['payload']
+                children = []
+                for fields in payload.get('children') or []:
+                    child = VarObject(fields['name'], fields.get('exp'), varobj)
+                    child._update(fields)
+                    self._varobjs[child.name] = child
+                    children.append(child)
+                if 'has_more' in payload:
+                    varobj.has_more = int(payload['has_more']) != 0
+            varobj._children = children
+        return varobj._children
+
+    def get(self, name):
+        """Returns: The VarObject named name if it is in the cache, otherwise None"""
+        return self._varobjs.get(name)
+
+    def refresh(self):
+        """Update variable objects if the inferior has stopped since they were last updated.
+        Output gdb has already written is read first (see GdbController.poll_output), so a *stopped
+        record that arrived after the last read is seen. If the inferior is still running, nothing is
+        updated, and refresh must be called again once it stops.
+
+        Returns:
+            List of VarObjects whose value, type, number of children or scope changed
+        """
+        if not self._stopped:
+            self.gdbcontroller.poll_output()
+        if not self._stopped:
+            return []
+        return self.update()
+
+    def update(self):
+        """Update all variable objects with -var-update, whether or not the inferior has stopped.
+        Only the variable objects in gdb's changelist are touched. Those that gdb reports as
+        invalid are deleted. The cached children of those whose type or number of children
+        changed are forgotten, to be listed again when they are asked for.
+
+        Returns:
+            List of VarObjects whose value, type, number of children or scope changed
+        """
+        self._stopped = False
+        if not self._varobjs:
+            return []
+        payload = self._run('-var-update --all-values *')['payload']
+
+        changed = []
+        for change in payload.get('changelist') or []:
+            varobj = self._varobjs.get(change.get('name'))
+            if varobj is None:
+                # a child that was forgotten, or created by someone else
+                continue
+            in_scope = change.get('in_scope', _IN_SCOPE)
+            if in_scope == _INVALID:
+                self.delete(varobj)
+                continue
+
+            varobj.in_scope = in_scope == _IN_SCOPE
+            if 'value' in change:
+                varobj.value = change['value']
+            if change.get('type_changed') == 'true':
+                varobj.type = change.get('new_type')
+                self._forget_children(varobj)
+            if 'new_num_children' in change:
+                varobj.numchild = int(change['new_num_children'])
+                self._forget_children(varobj)
+            if 'has_more' in change:
+                varobj.has_more = int(change['has_more']) != 0
+            if 'dynamic' in change:
+                varobj.dynamic = int(change['dynamic']) != 0
+            changed.append(varobj)
+        return changed
+
+    def delete(self, varobj):
+        """Delete a variable object, and its children, in gdb and in the cache
+        Args:
+            varobj (VarObject): Variable object returned by watch or children
+        Returns: None
+        """
+        self._run('-var-delete %s' % varobj.name)
+        self._forget_children(varobj)
+        self._varobjs.pop(varobj.name, None)
+        if varobj.parent is not None:
+            # the parent's children must be listed again
+            self._forget_children(varobj.parent)
+        for key, watched in list(self._watched.items()):
+            if watched is varobj:
+                del self._watched[key]
+
+    def clear(self):
+        """Delete all watched variable objects
+        Returns: None"""
+        for varobj in list(self._watched.values()):
+            self.delete(varobj)
+
+    def close(self):
+        """Delete all variable objects and stop listening for the inferior stopping
+        Returns: None"""
+        self.gdbcontroller.unsubscribe(self._subscription_id)
+        if self.gdbcontroller.gdb_process is not None:
+            self.clear()
+        self._varobjs.clear()
+        self._watched.clear()
+
+    def __len__(self):
+        return len(self._varobjs)
+
+    def _forget_children(self, varobj):
+        """Remove the cached children of a variable object, and theirs, from the cache"""
+        if varobj._children:
+            for child in varobj._children:
+                self._forget_children(child)
+                self._varobjs.pop(child.name, None)
+        varobj._children = None
+
+    def _selected_frame(self):
+        """Identify the selected frame by its thread, distance from the outermost frame, function
+        and source file, which unlike its pc don't change while stepping in it
+        Returns: tuple, or None if there is no frame"""
+        futures = self.gdbcontroller.send_batch(['-thread-list-ids', '-stack-info-depth', '-stack-info-frame'])
+        timeout_time_sec = time.time() + self.timeout_sec
+        try:
+            threads, depth, frame = [future.result(timeout_sec=max(0, timeout_time_sec - time.time()))
+                                     for future in futures]
+        except BaseException:
+            # the rest of the batch won't be waited for, so its output must not go to later commands
+            self.gdbcontroller.abandon_commands(futures)
+            raise
+        if depth['message'] == 'error' or frame['message'] == 'error':
+            return None
+        frame = frame['payload']['frame']
+        return ((threads['payload'] or {}).get('current-thread-id'), int(depth['payload']['depth']) - int(frame['level']),
+                frame.get('func'), frame.get('fullname') or frame.get('file'))
+
+    def _run(self, command):
+        return run_command(self.gdbcontroller, command, self.timeout_sec, VarObjectError)
+
+    def _on_stopped(self, response):
+        self._stopped = True
@@ -1,7 +1,8 @@
 import sys
 import re
+import platform
 from codecs import open
-from setuptools import find_packages, setup, Command
+from setuptools import find_packages, setup, Command, Extension
 from pygdbmi.tests import test_app
 
 EXCLUDE_FROM_PACKAGES = []
@@ -13,6 +14,14 @@ with open('pygdbmi/__init__.py', 'r') as fd:
                         fd.read(), re.MULTILINE).group(1)
 
 
+# Optional C implementation of the parser. gdbmiparser falls back to pure
+# Python when it isn't built, such as on Python 2, PyPy, or without a C compiler.
+if platform.python_implementation() == 'CPython' and sys.version_info >= (3, 3):
+    ext_modules = [Extension('pygdbmi._gdbmiparser', ['pygdbmi/_gdbmiparser.c'], optional=True)]
+else:
+    ext_modules = []
+
+
 class TestCommand (Command):
     description = 'test task'
     user_options = []
@@ -41,6 +50,7 @@ setup(
     url='https://github.com/cs01/pygdbmi',
     license='MIT',
     packages=find_packages(exclude=EXCLUDE_FROM_PACKAGES),
+    ext_modules=ext_modules,
     include_package_data=True,
     keywords=['gdb', 'python', 'machine-interface', 'parse', 'frontend'],
     scripts=[],